@@ -4,8 +4,8 @@ AI客户端模块 - 统一多模型AI调用接口
 """
 
 from .client import AIClient
-from .models import AIModel, AIResponse
+from .models import AIModel, AIResponse, AIStreamDelta
 from .config import AIConfig, AIProvider
 
 __version__ = "1.0.0"
-__all__ = ["AIClient", "AIModel", "AIResponse", "AIConfig", "AIProvider"] 
\ No newline at end of file
+__all__ = ["AIClient", "AIModel", "AIResponse", "AIStreamDelta", "AIConfig", "AIProvider"] 
\ No newline at end of file
@@ -3,31 +3,192 @@ AI适配器基类
 """
 
 import json
+import hashlib
+import dataclasses
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator
 import asyncio
 import logging
 
-from ..models import AIRequest, AIResponse, AIMessage, MessageRole
+from ..models import AIRequest, AIResponse, AIMessage, MessageRole, AIStreamDelta
 from ..config import ModelConfig
+from ..context_builder import ContextBuilder, TokenCounter
 
 
 logger = logging.getLogger(__name__)
 
+# 客服系统提示词（静态内容，不拼接客户消息，保证请求前缀稳定以命中提供商的前缀缓存）
+CUSTOMER_SERVICE_PROMPT = """你是一个名医堂的客服代表，请根据客户的消息生成合适的回复。
+
+重要要求：
+仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯、相关的回复
+
+
+你可以调用以下数据库查询功能来为客户提供准确的信息：
+- query_therapist_availability: 查询技师可用时间
+- query_availability_batch: 批量查询多个技师/多个日期的可用时间
+- search_therapists: 搜索技师信息  
+- query_technician_schedule: 查询技师排班
+- create_appointment: 创建预约（需要客户提供姓名和电话）
+- get_user_appointments: 查看用户预约列表
+- cancel_appointment: 取消预约
+- get_appointment_details: 查询预约详情
+- get_stores: 获取门店信息
+
+工作原则：
+1. 当客户询问预约时间、技师信息、排班等问题时，主动调用相应的数据库查询功能获取最新信息
+2. 基于查询结果为客户提供准确、具体的回答
+3. 如果需要创建预约，确保收集到客户姓名、电话、期望时间等必要信息
+4. 仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯的回复
+注意：请不要出现 联系方式 这个词，一律用电话代替，只要涉及电话和联系方式，请只简短地说:方便给一个姓名和电话吗,预约会用短信的形式通知您
+7.已知信息
+【基础信息】
+营业时间：9:00–21:00（全年无休，仅春节放假）
+地址导航：优先大众点评搜索，或人工指引
+停车服务：免费停车/收费（XX元/小时）/周边收费停车区推荐
+医保支付：不支持医保
+店内餐饮：仅提供养生茶和小食糖果（无正餐）
+
+【预约规则】
+预约需提供：请只简短地说:方便给一个姓名和电话吗,预约会用短信的形式通知您
+指定技师：可约/需等待/推荐同级替补
+双人间：有空房直接约，满员则改期
+女技师：可预约，若无则推荐男技师
+迟到处理：短时宽容/影响后续则改期
+退款流程：平台直接退款或改约
+
+【服务项目】
+推荐套餐：小调理（颈肩腰腿痛专项）
+团购建议：到店评估后购买
+生理期服务：量少时可艾灸，需预约
+技师资质：持推拿证，8年以上经验
+
+【其他咨询】
+招聘信息：停招/招聘中
+节假日：全年营业（仅春节放假）
+
+请直接回复客户的问题，不要添加额外的解释或前缀。
+
+"""
+
+CUSTOMER_SERVICE_PROMPT_WITH_HISTORY = """你是名医堂的智能客服助理，具备查询实时数据库信息的能力。
+
+你可以调用以下数据库查询功能来为客户提供准确的信息：
+- query_therapist_availability: 查询技师可用时间
+- query_availability_batch: 批量查询多个技师/多个日期的可用时间
+- search_therapists: 搜索技师信息  
+- query_technician_schedule: 查询技师排班
+- create_appointment: 创建预约（需要客户提供姓名和电话）
+- get_user_appointments: 查看用户预约列表
+- cancel_appointment: 取消预约
+- get_appointment_details: 查询预约详情
+- get_stores: 获取门店信息
+- send_appointment_emails: 发送预约邮件通知（客户确认+技师通知）
+
+【预约流程优化】：
+1. 当客户表达预约意向时，收集必要信息：客户姓名、预约技师、预约时间、门店信息
+2. 收集完整信息后，向客户确认：「您的预约信息：姓名[X]，技师[X]，时间[X]，门店[X]。确认预约吗？」
+3. 客户确认后，立即执行：先调用create_appointment创建预约，成功后立即调用send_appointment_emails发送邮件
+4. 避免重复确认，一次确认即完成所有操作
+
+工作原则：
+1. 回复要简洁明了，避免冗长的解释
+2. 当客户询问预约时间、技师信息、排班等问题时，主动调用相应的数据库查询功能获取最新信息
+3. 基于查询结果为客户提供准确、具体的回答
+4. 预约流程：收集信息→一次确认→立即创建预约+发送邮件
+5. 仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯的回复
+6. 请不要出现"联系方式"这个词，一律用电话代替，只要涉及电话，请简短地说：方便给一个姓名和电话吗，预约会用短信的形式通知您
+
+【基础信息】
+营业时间：9:00–21:00（全年无休，仅春节放假）
+地址导航：优先大众点评搜索，或人工指引
+停车服务：免费停车/收费（XX元/小时）/周边收费停车区推荐
+医保支付：不支持医保
+店内餐饮：仅提供养生茶和小食糖果（无正餐）
+
+【预约规则】
+预约需提供：方便给一个姓名和电话吗，预约会用短信的形式通知您
+指定技师：可约/需等待/推荐同级替补
+双人间：有空房直接约，满员则改期
+女技师：可预约，若无则推荐男技师
+迟到处理：短时宽容/影响后续则改期
+退款流程：平台直接退款或改约
+
+【服务项目】
+推荐套餐：小调理（颈肩腰腿痛专项）
+团购建议：到店评估后购买
+生理期服务：量少时可艾灸，需预约
+技师资质：持推拿证，8年以上经验
+
+【其他咨询】
+招聘信息：停招/招聘中
+节假日：全年营业（仅春节放假）
+
+请根据客户消息和对话历史，使用数据库查询功能提供准确回复。回复要简洁明了。"""
+
+# 对话滚动摘要提示词
+CONVERSATION_SUMMARY_PROMPT = """你是名医堂客服对话的记录员。请把已有摘要和新增对话合并成一份新的摘要。
+
+要求：
+1. 保留客户的姓名、电话、偏好的技师/门店/项目、身体状况、预约时间与预约状态等关键信息
+2. 记录尚未解决的问题和客服已经给出的承诺
+3. 删除寒暄和重复内容，不要编造对话中没有的信息
+4. 只输出摘要正文，不超过200字"""
+
+# 客服提示词版本，由提示词内容生成，提示词修改后回复缓存自动失效
+PROMPT_VERSION = "cs-" + hashlib.sha1(
+    (CUSTOMER_SERVICE_PROMPT + CUSTOMER_SERVICE_PROMPT_WITH_HISTORY).encode("utf-8")
+).hexdigest()[:12]
+
 
 class BaseAdapter(ABC):
     """AI适配器基类"""
     
+    # 流式请求是否附带 stream_options.include_usage
+    stream_include_usage = True
+    
     def __init__(self, config: ModelConfig):
         self.config = config
         self.logger = logger.getChild(self.__class__.__name__)
         self.supports_function_calling = False
+        self._customer_service_tools: Optional[List[Dict[str, Any]]] = None
+        self._context_builder: Optional[ContextBuilder] = None
+        # 预约API服务，由AIClient注入以在适配器间共享查询缓存
+        self.database_service = None
+        
+        # 长连接会话（懒加载，绑定到创建时的事件循环）
+        self._session = None
+        self._session_loop = None
+        self._pool_stats = {
+            "connections_created": 0,
+            "connections_reused": 0,
+            "in_use": 0,
+            "requests": 0
+        }
     
     @abstractmethod
     async def chat_completion(self, request: AIRequest) -> AIResponse:
         """执行聊天补全请求"""
         pass
     
+    async def chat_completion_stream(self, request: AIRequest) -> AsyncIterator[AIStreamDelta]:
+        """执行流式聊天补全请求，逐个产出增量片段（OpenAI兼容SSE格式）"""
+        url = f"{self.config.base_url.rstrip('/')}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.config.api_key}",
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream"
+        }
+        
+        data = self._prepare_request(dataclasses.replace(request, stream=True))
+        data["model"] = self.config.model_name
+        if self.stream_include_usage:
+            data["stream_options"] = {"include_usage": True}
+        
+        self.logger.info(f"发送流式请求: {self.config.model_name}")
+        async for chunk in self._make_stream_request(url, headers, data, max_retries=request.max_retries):
+            yield self._parse_stream_chunk(chunk)
+    
     @abstractmethod
     def _prepare_request(self, request: AIRequest) -> dict:
         """准备API请求数据"""
@@ -87,6 +248,37 @@ class BaseAdapter(ABC):
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "query_availability_batch",
+                    "description": "一次查询多个技师在多个日期的可用时间，如\"某门店明天晚上哪些技师有空\"，无需逐个调用query_therapist_availability",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "dates": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                                "description": "查询日期列表，格式: YYYY-MM-DD"
+                            },
+                            "therapist_ids": {
+                                "type": "array",
+                                "items": {"type": "integer"},
+                                "description": "技师ID列表（可选）"
+                            },
+                            "therapist_name": {
+                                "type": "string",
+                                "description": "技师名称（可选）"
+                            },
+                            "store_name": {
+                                "type": "string",
+                                "description": "门店名称（可选，查询该门店全部技师）"
+                            }
+                        },
+                        "required": ["dates"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -226,6 +418,14 @@ class BaseAdapter(ABC):
             }
         ]
     
+    def get_customer_service_tools(self) -> Optional[List[Dict[str, Any]]]:
+        """客服回复使用的工具列表，每个适配器只构建一次（各请求共享，不要修改）"""
+        if not self.supports_function_calling:
+            return None
+        if self._customer_service_tools is None:
+            self._customer_service_tools = self.get_database_tools() + self.get_email_notification_tools()
+        return self._customer_service_tools
+    
     def get_email_notification_tools(self) -> List[Dict[str, Any]]:
         """获取邮件通知工具配置"""
         return [
@@ -272,180 +472,256 @@ class BaseAdapter(ABC):
             }
         ]
     
-    async def _make_request(self, url: str, headers: dict, data: dict) -> dict:
-        """发送HTTP请求"""
+    def _create_trace_config(self):
+        """创建用于统计连接池使用情况的TraceConfig"""
+        import aiohttp
+        
+        async def on_connection_create_end(session, context, params):
+            self._pool_stats["connections_created"] += 1
+        
+        async def on_connection_reuseconn(session, context, params):
+            self._pool_stats["connections_reused"] += 1
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+    
+    async def _get_session(self):
+        """获取（必要时创建）带连接池的共享会话"""
         import aiohttp
         
-        timeout = aiohttp.ClientTimeout(total=self.config.timeout)
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is loop:
+            return self._session
         
-        for attempt in range(self.config.max_retries):
+        if self._session is not None and not self._session.closed:
+            # 事件循环已变更，旧会话无法复用
+            if self._session_loop is not None and not self._session_loop.is_closed():
+                self.logger.warning("事件循环已变更，丢弃旧的连接池会话")
+            self._session = None
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.config.pool_limit,
+            limit_per_host=self.config.pool_limit_per_host,
+            ttl_dns_cache=self.config.dns_cache_ttl,
+            keepalive_timeout=self.config.keepalive_timeout
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.config.timeout),
+            trace_configs=[self._create_trace_config()]
+        )
+        self._session_loop = loop
+        self.logger.info(
+            f"创建连接池会话: limit={self.config.pool_limit}, "
+            f"limit_per_host={self.config.pool_limit_per_host}"
+        )
+        return self._session
+    
+    async def close(self):
+        """关闭连接池会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            self.logger.info("连接池会话已关闭")
+        self._session = None
+        self._session_loop = None
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池统计信息"""
+        stats = dict(self._pool_stats)
+        stats["session_open"] = self._session is not None and not self._session.closed
+        return stats
+    
+    def _attempts(self, max_retries: Optional[int]) -> int:
+        """请求总尝试次数：未指定时使用配置值，显式传入0或1都只请求一次"""
+        if max_retries is None:
+            max_retries = self.config.max_retries
+        return max(1, max_retries)
+    
+    async def _make_request(self, url: str, headers: dict, data: dict,
+                            max_retries: Optional[int] = None) -> dict:
+        """发送HTTP请求（复用连接池会话）"""
+        max_retries = self._attempts(max_retries)
+        for attempt in range(max_retries):
             try:
-                async with aiohttp.ClientSession(timeout=timeout) as session:
+                session = await self._get_session()
+                self._pool_stats["requests"] += 1
+                self._pool_stats["in_use"] += 1
+                try:
                     async with session.post(url, headers=headers, json=data) as response:
                         if response.status == 200:
                             return await response.json()
                         else:
                             error_text = await response.text()
                             self.logger.error(f"HTTP错误 {response.status}: {error_text}")
-                            if attempt == self.config.max_retries - 1:
+                            if attempt == max_retries - 1:
                                 raise Exception(f"HTTP错误 {response.status}: {error_text}")
+                finally:
+                    self._pool_stats["in_use"] -= 1
+            except Exception as e:
+                self.logger.warning(f"请求失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if attempt == max_retries - 1:
+                    raise
+                await asyncio.sleep(2 ** attempt)  # 指数退避
+    
+    async def _make_stream_request(self, url: str, headers: dict, data: dict,
+                                   max_retries: Optional[int] = None) -> AsyncIterator[dict]:
+        """发送流式HTTP请求并解析SSE数据块
+        
+        仅在收到第一个数据块之前重试，已开始输出后出错直接抛出。
+        """
+        import aiohttp
+        
+        # 流式响应总时长不设上限，只限制单次读取间隔
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.config.timeout)
+        max_retries = self._attempts(max_retries)
+        
+        for attempt in range(max_retries):
+            received = False
+            try:
+                session = await self._get_session()
+                self._pool_stats["requests"] += 1
+                self._pool_stats["in_use"] += 1
+                try:
+                    async with session.post(url, headers=headers, json=data, timeout=timeout) as response:
+                        if response.status != 200:
+                            error_text = await response.text()
+                            self.logger.error(f"HTTP错误 {response.status}: {error_text}")
+                            raise Exception(f"HTTP错误 {response.status}: {error_text}")
+                        
+                        async for raw_line in response.content:
+                            line = raw_line.decode("utf-8").strip()
+                            if not line or line.startswith(":") or not line.startswith("data:"):
+                                continue
+                            payload = line[len("data:"):].strip()
+                            if payload == "[DONE]":
+                                return
+                            received = True
+                            yield json.loads(payload)
+                        return
+                finally:
+                    self._pool_stats["in_use"] -= 1
             except Exception as e:
-                self.logger.warning(f"请求失败 (尝试 {attempt + 1}/{self.config.max_retries}): {e}")
-                if attempt == self.config.max_retries - 1:
+                self.logger.warning(f"流式请求失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if received or attempt == max_retries - 1:
                     raise
                 await asyncio.sleep(2 ** attempt)  # 指数退避
     
+    def _parse_stream_chunk(self, chunk: dict) -> AIStreamDelta:
+        """解析单个SSE数据块"""
+        choices = chunk.get("choices") or []
+        choice = choices[0] if choices else {}
+        delta = choice.get("delta") or {}
+        
+        return AIStreamDelta(
+            content=delta.get("content") or "",
+            tool_calls=delta.get("tool_calls"),
+            finish_reason=choice.get("finish_reason"),
+            model=chunk.get("model"),
+            provider=self.config.provider.value,
+            usage=chunk.get("usage")
+        )
+    
+    def get_database_service(self):
+        """获取预约API服务（未注入时懒加载一个）"""
+        if self.database_service is None:
+            from ..database_service import DatabaseAPIService
+            self.database_service = DatabaseAPIService()
+        return self.database_service
+    
+    def get_context_builder(self) -> ContextBuilder:
+        """按模型token上限构建上下文的构建器（懒加载，分词器只加载一次）"""
+        if self._context_builder is None:
+            self._context_builder = ContextBuilder(
+                TokenCounter(self.config.model_name),
+                token_limit=self.config.context_token_limit,
+                reply_reserve=self.config.max_tokens
+            )
+        return self._context_builder
+    
     def create_customer_service_prompt(self, customer_message: str) -> AIRequest:
         """创建客服回复的提示词"""
-        system_prompt = """你是一个名医堂的客服代表，请根据客户的消息生成合适的回复。
-
-客户消息：{customer_message}
-
-重要要求：
-仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯、相关的回复
-
-
-你可以调用以下数据库查询功能来为客户提供准确的信息：
-- query_therapist_availability: 查询技师可用时间
-- search_therapists: 搜索技师信息  
-- query_technician_schedule: 查询技师排班
-- create_appointment: 创建预约（需要客户提供姓名和电话）
-- get_user_appointments: 查看用户预约列表
-- cancel_appointment: 取消预约
-- get_appointment_details: 查询预约详情
-- get_stores: 获取门店信息
-
-工作原则：
-1. 当客户询问预约时间、技师信息、排班等问题时，主动调用相应的数据库查询功能获取最新信息
-2. 基于查询结果为客户提供准确、具体的回答
-3. 如果需要创建预约，确保收集到客户姓名、电话、期望时间等必要信息
-4. 仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯的回复
-注意：请不要出现 联系方式 这个词，一律用电话代替，只要涉及电话和联系方式，请只简短地说:方便给一个姓名和电话吗,预约会用短信的形式通知您
-7.已知信息
-【基础信息】
-营业时间：9:00–21:00（全年无休，仅春节放假）
-地址导航：优先大众点评搜索，或人工指引
-停车服务：免费停车/收费（XX元/小时）/周边收费停车区推荐
-医保支付：不支持医保
-店内餐饮：仅提供养生茶和小食糖果（无正餐）
-
-【预约规则】
-预约需提供：请只简短地说:方便给一个姓名和电话吗,预约会用短信的形式通知您
-指定技师：可约/需等待/推荐同级替补
-双人间：有空房直接约，满员则改期
-女技师：可预约，若无则推荐男技师
-迟到处理：短时宽容/影响后续则改期
-退款流程：平台直接退款或改约
-
-【服务项目】
-推荐套餐：小调理（颈肩腰腿痛专项）
-团购建议：到店评估后购买
-生理期服务：量少时可艾灸，需预约
-技师资质：持推拿证，8年以上经验
-
-【其他咨询】
-招聘信息：停招/招聘中
-节假日：全年营业（仅春节放假）
-
-请直接回复客户的问题，不要添加额外的解释或前缀。
-
-"""
-        
         messages = [
-            AIMessage(role=MessageRole.SYSTEM, content=system_prompt.format(customer_message=customer_message)),
+            AIMessage(role=MessageRole.SYSTEM, content=CUSTOMER_SERVICE_PROMPT),
             AIMessage(role=MessageRole.USER, content=customer_message)
         ]
+        _, decision = self.get_context_builder().select_history([], messages)
         
         return AIRequest(
             messages=messages,
             max_tokens=self.config.max_tokens,
-            temperature=self.config.temperature
+            temperature=self.config.temperature,
+            estimated_prompt_tokens=decision.estimated_prompt_tokens
         )
     
     def create_customer_service_prompt_with_history(self, customer_message: str, 
-                                                   conversation_history: list = None) -> AIRequest:
-        """创建带有对话历史的客服回复提示词"""
+                                                   conversation_history: list = None,
+                                                   conversation_summary: Optional[str] = None) -> AIRequest:
+        """创建带有对话历史的客服回复提示词
+        
+        conversation_summary为更早对话的滚动摘要，放在系统提示词之后、近期历史之前
+        """
         
         # 如果没有历史记录，回退到普通方法
-        if not conversation_history:
+        if not conversation_history and not conversation_summary:
             return self.create_customer_service_prompt(customer_message)
         
-        system_prompt = """你是名医堂的智能客服助理，具备查询实时数据库信息的能力。
-
-你可以调用以下数据库查询功能来为客户提供准确的信息：
-- query_therapist_availability: 查询技师可用时间
-- search_therapists: 搜索技师信息  
-- query_technician_schedule: 查询技师排班
-- create_appointment: 创建预约（需要客户提供姓名和电话）
-- get_user_appointments: 查看用户预约列表
-- cancel_appointment: 取消预约
-- get_appointment_details: 查询预约详情
-- get_stores: 获取门店信息
-- send_appointment_emails: 发送预约邮件通知（客户确认+技师通知）
-
-【预约流程优化】：
-1. 当客户表达预约意向时，收集必要信息：客户姓名、预约技师、预约时间、门店信息
-2. 收集完整信息后，向客户确认：「您的预约信息：姓名[X]，技师[X]，时间[X]，门店[X]。确认预约吗？」
-3. 客户确认后，立即执行：先调用create_appointment创建预约，成功后立即调用send_appointment_emails发送邮件
-4. 避免重复确认，一次确认即完成所有操作
-
-工作原则：
-1. 回复要简洁明了，避免冗长的解释
-2. 当客户询问预约时间、技师信息、排班等问题时，主动调用相应的数据库查询功能获取最新信息
-3. 基于查询结果为客户提供准确、具体的回答
-4. 预约流程：收集信息→一次确认→立即创建预约+发送邮件
-5. 仔细阅读对话历史，了解客户之前的问题和需求，基于历史对话的上下文，给出连贯的回复
-6. 请不要出现"联系方式"这个词，一律用电话代替，只要涉及电话，请简短地说：方便给一个姓名和电话吗，预约会用短信的形式通知您
-
-【基础信息】
-营业时间：9:00–21:00（全年无休，仅春节放假）
-地址导航：优先大众点评搜索，或人工指引
-停车服务：免费停车/收费（XX元/小时）/周边收费停车区推荐
-医保支付：不支持医保
-店内餐饮：仅提供养生茶和小食糖果（无正餐）
-
-【预约规则】
-预约需提供：方便给一个姓名和电话吗，预约会用短信的形式通知您
-指定技师：可约/需等待/推荐同级替补
-双人间：有空房直接约，满员则改期
-女技师：可预约，若无则推荐男技师
-迟到处理：短时宽容/影响后续则改期
-退款流程：平台直接退款或改约
-
-【服务项目】
-推荐套餐：小调理（颈肩腰腿痛专项）
-团购建议：到店评估后购买
-生理期服务：量少时可艾灸，需预约
-技师资质：持推拿证，8年以上经验
-
-【其他咨询】
-招聘信息：停招/招聘中
-节假日：全年营业（仅春节放假）
-
-请根据客户消息和对话历史，使用数据库查询功能提供准确回复。回复要简洁明了。"""
-
-        messages = [AIMessage(role=MessageRole.SYSTEM, content=system_prompt)]
+        system_messages = [AIMessage(role=MessageRole.SYSTEM, content=CUSTOMER_SERVICE_PROMPT_WITH_HISTORY)]
+        if conversation_summary:
+            system_messages.append(AIMessage(
+                role=MessageRole.SYSTEM, content=f"【此前对话摘要】\n{conversation_summary}"
+            ))
+        current_message = AIMessage(role=MessageRole.USER, content=customer_message)
+        
+        # 如果适配器支持function call，添加工具
+        tools = self.get_customer_service_tools()
         
-        # 添加对话历史 - 增加到30条历史记录以提供更好的上下文
-        for memory_item in conversation_history[-30:]:  # 使用最近30条历史记录
+        history = []
+        for memory_item in conversation_history or []:
             role = MessageRole.USER if memory_item.get("role") == "user" else MessageRole.ASSISTANT
             content = memory_item.get("content", "")
             if content.strip():
-                messages.append(AIMessage(role=role, content=content))
+                history.append(AIMessage(role=role, content=content))
         
-        # 添加当前客户消息
-        messages.append(AIMessage(role=MessageRole.USER, content=customer_message))
+        # 为工具和回复预留空间后，在token预算内保留最近的对话历史
+        history, decision = self.get_context_builder().select_history(
+            history, system_messages + [current_message], tools
+        )
+        self.logger.info(f"[上下文] {decision.describe()}")
         
-        # 如果适配器支持function calling，添加工具
-        tools = None
-        if self.supports_function_calling:
-            tools = self.get_database_tools() + self.get_email_notification_tools()
+        # 静态前缀（系统提示词 + 工具）在前，对话历史按时间顺序在后，便于提供商前缀缓存命中
+        messages = system_messages + history + [current_message]
         
         return AIRequest(
             messages=messages,
             max_tokens=self.config.max_tokens,
             temperature=0.7,  # 稍微提高创造性，让回复更自然
-            tools=tools  # 添加数据库查询工具
+            tools=tools,  # 添加数据库查询工具
+            estimated_prompt_tokens=decision.estimated_prompt_tokens
+        )
+    
+    def create_summary_prompt(self, previous_summary: Optional[str],
+                              new_turns: List[Dict[str, Any]]) -> AIRequest:
+        """创建滚动摘要请求：已有摘要 + 新增对话 -> 新摘要"""
+        lines = []
+        for turn in new_turns:
+            content = str(turn.get("content", "")).strip()
+            if content:
+                speaker = "客户" if turn.get("role") == "user" else "客服"
+                lines.append(f"{speaker}：{content}")
+        
+        user_content = (
+            f"已有摘要：\n{previous_summary or '（无）'}\n\n"
+            f"新增对话：\n" + "\n".join(lines)
+        )
+        return AIRequest(
+            messages=[
+                AIMessage(role=MessageRole.SYSTEM, content=CONVERSATION_SUMMARY_PROMPT),
+                AIMessage(role=MessageRole.USER, content=user_content)
+            ],
+            max_tokens=min(self.config.max_tokens, 400),
+            temperature=0.3
         )
     
     async def process_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
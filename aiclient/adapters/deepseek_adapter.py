@@ -20,7 +20,7 @@ class DeepSeekAdapter(BaseAdapter):
         data = self._prepare_request(request)
         
         self.logger.info(f"发送Deepseek请求: {self.config.model_name}")
-        response_data = await self._make_request(url, headers, data)
+        response_data = await self._make_request(url, headers, data, max_retries=request.max_retries)
         
         return self._parse_response(response_data)
     
@@ -33,7 +33,7 @@ class OpenAIAdapter(BaseAdapter):
         data["model"] = self.config.model_name
         
         self.logger.info(f"发送OpenAI请求: {self.config.model_name}")
-        response_data = await self._make_request(url, headers, data)
+        response_data = await self._make_request(url, headers, data, max_retries=request.max_retries)
         
         return self._parse_response(response_data)
     
@@ -82,10 +82,8 @@ class OpenAIAdapter(BaseAdapter):
         Returns:
             函数执行结果
         """
-        from ..database_service import DatabaseAPIService
-        
-        # 初始化数据库服务
-        db_service = DatabaseAPIService()
+        # 共享的数据库服务（带查询缓存）
+        db_service = self.get_database_service()
         
         try:
             # 新API函数调用
@@ -103,6 +101,11 @@ class OpenAIAdapter(BaseAdapter):
                     username, customer_name, customer_phone, therapist_id,
                     appointment_date, appointment_time, service_type, notes
                 )
+                # 从技师索引补充技师姓名和门店，便于模型向客户复述预约信息
+                therapist = await db_service.get_therapist(therapist_id) if result.get("success") else None
+                if therapist:
+                    result["therapist_name"] = therapist.get("name")
+                    result["store_name"] = therapist.get("store_name")
                 return result
             
             elif function_name == "get_user_appointments":
@@ -124,12 +127,27 @@ class OpenAIAdapter(BaseAdapter):
                 therapist_id = function_args.get("therapist_id")
                 date = function_args.get("date")
                 results = await db_service.query_therapist_availability(therapist_id, date)
+                therapist = await db_service.get_therapist(therapist_id)
+                therapist_label = f"{therapist.get('name')} " if therapist else ""
                 return {
                     "success": True,
                     "data": results,
-                    "message": f"查询到 {len(results)} 个可用时间段"
+                    "message": f"查询到{therapist_label}{len(results)} 个可用时间段"
                 }
             
+            elif function_name == "query_availability_batch":
+                result = await db_service.query_availability_batch(
+                    dates=function_args.get("dates") or [],
+                    therapist_ids=function_args.get("therapist_ids"),
+                    therapist_name=function_args.get("therapist_name"),
+                    store_name=function_args.get("store_name")
+                )
+                if result.get("success"):
+                    result["message"] = (
+                        f"查询了 {len(result['results'])} 个技师日期组合，其中 {result['available_count']} 个有可用时间"
+                    )
+                return result
+            
             elif function_name == "search_therapists":
                 therapist_name = function_args.get("therapist_name")
                 store_name = function_args.get("store_name")
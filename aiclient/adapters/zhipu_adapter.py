@@ -9,6 +9,9 @@ from ..models import AIRequest, AIResponse
 class ZhipuAdapter(BaseAdapter):
     """智谱AI适配器"""
     
+    # 智谱AI在最后一个数据块中自带usage，不支持stream_options
+    stream_include_usage = False
+    
     async def chat_completion(self, request: AIRequest) -> AIResponse:
         """执行智谱AI聊天补全请求"""
         url = f"{self.config.base_url.rstrip('/')}/chat/completions"
@@ -20,7 +23,7 @@ class ZhipuAdapter(BaseAdapter):
         data = self._prepare_request(request)
         
         self.logger.info(f"发送智谱AI请求: {self.config.model_name}")
-        response_data = await self._make_request(url, headers, data)
+        response_data = await self._make_request(url, headers, data, max_retries=request.max_retries)
         
         return self._parse_response(response_data)
     
@@ -0,0 +1,192 @@
+"""
+预约API响应缓存模块
+按端点分组设置TTL，LRU限制条目数；过期不久的条目先返回旧值，同时在后台刷新（stale-while-revalidate）
+"""
+
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+@dataclass
+class CachePolicy:
+    """单个命名空间的缓存策略（秒）"""
+    ttl: float
+    stale_ttl: float = 0.0  # 过期后仍可返回旧值并后台刷新的时长
+
+
+@dataclass
+class _CacheEntry:
+    namespace: str
+    endpoint: str
+    params: Dict[str, Any]
+    value: Any
+    stored_at: float
+
+
+def create_background_task(coro: Awaitable[Any]) -> asyncio.Task:
+    """在空白上下文中创建任务，后台/共享请求不继承发起者的上下文变量（如调用方时限）"""
+    return contextvars.Context().run(asyncio.create_task, coro)
+
+
+def make_cache_key(endpoint: str, params: Optional[Dict[str, Any]] = None) -> CacheKey:
+    """端点 + 归一化参数（忽略None值，按参数名排序，值统一转为字符串）"""
+    normalized = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+    return (endpoint, normalized)
+
+
+class APIResponseCache:
+    """读穿透的API响应缓存
+
+    - fresh: 存储时间在ttl之内，直接返回
+    - stale: 超过ttl但在ttl + stale_ttl之内，返回旧值并在后台刷新
+    - 其余情况同步请求并写入缓存
+    """
+
+    def __init__(self, policies: Dict[str, CachePolicy], max_entries: int = 500):
+        self.policies = policies
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._refreshing: Dict[CacheKey, asyncio.Task] = {}
+        self._stats = {
+            "hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+            "refresh_failures": 0, "invalidations": 0, "evictions": 0
+        }
+
+    async def get_or_fetch(self, namespace: str, endpoint: str, params: Optional[Dict[str, Any]],
+                           fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """读取缓存，未命中时调用fetch获取并写入；fetch抛出的异常原样抛出且不缓存"""
+        policy = self.policies[namespace]
+        key = make_cache_key(endpoint, params)
+        entry = self._entries.get(key)
+        now = time.monotonic()
+
+        if entry is not None:
+            age = now - entry.stored_at
+            if age < policy.ttl:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry.value
+            if age < policy.ttl + policy.stale_ttl:
+                self._entries.move_to_end(key)
+                self._stats["stale_hits"] += 1
+                self._schedule_refresh(key, namespace, endpoint, params, fetch)
+                return entry.value
+
+        self._stats["misses"] += 1
+        value = await fetch()
+        self._store(key, namespace, endpoint, params, value)
+        return value
+
+    def _schedule_refresh(self, key: CacheKey, namespace: str, endpoint: str,
+                          params: Optional[Dict[str, Any]], fetch: Callable[[], Awaitable[Any]]):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                value = await fetch()
+            except Exception as e:
+                self._stats["refresh_failures"] += 1
+                logger.warning(f"[API缓存] 后台刷新失败 {endpoint}: {e}")
+                return
+            # 刷新期间条目被失效时，不写回旧请求的结果
+            if key in self._entries:
+                self._store(key, namespace, endpoint, params, value)
+                self._stats["refreshes"] += 1
+
+        task = create_background_task(refresh())
+        self._refreshing[key] = task
+        task.add_done_callback(lambda done: self._refreshing.pop(key) if self._refreshing.get(key) is done else None)
+
+    def _store(self, key: CacheKey, namespace: str, endpoint: str,
+               params: Optional[Dict[str, Any]], value: Any):
+        self._entries[key] = _CacheEntry(
+            namespace=namespace, endpoint=endpoint, params=dict(params or {}),
+            value=value, stored_at=time.monotonic()
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def invalidate(self, namespace: str,
+                   predicate: Optional[Callable[[str, Dict[str, Any]], bool]] = None) -> int:
+        """失效命名空间内满足predicate(endpoint, params)的条目，返回失效条数"""
+        keys = [
+            key for key, entry in self._entries.items()
+            if entry.namespace == namespace and (predicate is None or predicate(entry.endpoint, entry.params))
+        ]
+        for key in keys:
+            del self._entries[key]
+            refresh = self._refreshing.pop(key, None)
+            if refresh:
+                refresh.cancel()
+        self._stats["invalidations"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        served = self._stats["hits"] + self._stats["stale_hits"]
+        lookups = served + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "hit_ratio": round(served / lookups, 3) if lookups else 0.0
+        }
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一key在途时，后来者等待同一个结果而不再发请求"""
+
+    def __init__(self):
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Task, int] = {}
+        self._stats = {"requests": 0, "coalesced": 0}
+
+    async def do(self, key: CacheKey, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """执行fetch或加入在途的同key请求；异常同样共享给所有等待者"""
+        self._stats["requests"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = create_background_task(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._on_done(key, done))
+        else:
+            self._stats["coalesced"] += 1
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # shield: 单个等待者被取消时不取消其他等待者共享的请求
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if self._waiters[task] == 0:
+                del self._waiters[task]
+                if not task.done():
+                    # 所有等待者都已放弃，不再继续请求；立即移出在途表，
+                    # 避免取消完成前到达的调用者加入已取消的任务而收到CancelledError
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                    task.cancel()
+
+    def _on_done(self, key: CacheKey, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # 所有等待者都已取消时避免"exception was never retrieved"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {**self._stats, "inflight": len(self._inflight)}
@@ -3,17 +3,39 @@
 """
 
 import json
+import time
 import logging
-from typing import Optional, List, Dict, Any
+import dataclasses
+from typing import Optional, List, Dict, Any, AsyncIterator
 import asyncio
 
 from .config import AIConfig, AIProvider
-from .models import AIRequest, AIResponse, AIMessage, MessageRole
+from .models import AIRequest, AIResponse, AIMessage, MessageRole, AIStreamDelta, AIStreamAccumulator
 from .adapters import OpenAIAdapter, ZhipuAdapter, DeepSeekAdapter, BaseAdapter
+from .adapters.base import PROMPT_VERSION
+from .router import ProviderRouter
+from .reply_cache import ReplyCache, normalize_message, is_cacheable_message
+from .intent import IntentClassifier
+from .database_service import DatabaseAPIService, request_deadline
 
 
 logger = logging.getLogger(__name__)
 
+# 默认静态优先级: OpenAI > 智谱AI > Deepseek（健康统计相同时使用）
+PROVIDER_PRIORITY = [AIProvider.OPENAI, AIProvider.ZHIPU, AIProvider.DEEPSEEK]
+
+
+@dataclasses.dataclass
+class ToolLoopState:
+    """一次客户消息内工具调用循环的进度，切换到备用提供商时从这里继续"""
+    request: AIRequest  # 当前请求（含已追加的assistant/tool消息）
+    deadline: float
+    rounds: int = 0
+    tool_calls: List[Dict[str, Any]] = dataclasses.field(default_factory=list)
+    tool_results: List[Dict[str, Any]] = dataclasses.field(default_factory=list)
+    # 已成功执行的有副作用工具调用：签名 -> 结果，同一轮对话内不重复执行
+    completed: Dict[str, Dict[str, Any]] = dataclasses.field(default_factory=dict)
+
 
 class AIClient:
     """统一AI客户端"""
@@ -22,7 +44,31 @@ class AIClient:
         self.config = AIConfig()
         self.adapters: Dict[AIProvider, BaseAdapter] = {}
         self._conversation_memory: List[Dict[str, Any]] = []  # 当前对话记忆
+        # 各适配器共享，查询缓存与连接池跨请求生效
+        self.database_service = DatabaseAPIService(api_config=self.config.booking_api)
         self._init_adapters()
+        self.router = ProviderRouter(
+            self._priority_order(),
+            alpha=self.config.routing.ewma_alpha,
+            failure_threshold=self.config.routing.failure_threshold,
+            open_duration=self.config.routing.open_duration
+        )
+        self._hedge_stats = {"eligible": 0, "fired": 0, "won": 0}
+        self._prompt_cache_stats = {"responses": 0, "prompt_tokens": 0, "cached_tokens": 0}
+        self.reply_cache: Optional[ReplyCache] = None
+        if self.config.reply_cache.enabled:
+            self.reply_cache = ReplyCache(
+                max_entries=self.config.reply_cache.max_entries,
+                ttl=self.config.reply_cache.ttl,
+                max_message_length=self.config.reply_cache.max_message_length
+            )
+        self.intent_classifier: Optional[IntentClassifier] = None
+        if self.config.intent.enabled:
+            self.intent_classifier = IntentClassifier(
+                min_confidence=self.config.intent.min_confidence,
+                max_message_length=self.config.intent.max_message_length
+            )
+            self.intent_classifier.train(self.config.intent.training_db_path)
     
     def _init_adapters(self):
         """初始化适配器"""
@@ -38,22 +84,43 @@ class AIClient:
             elif provider == AIProvider.DEEPSEEK:
                 self.adapters[provider] = DeepSeekAdapter(model_config)
         
+        for adapter in self.adapters.values():
+            adapter.database_service = self.database_service
+        
         logger.info(f"初始化了 {len(self.adapters)} 个AI适配器: {list(self.adapters.keys())}")
     
     async def generate_customer_service_reply(self, customer_message: str, 
                                              preferred_provider: Optional[AIProvider] = None,
-                                             conversation_history: Optional[List[Dict[str, Any]]] = None) -> AIResponse:
-        """生成客服回复（支持Function Call）"""
+                                             conversation_history: Optional[List[Dict[str, Any]]] = None,
+                                             conversation_summary: Optional[str] = None) -> AIResponse:
+        """生成客服回复（支持Function Call）
+        
+        conversation_summary为更早对话的滚动摘要，会放在近期历史之前一并发送
+        """
         if not customer_message.strip():
             raise ValueError("客户消息不能为空")
         
-        # 确定使用的AI提供商
-        provider = self._select_provider(preferred_provider)
-        adapter = self.adapters[provider]
-        
         # 使用传入的对话历史或当前记忆
         history_to_use = conversation_history if conversation_history is not None else self._conversation_memory
         
+        # 静态知识类问题由本地意图识别直接回答
+        local_response = self._answer_locally(customer_message, history_to_use)
+        if local_response:
+            return local_response
+        
+        # 不依赖对话上下文的独立静态问题优先查询回复缓存
+        cache_key = self._reply_cache_key(customer_message, history_to_use, conversation_summary)
+        if cache_key:
+            cached = self.reply_cache.get(cache_key)
+            if cached:
+                logger.info(f"[回复缓存] 命中: {cache_key[1]}")
+                return dataclasses.replace(cached, from_cache=True, timestamp=None)
+        
+        # 按健康程度确定使用的AI提供商
+        candidates = self._candidate_providers(preferred_provider)
+        provider = candidates[0]
+        adapter = self.adapters[provider]
+        
         # 调试日志
         logger.info(f"[AI调试] 收到客户消息: {customer_message}")
         logger.info(f"[AI调试] 对话历史长度: {len(history_to_use)}")
@@ -65,102 +132,552 @@ class AIClient:
                 logger.info(f"  {i}. {role}: {content}...")
         
         # 创建带有对话历史的客服提示词
-        request = adapter.create_customer_service_prompt_with_history(customer_message, history_to_use)
+        request = adapter.create_customer_service_prompt_with_history(
+            customer_message, history_to_use, conversation_summary
+        )
+        if self.config.routing.fail_fast and len(candidates) > 1:
+            request.max_retries = 1  # 有备用提供商时不在首选上重试退避
         
         logger.info(f"为客户消息生成回复，使用提供商: {provider.value}")
         logger.debug(f"客户消息: {customer_message}")
         logger.debug(f"使用对话历史: {len(history_to_use)}条记录")
         
+        state = ToolLoopState(request=request, deadline=time.monotonic() + self.config.tool_execution.loop_deadline)
         try:
-            # 第一次AI调用
-            response = await adapter.chat_completion(request)
+            # 第一次AI调用，然后多轮处理function call
+            response = await self._hedged_completion(provider, request)
+            response = await self._run_tool_loop(provider, response, state)
+            if not state.tool_calls and cache_key and response.content and not response.tool_calls:
+                # 未调用工具的回复才写入缓存
+                self.reply_cache.put(cache_key, dataclasses.replace(response))
+        except Exception as e:
+            logger.error(f"AI回复生成失败 ({provider.value}): {e}")
+            # 带着已执行的工具结果切换到备用提供商继续
+            response = await self._try_fallback_providers(request, provider, tool_state=state)
+        
+        if state.tool_calls:
+            response.tool_calls = state.tool_calls  # 保留所有已执行的工具调用信息
+            response.tool_latencies = self._summarize_tool_latencies(state.tool_results)
+        
+        logger.info(f"AI回复生成成功: {response.content[:100]}...")
+        return response
+    
+    async def _run_tool_loop(self, provider: AIProvider, response: AIResponse, state: ToolLoopState) -> AIResponse:
+        """多轮处理function call，直到模型给出最终回复或达到轮数/时间上限
+        
+        每轮的调用与结果都记录在state中；提供商出错时异常直接抛出，由调用方用state.request继续。
+        """
+        adapter = self.adapters[provider]
+        while response.tool_calls:
+            stop_reason = self._tool_loop_stop_reason(state.rounds, state.deadline)
+            if stop_reason:
+                logger.warning(f"工具调用循环终止: {stop_reason}，直接生成最终回复")
+                return await self._hedged_completion(provider, dataclasses.replace(state.request, tools=None))
             
-            # 检查是否需要处理function call
-            if response.tool_calls and len(response.tool_calls) > 0:
-                logger.info(f"检测到 {len(response.tool_calls)} 个函数调用")
-                
-                # 处理函数调用
-                tool_results = []
-                for tool_call in response.tool_calls:
-                    function_name = tool_call["function"]["name"]
-                    function_args = json.loads(tool_call["function"]["arguments"])
-                    
-                    logger.info(f"执行函数: {function_name} 参数: {function_args}")
-                    
-                    if hasattr(adapter, 'execute_function_call'):
-                        result = await adapter.execute_function_call(function_name, function_args)
-                        tool_results.append({
-                            "tool_call_id": tool_call["id"],
-                            "role": "tool",
-                            "name": function_name,
-                            "content": json.dumps(result, ensure_ascii=False)
-                        })
-                    else:
-                        logger.warning(f"适配器不支持函数调用: {function_name}")
-                
-                if tool_results:
-                    # 构建包含函数调用结果的新请求
-                    follow_up_messages = request.messages.copy()
-                    
-                    # 添加助手的函数调用消息
-                    follow_up_messages.append(AIMessage(
-                        role=MessageRole.ASSISTANT, 
-                        content=response.content or ""
-                    ))
-                    
-                    # 添加函数调用结果
-                    for tool_result in tool_results:
-                        follow_up_messages.append(AIMessage(
-                            role=MessageRole.USER,  # 工具结果作为用户消息
-                            content=f"函数 {tool_result['name']} 执行结果: {tool_result['content']}"
-                        ))
-                    
-                    # 创建新的请求
-                    follow_up_request = AIRequest(
-                        messages=follow_up_messages,
-                        max_tokens=request.max_tokens,
-                        temperature=request.temperature
-                    )
-                    
-                    # 再次调用AI，让它基于函数调用结果生成最终回复
-                    logger.info("基于函数调用结果生成最终回复")
-                    final_response = await adapter.chat_completion(follow_up_request)
-                    
-                    # 合并响应信息
-                    final_response.tool_calls = response.tool_calls  # 保留原始工具调用信息
-                    return final_response
+            state.rounds += 1
+            logger.info(f"第 {state.rounds} 轮: 检测到 {len(response.tool_calls)} 个函数调用")
+            tool_results = await self._execute_tool_calls(
+                adapter, response.tool_calls, round_index=state.rounds, deadline=state.deadline,
+                completed=state.completed
+            )
+            if not tool_results:
+                break
             
-            logger.info(f"AI回复生成成功: {response.content[:100]}...")
-            return response
+            state.tool_calls.extend(response.tool_calls)
+            state.tool_results.extend(tool_results)
             
+            # 以assistant/tool消息追加本轮调用与结果，再次调用AI
+            state.request = self._build_follow_up_request(state.request, response, tool_results)
+            logger.info("基于函数调用结果继续生成回复")
+            response = await self._hedged_completion(provider, state.request)
+        return response
+    
+    async def stream_customer_service_reply(self, customer_message: str,
+                                            preferred_provider: Optional[AIProvider] = None,
+                                            conversation_history: Optional[List[Dict[str, Any]]] = None,
+                                            conversation_summary: Optional[str] = None
+                                            ) -> AsyncIterator[AIStreamDelta]:
+        """流式生成客服回复（支持Function Call），逐个产出增量片段
+        
+        工具调用增量也会产出；如需调用工具，执行后继续流式输出下一轮回复，
+        轮数与总时限与非流式接口一致。
+        在产出第一个片段之前失败时，回退到备用提供商的非流式回复。
+        """
+        if not customer_message.strip():
+            raise ValueError("客户消息不能为空")
+        
+        history_to_use = conversation_history if conversation_history is not None else self._conversation_memory
+        local_response = self._answer_locally(customer_message, history_to_use)
+        if local_response:
+            yield AIStreamDelta(
+                content=local_response.content,
+                finish_reason=local_response.finish_reason,
+                model=local_response.model,
+                provider=local_response.provider
+            )
+            return
+        
+        cache_key = self._reply_cache_key(customer_message, history_to_use, conversation_summary)
+        if cache_key:
+            cached = self.reply_cache.get(cache_key)
+            if cached:
+                logger.info(f"[回复缓存] 命中: {cache_key[1]}")
+                yield AIStreamDelta(
+                    content=cached.content,
+                    finish_reason=cached.finish_reason,
+                    model=cached.model,
+                    provider=cached.provider
+                )
+                return
+        
+        candidates = self._candidate_providers(preferred_provider)
+        provider = candidates[0]
+        adapter = self.adapters[provider]
+        request = adapter.create_customer_service_prompt_with_history(
+            customer_message, history_to_use, conversation_summary
+        )
+        if self.config.routing.fail_fast and len(candidates) > 1:
+            request.max_retries = 1
+        
+        logger.info(f"为客户消息流式生成回复，使用提供商: {provider.value}")
+        
+        started = False
+        state = ToolLoopState(request=request, deadline=time.monotonic() + self.config.tool_execution.loop_deadline)
+        try:
+            while True:
+                accumulator = AIStreamAccumulator(model=adapter.config.model_name, provider=provider.value)
+                round_started_at = time.perf_counter()
+                first_delta = True
+                async for delta in adapter.chat_completion_stream(state.request):
+                    if first_delta:
+                        # 以首个片段的到达时间作为流式延迟
+                        self.router.record_success(provider, (time.perf_counter() - round_started_at) * 1000)
+                        first_delta = False
+                    accumulator.add(delta)
+                    started = True
+                    yield delta
+                
+                response = accumulator.to_response()
+                self._record_prompt_cache(response)
+                if not response.tool_calls:
+                    if state.rounds == 0 and cache_key and response.content:
+                        self.reply_cache.put(cache_key, response)
+                    break
+                
+                stop_reason = self._tool_loop_stop_reason(state.rounds, state.deadline)
+                if stop_reason:
+                    logger.warning(f"工具调用循环终止: {stop_reason}，直接生成最终回复")
+                    async for delta in adapter.chat_completion_stream(dataclasses.replace(state.request, tools=None)):
+                        yield delta
+                    break
+                
+                state.rounds += 1
+                logger.info(f"第 {state.rounds} 轮: 检测到 {len(response.tool_calls)} 个函数调用")
+                tool_results = await self._execute_tool_calls(
+                    adapter, response.tool_calls, round_index=state.rounds, deadline=state.deadline,
+                    completed=state.completed
+                )
+                if not tool_results:
+                    break
+                state.tool_calls.extend(response.tool_calls)
+                state.tool_results.extend(tool_results)
+                state.request = self._build_follow_up_request(state.request, response, tool_results)
+        
         except Exception as e:
-            logger.error(f"AI回复生成失败 ({provider.value}): {e}")
-            # 尝试备用提供商
-            return await self._try_fallback_providers(request, provider)
+            self.router.record_failure(provider)
+            if started:
+                raise
+            logger.error(f"AI流式回复生成失败 ({provider.value}): {e}")
+            response = await self._try_fallback_providers(request, provider, tool_state=state)
+            yield AIStreamDelta(
+                content=response.content or "",
+                finish_reason=response.finish_reason,
+                model=response.model,
+                provider=response.provider,
+                usage=response.usage
+            )
     
-    def _select_provider(self, preferred_provider: Optional[AIProvider] = None) -> AIProvider:
-        """选择AI提供商（优先使用OpenAI）"""
-        if preferred_provider and preferred_provider in self.adapters:
-            return preferred_provider
+    async def update_conversation_summary(self, previous_summary: Optional[str],
+                                          new_turns: List[Dict[str, Any]]) -> str:
+        """将新增对话合并进滚动摘要，返回新摘要（失败时抛出异常）"""
+        if not new_turns:
+            return previous_summary or ""
         
-        # 修改默认优先级: OpenAI > 智谱AI > Deepseek 
-        priority_order = [AIProvider.OPENAI, AIProvider.ZHIPU, AIProvider.DEEPSEEK]
+        provider = self._select_provider()
+        request = self.adapters[provider].create_summary_prompt(previous_summary, new_turns)
+        try:
+            response = await self._timed_completion(provider, request)
+        except Exception as e:
+            logger.warning(f"[对话摘要] 生成失败 ({provider.value}): {e}")
+            response = await self._try_fallback_providers(request, provider)
         
-        for provider in priority_order:
-            if provider in self.adapters:
-                return provider
+        summary = (response.content or "").strip()
+        logger.info(f"[对话摘要] 合并 {len(new_turns)} 条对话，摘要长度 {len(summary)}")
+        return summary
+    
+    def _answer_locally(self, customer_message: str,
+                        history: Optional[List[Dict[str, Any]]] = None) -> Optional[AIResponse]:
+        """本地意图识别：静态知识类意图直接返回知识表中的回答，否则返回None
         
-        raise Exception("没有可用的AI提供商")
+        有更早的对话时，只回答命中关键词规则且本身完整的问题；
+        “那周末呢”这类承接上文的追问交给AI结合历史回答
+        """
+        if self.intent_classifier is None:
+            return None
+        result = self.intent_classifier.classify(customer_message)
+        answer = result.answer
+        if answer is None:
+            logger.debug(f"[意图识别] {result.intent} ({result.source}, {result.confidence:.2f})，交给AI处理")
+            return None
+        if self._has_prior_turns(customer_message, history) and (
+            result.source != "rule" or not is_cacheable_message(normalize_message(customer_message))
+        ):
+            logger.debug(f"[意图识别] {result.intent} 可能依赖上文，交给AI处理")
+            return None
+        logger.info(
+            f"[意图识别] 本地回答: {result.intent} ({result.source}, {result.confidence:.2f}, "
+            f"{result.latency_ms:.2f}ms)"
+        )
+        return AIResponse(
+            content=answer,
+            model="intent-classifier",
+            provider="local",
+            finish_reason="stop",
+            intent=result.intent
+        )
     
-    async def _try_fallback_providers(self, request: AIRequest, failed_provider: AIProvider) -> AIResponse:
-        """尝试备用提供商"""
-        available_providers = [p for p in self.adapters.keys() if p != failed_provider]
+    def _reply_cache_key(self, customer_message: str, history: List[Dict[str, Any]],
+                         summary: Optional[str] = None):
+        """生成回复缓存键，缓存未启用或消息依赖上下文/工具时返回None
+        
+        提示词中带有摘要或本轮之前的对话时，回复可能引用该聊天的信息（客户、预约等），不缓存；
+        服务器传入的历史末尾通常就是本轮客户消息本身，这部分不算上下文
+        """
+        if self.reply_cache is None or summary or self._has_prior_turns(customer_message, history):
+            return None
+        return self.reply_cache.make_key(customer_message, PROMPT_VERSION)
+    
+    @staticmethod
+    def _has_prior_turns(customer_message: str, history: List[Dict[str, Any]]) -> bool:
+        """去掉历史末尾与本轮客户消息相同的客户消息后，是否还有更早的对话"""
+        current = {normalize_message(line) for line in customer_message.split("\n")}
+        current.add(normalize_message(customer_message))
+        turns = [m for m in history or [] if str(m.get("content", "")).strip()]
+        while (turns and turns[-1].get("role") == "user"
+               and normalize_message(str(turns[-1].get("content", ""))) in current):
+            turns.pop()
+        return bool(turns)
+    
+    def _tool_loop_stop_reason(self, rounds: int, deadline: float) -> Optional[str]:
+        """判断工具调用循环是否应当终止，返回终止原因"""
+        if rounds >= self.config.tool_execution.max_rounds:
+            return f"已达到最大轮数 {self.config.tool_execution.max_rounds}"
+        if time.monotonic() >= deadline:
+            return f"已超过总时限 {self.config.tool_execution.loop_deadline}秒"
+        return None
+    
+    async def _execute_tool_calls(self, adapter: BaseAdapter,
+                                  tool_calls: List[Dict[str, Any]],
+                                  round_index: int = 1,
+                                  deadline: Optional[float] = None,
+                                  completed: Optional[Dict[str, Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """执行工具调用，返回tool角色的结果列表（顺序与tool_calls一致）
+        
+        只读工具并发执行（受并发上限约束），有副作用的工具在其后按顺序串行执行。
+        每个工具有独立超时，单个失败或超时只影响该工具的结果。
+        deadline为工具循环的总时限（time.monotonic()），工具执行不会超过它。
+        completed记录本轮对话中已成功的有副作用调用，参数相同的调用不再执行。
+        """
+        if not hasattr(adapter, 'execute_function_call'):
+            for tool_call in tool_calls:
+                logger.warning(f"适配器不支持函数调用: {tool_call['function']['name']}")
+            return []
         
-        for provider in available_providers:
+        tool_config = self.config.tool_execution
+        semaphore = asyncio.Semaphore(max(1, tool_config.max_concurrency))
+        results: List[Optional[Dict[str, Any]]] = [None] * len(tool_calls)
+        
+        async def run(index: int, tool_call: Dict[str, Any]):
+            async with semaphore:
+                results[index] = await self._execute_single_tool_call(adapter, tool_call, deadline)
+        
+        async def run_once(index: int, tool_call: Dict[str, Any]):
+            """有副作用的工具：参数相同且已成功的调用不再执行，只返回已执行的说明"""
+            signature = self._tool_call_signature(tool_call)
+            if completed is not None and signature in completed:
+                logger.warning(f"跳过重复的有副作用工具调用: {tool_call['function']['name']}")
+                results[index] = self._already_executed_result(tool_call, completed[signature])
+                return
+            await run(index, tool_call)
+            if completed is not None and results[index]["success"]:
+                completed[signature] = results[index]
+        
+        parallel = [i for i, c in enumerate(tool_calls)
+                    if c["function"]["name"] not in tool_config.sequential_tools]
+        sequential = [i for i, c in enumerate(tool_calls)
+                      if c["function"]["name"] in tool_config.sequential_tools]
+        
+        if parallel:
+            await asyncio.gather(*(run(i, tool_calls[i]) for i in parallel))
+        for i in sequential:
+            await run_once(i, tool_calls[i])
+        
+        for result in results:
+            result["round"] = round_index
+        return results
+    
+    async def _execute_single_tool_call(self, adapter: BaseAdapter,
+                                        tool_call: Dict[str, Any],
+                                        deadline: Optional[float] = None) -> Dict[str, Any]:
+        """执行单个工具调用（带超时），记录耗时"""
+        function_name = tool_call["function"]["name"]
+        timeout = self.config.tool_execution.get_timeout(function_name)
+        if deadline is not None:
+            timeout = round(max(0.0, min(timeout, deadline - time.monotonic())), 3)
+        started_at = time.perf_counter()
+        
+        try:
+            function_args = json.loads(tool_call["function"]["arguments"] or "{}")
+            logger.info(f"执行函数: {function_name} 参数: {function_args}")
+            # 工具内部的预约API请求（含重试）同样不超过该时限
+            with request_deadline(timeout):
+                result = await asyncio.wait_for(
+                    adapter.execute_function_call(function_name, function_args),
+                    timeout=timeout
+                )
+        except asyncio.TimeoutError:
+            logger.warning(f"函数执行超时 ({timeout}s): {function_name}")
+            result = {
+                "success": False,
+                "error": f"执行超时（{timeout}秒）",
+                "message": f"函数 {function_name} 执行超时"
+            }
+        except Exception as e:
+            logger.error(f"函数执行失败 ({function_name}): {e}")
+            result = {
+                "success": False,
+                "error": str(e),
+                "message": f"函数 {function_name} 执行失败"
+            }
+        
+        latency_ms = (time.perf_counter() - started_at) * 1000
+        logger.info(f"函数 {function_name} 耗时 {latency_ms:.0f}ms")
+        
+        return {
+            "tool_call_id": tool_call.get("id", "unknown"),
+            "role": "tool",
+            "name": function_name,
+            "content": json.dumps(result, ensure_ascii=False),
+            "success": bool(isinstance(result, dict) and result.get("success", False)),
+            "latency_ms": round(latency_ms, 1)
+        }
+    
+    @staticmethod
+    def _tool_call_signature(tool_call: Dict[str, Any]) -> str:
+        """工具名与参数（解析后按键排序）组成的签名"""
+        arguments = tool_call["function"].get("arguments") or "{}"
+        try:
+            arguments = json.dumps(json.loads(arguments), ensure_ascii=False, sort_keys=True)
+        except ValueError:
+            pass
+        return f"{tool_call['function']['name']}:{arguments}"
+    
+    @staticmethod
+    def _already_executed_result(tool_call: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Any]:
+        """重复的有副作用调用的结果：告知模型已执行过，并附上次结果"""
+        function_name = tool_call["function"]["name"]
+        result = {
+            "success": True,
+            "message": f"函数 {function_name} 在本轮对话中已成功执行，未重复执行",
+            "previous_result": json.loads(previous["content"])
+        }
+        return {
+            "tool_call_id": tool_call.get("id", "unknown"),
+            "role": "tool",
+            "name": function_name,
+            "content": json.dumps(result, ensure_ascii=False),
+            "success": True,
+            "latency_ms": 0.0
+        }
+    
+    @staticmethod
+    def _summarize_tool_latencies(tool_results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """提取每个工具调用的耗时信息"""
+        return [
+            {
+                "tool_call_id": r["tool_call_id"],
+                "name": r["name"],
+                "round": r["round"],
+                "latency_ms": r["latency_ms"],
+                "success": r["success"]
+            }
+            for r in tool_results
+        ]
+    
+    def _build_follow_up_request(self, request: AIRequest, response: AIResponse,
+                                 tool_results: List[Dict[str, Any]]) -> AIRequest:
+        """构建包含函数调用结果的后续请求（assistant工具调用消息 + tool结果消息）"""
+        follow_up_messages = request.messages.copy()
+        
+        # 添加助手的函数调用消息
+        follow_up_messages.append(AIMessage(
+            role=MessageRole.ASSISTANT, 
+            content=response.content or "",
+            tool_calls=response.tool_calls
+        ))
+        
+        # 添加函数调用结果
+        for tool_result in tool_results:
+            follow_up_messages.append(AIMessage(
+                role=MessageRole.TOOL,
+                content=tool_result["content"],
+                tool_call_id=tool_result["tool_call_id"]
+            ))
+        
+        # 保留工具配置，允许模型基于结果继续调用工具（如预约成功后发送邮件）
+        return AIRequest(
+            messages=follow_up_messages,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            tools=request.tools
+        )
+    
+    def _priority_order(self) -> List[AIProvider]:
+        """已初始化适配器的静态优先级顺序"""
+        ordered = [p for p in PROVIDER_PRIORITY if p in self.adapters]
+        return ordered + [p for p in self.adapters if p not in ordered]
+    
+    def _candidate_providers(self, preferred_provider: Optional[AIProvider] = None) -> List[AIProvider]:
+        """按健康程度排列的候选提供商（熔断中的提供商排除在外）"""
+        if not self.adapters:
+            raise Exception("没有可用的AI提供商")
+        self.router.sync(self._priority_order())
+        return self.router.candidates(preferred_provider)
+    
+    def _select_provider(self, preferred_provider: Optional[AIProvider] = None) -> AIProvider:
+        """选择当前最健康的AI提供商（统计相同时优先OpenAI）"""
+        return self._candidate_providers(preferred_provider)[0]
+    
+    async def _timed_completion(self, provider: AIProvider, request: AIRequest) -> AIResponse:
+        """调用适配器，并将延迟和成败记录到路由器"""
+        started_at = time.perf_counter()
+        try:
+            response = await self.adapters[provider].chat_completion(request)
+        except Exception:
+            self.router.record_failure(provider, (time.perf_counter() - started_at) * 1000)
+            raise
+        self.router.record_success(provider, (time.perf_counter() - started_at) * 1000)
+        self._record_prompt_cache(response)
+        return response
+    
+    def _record_prompt_cache(self, response: AIResponse):
+        """累计提示词token与命中前缀缓存的token"""
+        if not response.usage:
+            return
+        self._prompt_cache_stats["responses"] += 1
+        self._prompt_cache_stats["prompt_tokens"] += response.usage.get("prompt_tokens") or 0
+        self._prompt_cache_stats["cached_tokens"] += response.cached_tokens or 0
+        if response.cached_tokens:
+            logger.debug(f"[前缀缓存] 命中 {response.cached_tokens}/{response.usage.get('prompt_tokens')} tokens")
+    
+    def get_prompt_cache_stats(self) -> Dict[str, Any]:
+        """获取提供商前缀缓存统计"""
+        stats = self._prompt_cache_stats
+        return {
+            **stats,
+            "hit_ratio": round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+        }
+    
+    def _select_hedge_provider(self, provider: AIProvider, request: AIRequest) -> Optional[AIProvider]:
+        """选择对冲用的备用提供商（需支持请求中的工具调用）"""
+        for candidate in self._candidate_providers():
+            if candidate == provider:
+                continue
+            if request.tools and not self.adapters[candidate].supports_function_calling:
+                continue
+            return candidate
+        return None
+    
+    def _hedge_delay(self, provider: AIProvider) -> float:
+        """对冲等待时间（秒）：首选提供商近期延迟的指定百分位"""
+        routing = self.config.routing
+        delay_ms = self.router.latency_percentile(
+            provider, routing.hedge_percentile, min_samples=routing.hedge_min_samples
+        )
+        if delay_ms is None:
+            delay_ms = routing.hedge_default_delay_ms
+        return delay_ms / 1000
+    
+    async def _hedged_completion(self, provider: AIProvider, request: AIRequest) -> AIResponse:
+        """带对冲的补全请求：首选提供商过慢时并行请求备用提供商，取先完成者并取消另一个"""
+        hedge_provider = None
+        if self.config.routing.hedging_enabled:
+            hedge_provider = self._select_hedge_provider(provider, request)
+        if hedge_provider is None:
+            return await self._timed_completion(provider, request)
+        
+        self._hedge_stats["eligible"] += 1
+        delay = self._hedge_delay(provider)
+        primary_started_at = time.perf_counter()
+        primary_task = asyncio.create_task(self._timed_completion(provider, request))
+        pending = {primary_task}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if primary_task in done:
+                return primary_task.result()
+            
+            self._hedge_stats["fired"] += 1
+            logger.info(f"[对冲] {provider.value} 超过 {delay * 1000:.0f}ms 未返回，发起对冲请求: {hedge_provider.value}")
+            hedge_task = asyncio.create_task(
+                self._timed_completion(hedge_provider, dataclasses.replace(request, max_retries=1))
+            )
+            pending.add(hedge_task)
+            
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self._hedge_stats["won"] += 1
+                            logger.info(f"[对冲] 对冲请求先完成: {hedge_provider.value}")
+                            if primary_task in pending:
+                                # 首选将被取消：已等待的时间作为其延迟下界样本
+                                self.router.record_latency_lower_bound(
+                                    provider, (time.perf_counter() - primary_started_at) * 1000
+                                )
+                        return task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def get_hedge_stats(self) -> Dict[str, int]:
+        """获取对冲请求统计"""
+        return dict(self._hedge_stats)
+    
+    async def _try_fallback_providers(self, request: AIRequest, failed_provider: AIProvider,
+                                      tool_state: Optional[ToolLoopState] = None) -> AIResponse:
+        """按健康程度依次尝试备用提供商（最后一个提供商使用完整重试）
+        
+        传入tool_state时从其当前请求（含已执行工具的结果）继续，并在备用提供商上完成工具调用循环。
+        """
+        available_providers = [p for p in self._candidate_providers() if p != failed_provider]
+        
+        for index, provider in enumerate(available_providers):
+            is_last = index == len(available_providers) - 1
+            fallback_request = dataclasses.replace(
+                tool_state.request if tool_state else request,
+                max_retries=1 if self.config.routing.fail_fast and not is_last else None
+            )
             try:
                 logger.info(f"尝试备用提供商: {provider.value}")
-                adapter = self.adapters[provider]
-                response = await adapter.chat_completion(request)
+                response = await self._timed_completion(provider, fallback_request)
+                if tool_state is not None:
+                    response = await self._run_tool_loop(provider, response, tool_state)
                 logger.info(f"备用提供商成功: {provider.value}")
                 return response
             except Exception as e:
@@ -248,6 +765,29 @@ class AIClient:
         """获取当前记忆条数"""
         return len(self._conversation_memory)
 
+    def get_pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各适配器的连接池统计"""
+        return {
+            provider.value: adapter.get_pool_stats()
+            for provider, adapter in self.adapters.items()
+        }
+    
+    async def close(self):
+        """关闭所有适配器的连接池会话"""
+        for provider, adapter in self.adapters.items():
+            try:
+                await adapter.close()
+            except Exception as e:
+                logger.warning(f"关闭适配器会话失败 ({provider.value}): {e}")
+        await self.database_service.close()
+        logger.info("AI客户端已关闭所有连接池会话")
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
     def get_status(self) -> Dict[str, Any]:
         """获取客户端状态"""
         return {
@@ -255,9 +795,21 @@ class AIClient:
             "total_providers": len(self.adapters),
             "config_loaded": len(self.config.models) > 0,
             "memory_count": len(self._conversation_memory),
-            "default_provider": "openai",  # 标明默认使用OpenAI
+            "default_provider": self._select_provider().value if self.adapters else None,
             "function_call_enabled": any(
                 getattr(adapter, 'supports_function_calling', False) 
                 for adapter in self.adapters.values()
-            )
+            ),
+            "connection_pools": self.get_pool_stats(),
+            "provider_health": self.router.get_stats(),
+            "hedging": {
+                "enabled": self.config.routing.hedging_enabled,
+                **self.get_hedge_stats()
+            },
+            "reply_cache": self.reply_cache.get_stats() if self.reply_cache else None,
+            "intent_classifier": self.intent_classifier.get_stats() if self.intent_classifier else None,
+            "prompt_cache": self.get_prompt_cache_stats(),
+            "api_cache": self.database_service.get_cache_stats(),
+            "api_requests": self.database_service.get_request_stats(),
+            "therapist_index": self.database_service.therapist_index.get_stats()
         } 
\ No newline at end of file
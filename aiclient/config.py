@@ -4,7 +4,7 @@ AI配置管理模块
 
 import os
 from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from dotenv import load_dotenv
 
@@ -27,6 +27,99 @@ class ModelConfig:
     temperature: float = 0.7
     max_retries: int = 3
     timeout: int = 30
+    # 连接池配置
+    pool_limit: int = 100
+    pool_limit_per_host: int = 20
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+    # 单次请求的token上限（提示词 + 回复），用于裁剪对话历史
+    context_token_limit: int = 8000
+
+
+@dataclass
+class ToolExecutionConfig:
+    """工具调用执行配置"""
+    max_concurrency: int = 4
+    default_timeout: float = 10.0
+    # 单个工具的超时覆盖（秒）
+    timeouts: Dict[str, float] = field(default_factory=lambda: {
+        "create_appointment": 20.0,
+        "query_availability_batch": 20.0,
+        "cancel_appointment": 20.0,
+        "send_appointment_emails": 30.0
+    })
+    # 有副作用的工具按模型给出的顺序串行执行，且在只读工具之后执行
+    sequential_tools: tuple = ("create_appointment", "cancel_appointment", "send_appointment_emails")
+    # 多轮工具调用的轮数上限与总时限（秒）
+    max_rounds: int = 4
+    loop_deadline: float = 60.0
+    
+    def get_timeout(self, function_name: str) -> float:
+        """获取指定工具的超时时间"""
+        return self.timeouts.get(function_name, self.default_timeout)
+
+
+@dataclass
+class RoutingConfig:
+    """提供商路由与熔断配置"""
+    ewma_alpha: float = 0.3
+    failure_threshold: int = 3
+    open_duration: float = 30.0  # 熔断打开持续时间（秒）
+    # 存在备用提供商时，每个提供商只尝试一次，失败立即切换
+    fail_fast: bool = True
+    # 对冲请求：首选提供商超过其近期延迟的指定百分位仍未返回时，向备用提供商发出同一请求
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 20
+    hedge_default_delay_ms: float = 3000.0  # 样本不足时的对冲等待时间
+
+
+@dataclass
+class ReplyCacheConfig:
+    """客服回复缓存配置"""
+    enabled: bool = True
+    max_entries: int = 1000
+    ttl: float = 3600.0  # 秒
+    max_message_length: int = 40  # 超过该长度的消息不缓存
+
+
+@dataclass
+class BookingAPIConfig:
+    """预约API（DatabaseAPIService）连接配置"""
+    base_url: str = "http://emagen.323424.xyz/api"
+    default_timeout: float = 8.0  # 单次请求总超时（秒）
+    # 按端点前缀覆盖超时（最长前缀优先）
+    timeouts: Dict[str, float] = field(default_factory=lambda: {
+        "/stores": 5.0,
+        "/therapists": 8.0,
+        "/appointments/availability": 5.0,
+        "/appointments": 10.0
+    })
+    # 只有幂等的GET请求会重试
+    get_retries: int = 2
+    retry_backoff_base: float = 0.2  # 退避基数（秒），实际等待为 [0, base * 2^attempt] 内的随机值
+    retry_backoff_max: float = 2.0
+    max_retry_after: float = 5.0  # Retry-After 超过该值时不再重试
+    pool_limit: int = 20
+    keepalive_timeout: float = 30.0
+    cache_enabled: bool = True
+    cache_max_entries: int = 500
+    
+    def get_timeout(self, endpoint: str) -> float:
+        """获取端点的请求超时"""
+        matches = [prefix for prefix in self.timeouts if endpoint.startswith(prefix)]
+        if not matches:
+            return self.default_timeout
+        return self.timeouts[max(matches, key=len)]
+
+
+@dataclass
+class IntentConfig:
+    """本地意图识别配置"""
+    enabled: bool = True
+    min_confidence: float = 0.5  # 模型相似度低于该值时交给AI处理
+    max_message_length: int = 40
+    training_db_path: Optional[str] = None  # 用于训练模型的聊天历史数据库
 
 
 class AIConfig:
@@ -34,6 +127,11 @@ class AIConfig:
     
     def __init__(self):
         self.models: Dict[AIProvider, ModelConfig] = {}
+        self.tool_execution = ToolExecutionConfig()
+        self.routing = RoutingConfig()
+        self.reply_cache = ReplyCacheConfig()
+        self.intent = IntentConfig()
+        self.booking_api = BookingAPIConfig()
         self._load_config()
     
     def _load_config(self):
@@ -67,9 +165,10 @@ class AIConfig:
                 provider=AIProvider.ZHIPU,
                 model_name=os.getenv("ZHIPU_MODEL", "GLM-4-Flash-250414"),
                 api_key=zhipu_key,
-                base_url="https://open.bigmodel.cn/api/paas/v4/",
+                base_url=os.getenv("ZHIPU_BASE_URL", "https://open.bigmodel.cn/api/paas/v4/"),
                 max_tokens=int(os.getenv("ZHIPU_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("ZHIPU_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("ZHIPU_TEMPERATURE", "0.7")),
+                context_token_limit=int(os.getenv("ZHIPU_CONTEXT_TOKENS", "8000"))
             )
         
         # Deepseek配置
@@ -79,9 +178,10 @@ class AIConfig:
                 provider=AIProvider.DEEPSEEK,
                 model_name=os.getenv("DEEPSEEK_MODEL", "deepseek-chat"),
                 api_key=deepseek_key,
-                base_url="https://api.deepseek.com/v1/",
+                base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1/"),
                 max_tokens=int(os.getenv("DEEPSEEK_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7")),
+                context_token_limit=int(os.getenv("DEEPSEEK_CONTEXT_TOKENS", "8000"))
             )
         
         # OpenAI配置
@@ -93,9 +193,39 @@ class AIConfig:
                 api_key=openai_key,
                 base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai-next.com/v1"),
                 max_tokens=int(os.getenv("OPENAI_MAX_TOKENS", "1000")),
-                temperature=float(os.getenv("OPENAI_TEMPERATURE", "0.7"))
+                temperature=float(os.getenv("OPENAI_TEMPERATURE", "0.7")),
+                context_token_limit=int(os.getenv("OPENAI_CONTEXT_TOKENS", "8000"))
             )
 
+        # 工具调用执行配置
+        self.tool_execution.max_concurrency = int(os.getenv("AI_TOOL_MAX_CONCURRENCY", "4"))
+        self.tool_execution.default_timeout = float(os.getenv("AI_TOOL_TIMEOUT", "10"))
+        self.tool_execution.max_rounds = int(os.getenv("AI_TOOL_MAX_ROUNDS", "4"))
+        self.tool_execution.loop_deadline = float(os.getenv("AI_TOOL_LOOP_DEADLINE", "60"))
+        
+        # 路由与熔断配置
+        self.routing.failure_threshold = int(os.getenv("AI_ROUTER_FAILURE_THRESHOLD", "3"))
+        self.routing.open_duration = float(os.getenv("AI_ROUTER_OPEN_SECONDS", "30"))
+        self.routing.fail_fast = os.getenv("AI_ROUTER_FAIL_FAST", "true").lower() == "true"
+        self.routing.hedging_enabled = os.getenv("AI_HEDGING", "false").lower() == "true"
+        self.routing.hedge_percentile = float(os.getenv("AI_HEDGE_PERCENTILE", "95"))
+        self.routing.hedge_default_delay_ms = float(os.getenv("AI_HEDGE_DEFAULT_DELAY_MS", "3000"))
+        
+        # 回复缓存配置
+        self.reply_cache.enabled = os.getenv("AI_REPLY_CACHE", "true").lower() == "true"
+        self.reply_cache.max_entries = int(os.getenv("AI_REPLY_CACHE_MAX_ENTRIES", "1000"))
+        self.reply_cache.ttl = float(os.getenv("AI_REPLY_CACHE_TTL", "3600"))
+        
+        # 本地意图识别配置
+        self.intent.enabled = os.getenv("AI_INTENT_FAST_PATH", "true").lower() == "true"
+        self.intent.min_confidence = float(os.getenv("AI_INTENT_MIN_CONFIDENCE", "0.5"))
+        self.intent.training_db_path = os.getenv("AI_INTENT_TRAINING_DB")
+        
+        # 预约API配置
+        self.booking_api.base_url = os.getenv("BOOKING_API_BASE_URL", self.booking_api.base_url)
+        self.booking_api.default_timeout = float(os.getenv("BOOKING_API_TIMEOUT", "8"))
+        self.booking_api.get_retries = int(os.getenv("BOOKING_API_GET_RETRIES", "2"))
+        self.booking_api.cache_enabled = os.getenv("BOOKING_API_CACHE", "true").lower() == "true"
     
     def get_model_config(self, provider: AIProvider) -> Optional[ModelConfig]:
         """获取指定提供商的模型配置"""
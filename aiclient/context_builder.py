@@ -0,0 +1,179 @@
+"""
+对话上下文构建模块
+发送前估算提示词token数，按模型的token上限为工具和回复预留空间，
+在剩余预算内保留最近的对话历史
+"""
+
+import json
+import math
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from .models import AIMessage
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken为可选依赖，缺失时按字符数估算
+    tiktoken = None
+
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的角色与分隔符开销，以及回复起始的固定开销（OpenAI聊天格式）
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+# 历史窗口起点的对齐步长：起点只在跨过步长边界时前移，期间历史前缀保持不变，便于提供商前缀缓存命中
+HISTORY_WINDOW_STEP = 10
+
+
+def _is_wide_char(ch: str) -> bool:
+    """中日韩文字及全角符号"""
+    code = ord(ch)
+    return (0x2E80 <= code <= 0x9FFF or 0xAC00 <= code <= 0xD7AF
+            or 0xF900 <= code <= 0xFAFF or 0xFF00 <= code <= 0xFFEF)
+
+
+def estimate_tokens(text: str) -> int:
+    """无分词器时的保守估算：中文等宽字符按1个token，其余字符按4个一token"""
+    wide = sum(1 for ch in text if _is_wide_char(ch))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+class TokenCounter:
+    """提示词token计数器，优先使用tiktoken，不可用时按字符估算"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._encoding = self._load_encoding(model_name)
+
+    @staticmethod
+    def _load_encoding(model_name: str):
+        if tiktoken is None:
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                # 非OpenAI模型使用通用编码近似
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"[上下文] 加载tiktoken编码失败，改为字符估算: {e}")
+            return None
+
+    @property
+    def backend(self) -> str:
+        return "tiktoken" if self._encoding is not None else "estimate"
+
+    def count_text(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return estimate_tokens(text)
+
+    def count_message(self, message: AIMessage) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS + self.count_text(message.content)
+        if message.tool_calls:
+            tokens += self.count_text(json.dumps(message.tool_calls, ensure_ascii=False))
+        return tokens
+
+    def count_messages(self, messages: List[AIMessage]) -> int:
+        return sum(self.count_message(message) for message in messages) + REPLY_PRIMING_TOKENS
+
+    def count_tools(self, tools: Optional[List[Dict[str, Any]]]) -> int:
+        if not tools:
+            return 0
+        return self.count_text(json.dumps(tools, ensure_ascii=False))
+
+
+@dataclass
+class ContextDecision:
+    """一次上下文构建的决策记录"""
+    total_history: int
+    kept_history: int
+    history_tokens: int
+    history_budget: int
+    fixed_tokens: int  # 系统提示词 + 当前客户消息
+    tools_tokens: int
+    reply_reserve: int
+    estimated_prompt_tokens: int
+    token_limit: int
+    backend: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return asdict(self)
+
+    def describe(self) -> str:
+        return (
+            f"历史 {self.total_history} 条，保留最近 {self.kept_history} 条 "
+            f"({self.history_tokens}/{self.history_budget} tokens)；"
+            f"系统提示词+当前消息 {self.fixed_tokens}，工具 {self.tools_tokens}，"
+            f"预留回复 {self.reply_reserve}；估算提示词 {self.estimated_prompt_tokens}/{self.token_limit} tokens "
+            f"({self.backend})"
+        )
+
+
+class ContextBuilder:
+    """按token预算选择对话历史
+
+    历史预算 = token上限 - 预留回复 - 工具 - 系统提示词与当前消息。
+    从最近的消息往前保留，直到超出预算；窗口起点再按步长对齐，
+    使多轮对话间的历史前缀保持稳定。
+    """
+
+    def __init__(self, counter: TokenCounter, token_limit: int, reply_reserve: int,
+                 window_step: int = HISTORY_WINDOW_STEP):
+        self.counter = counter
+        self.token_limit = token_limit
+        self.reply_reserve = reply_reserve
+        self.window_step = max(1, window_step)
+        self._tools_tokens: Optional[Tuple[int, int]] = None  # (id(tools), token数)
+
+    def _count_tools(self, tools: Optional[List[Dict[str, Any]]]) -> int:
+        # 工具列表在适配器内共享，按对象缓存计数结果
+        if not tools:
+            return 0
+        if self._tools_tokens is None or self._tools_tokens[0] != id(tools):
+            self._tools_tokens = (id(tools), self.counter.count_tools(tools))
+        return self._tools_tokens[1]
+
+    def select_history(self, history: List[AIMessage], fixed_messages: List[AIMessage],
+                       tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[List[AIMessage], ContextDecision]:
+        """在预算内选择最近的对话历史，返回(保留的历史, 决策记录)"""
+        fixed_tokens = self.counter.count_messages(fixed_messages)
+        tools_tokens = self._count_tools(tools)
+        budget = max(0, self.token_limit - self.reply_reserve - tools_tokens - fixed_tokens)
+
+        message_tokens = [self.counter.count_message(message) for message in history]
+        start = len(history)
+        used = 0
+        while start > 0 and used + message_tokens[start - 1] <= budget:
+            start -= 1
+            used += message_tokens[start]
+
+        if 0 < start < len(history):
+            aligned = -(-start // self.window_step) * self.window_step
+            # 对齐后剩余过少时不对齐，避免丢掉最近的上下文
+            if len(history) - aligned >= self.window_step:
+                start = aligned
+        kept = history[start:]
+        history_tokens = sum(message_tokens[start:])
+
+        decision = ContextDecision(
+            total_history=len(history),
+            kept_history=len(kept),
+            history_tokens=history_tokens,
+            history_budget=budget,
+            fixed_tokens=fixed_tokens,
+            tools_tokens=tools_tokens,
+            reply_reserve=self.reply_reserve,
+            estimated_prompt_tokens=fixed_tokens + tools_tokens + history_tokens,
+            token_limit=self.token_limit,
+            backend=self.counter.backend
+        )
+        if budget == 0:
+            logger.warning(f"[上下文] 系统提示词与工具已占满token预算: {decision.describe()}")
+        return kept, decision
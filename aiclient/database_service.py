@@ -3,77 +3,272 @@
 用于调用外部API获取门店、技师、预约等信息
 """
 
+import time as time_module
+import random
+import asyncio
 import logging
+import contextvars
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 import aiohttp
-from typing import Optional, List, Dict, Any
-from datetime import datetime, date, time
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, date, time, timezone
+
+from .config import BookingAPIConfig
+from .api_cache import APIResponseCache, CachePolicy, SingleFlight, make_cache_key
+from .therapist_index import TherapistIndex
 
 logger = logging.getLogger(__name__)
 
+# GET请求遇到这些状态码时重试
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# 调用方时限（time.monotonic()绝对时间），随上下文传递给该调用链上的所有API请求
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "booking_api_deadline", default=None
+)
+
+
+class BookingAPIError(Exception):
+    """预约API返回了非成功状态码"""
+    
+    def __init__(self, status: int, text: str):
+        super().__init__(f"API错误 {status}: {text}")
+        self.status = status
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """在该上下文内发出的预约API请求（含重试）都不超过seconds秒；嵌套时取更早的时限"""
+    if seconds is None:
+        yield
+        return
+    deadline = time_module.monotonic() + max(0.0, seconds)
+    current = _request_deadline.get()
+    token = _request_deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def remaining_deadline() -> Optional[float]:
+    """当前调用方时限的剩余秒数，未设置时为None"""
+    deadline = _request_deadline.get()
+    return None if deadline is None else deadline - time_module.monotonic()
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
 
 class DatabaseAPIService:
     """数据库API服务类"""
     
-    def __init__(self, base_url: str = "http://emagen.323424.xyz/api"):
-        self.base_url = base_url
+    # 只读查询的缓存策略：门店和技师名单很少变化，可用时间与排班只短暂缓存且不返回过期值
+    CACHE_POLICIES = {
+        "stores": CachePolicy(ttl=3600, stale_ttl=86400),
+        "therapists": CachePolicy(ttl=600, stale_ttl=3600),
+        "availability": CachePolicy(ttl=30),
+        "schedule": CachePolicy(ttl=60),
+    }
+    
+    # 批量查询可用时间的并发上限和单次最多查询的(技师, 日期)组合数
+    BATCH_AVAILABILITY_CONCURRENCY = 4
+    BATCH_AVAILABILITY_MAX_QUERIES = 40
+    
+    def __init__(self, base_url: Optional[str] = None, cache_enabled: Optional[bool] = None,
+                 cache_max_entries: Optional[int] = None, api_config: Optional[BookingAPIConfig] = None):
+        self.api_config = api_config or BookingAPIConfig()
+        self.base_url = base_url or self.api_config.base_url
         self.logger = logger.getChild(self.__class__.__name__)
+        if cache_enabled is None:
+            cache_enabled = self.api_config.cache_enabled
+        if cache_max_entries is None:
+            cache_max_entries = self.api_config.cache_max_entries
+        
+        # 长连接会话（懒加载，绑定到创建时的事件循环）
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop = None
+        self._request_stats = {"retries": 0, "timeouts": 0, "deadline_exceeded": 0}
+        self.cache: Optional[APIResponseCache] = None
+        if cache_enabled:
+            self.cache = APIResponseCache(self.CACHE_POLICIES, max_entries=cache_max_entries)
+        self._single_flight = SingleFlight()
+        # 技师名单的内存索引，按ID/姓名/门店查找不再请求API
+        self.therapist_index = TherapistIndex(self._load_therapist_roster)
     
-    async def _make_get_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """发送HTTP GET请求到API"""
-        url = f"{self.base_url}{endpoint}"
+    async def _cached_get(self, namespace: str, endpoint: str,
+                          params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """带缓存的GET请求，请求失败时不写入缓存"""
+        if self.cache is None:
+            return await self._make_get_request(endpoint, params)
+        return await self.cache.get_or_fetch(
+            namespace, endpoint, params, lambda: self._make_get_request(endpoint, params)
+        )
+    
+    def _invalidate_booking_caches(self, therapist_id: Optional[int], appointment_date: Optional[str]):
+        """预约变更后失效受影响技师当天的可用时间与排班缓存；信息不全时失效全部"""
+        if self.cache is None:
+            return
+        if therapist_id is None or not appointment_date:
+            self.cache.invalidate("availability")
+            self.cache.invalidate("schedule")
+            return
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return data
-                    else:
-                        error_text = await response.text()
-                        self.logger.error(f"API错误 {response.status}: {error_text}")
-                        raise Exception(f"API错误 {response.status}: {error_text}")
-        except Exception as e:
-            self.logger.error(f"GET请求失败 {url}: {e}")
-            raise
+        therapist_id = str(therapist_id)
+        appointment_date = str(appointment_date)
+        availability_endpoint = f"/appointments/availability/{therapist_id}"
+        removed = self.cache.invalidate(
+            "availability",
+            lambda endpoint, params: endpoint == availability_endpoint and str(params.get("date")) == appointment_date
+        )
+        removed += self.cache.invalidate(
+            "schedule",
+            lambda endpoint, params: (
+                str(params.get("technician_id")) == therapist_id
+                and str(params.get("start_date", "")) <= appointment_date <= str(params.get("end_date", ""))
+            )
+        )
+        self.logger.info(f"[API缓存] 技师 {therapist_id} {appointment_date} 预约变更，失效 {removed} 条缓存")
     
-    async def _make_post_request(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
-        """发送HTTP POST请求到API"""
-        url = f"{self.base_url}{endpoint}"
+    def get_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """获取查询缓存统计"""
+        return self.cache.get_stats() if self.cache else None
+    
+    async def _load_therapist_roster(self) -> List[Dict[str, Any]]:
+        """加载完整技师名单（失败时抛出异常，避免用空名单覆盖索引）"""
+        result = await self._make_get_request("/therapists", {"action": "query_schedule"})
+        if isinstance(result, dict):
+            return result.get("therapists", [])
+        return result if isinstance(result, list) else []
+    
+    async def get_therapist(self, therapist_id: int) -> Optional[Dict[str, Any]]:
+        """按ID获取技师信息（走内存索引）"""
+        return await self.therapist_index.get(therapist_id)
+    
+    def get_request_stats(self) -> Dict[str, Any]:
+        """获取请求统计：GET合并（coalesced 即节省的请求数）、重试、超时与超出调用方时限次数"""
+        return {**self._single_flight.get_stats(), **self._request_stats}
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取（必要时创建）带连接池的共享会话，会话绑定创建时的事件循环"""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is loop:
+            return self._session
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data) as response:
-                    if response.status in [200, 201]:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        self.logger.error(f"API错误 {response.status}: {error_text}")
-                        raise Exception(f"API错误 {response.status}: {error_text}")
-        except Exception as e:
-            self.logger.error(f"POST请求失败 {url}: {e}")
-            raise
+        if self._session is not None and not self._session.closed:
+            if self._session_loop is not None and not self._session_loop.is_closed():
+                self.logger.warning("事件循环已变更，丢弃旧的连接池会话")
+            self._session = None
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.api_config.pool_limit,
+            keepalive_timeout=self.api_config.keepalive_timeout
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.api_config.default_timeout)
+        )
+        self._session_loop = loop
+        return self._session
     
-    async def _make_delete_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """发送HTTP DELETE请求到API"""
+    async def close(self):
+        """关闭连接池会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+    
+    def _retry_delay(self, attempt: int, retry_after: Optional[float]) -> float:
+        """重试等待时间：优先遵循Retry-After，否则为带抖动的指数退避"""
+        if retry_after is not None:
+            return retry_after
+        ceiling = min(self.api_config.retry_backoff_max, self.api_config.retry_backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+    
+    async def _request(self, method: str, endpoint: str, params: Optional[Dict[str, Any]] = None,
+                       data: Optional[Dict[str, Any]] = None,
+                       ok_statuses: Tuple[int, ...] = (200,)) -> Dict[str, Any]:
+        """发送HTTP请求：按端点设置超时，不超过调用方时限；只有GET会在超时、连接错误和可重试状态码时重试"""
         url = f"{self.base_url}{endpoint}"
+        retries = self.api_config.get_retries if method == "GET" else 0
         
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.delete(url, params=params) as response:
-                    if response.status in [200, 204]:
-                        if response.content_length and response.content_length > 0:
-                            result = await response.json()
-                            return result
-                        else:
+        for attempt in range(retries + 1):
+            timeout = self.api_config.get_timeout(endpoint)
+            remaining = remaining_deadline()
+            if remaining is not None:
+                if remaining <= 0:
+                    self._request_stats["deadline_exceeded"] += 1
+                    raise asyncio.TimeoutError(f"{method} {url} 已超过调用方时限")
+                timeout = min(timeout, remaining)
+            
+            retry_after = None
+            try:
+                session = await self._get_session()
+                async with session.request(method, url, params=params, json=data,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    if response.status in ok_statuses:
+                        if method == "DELETE" and not response.content_length:
                             return {"success": True, "message": "删除成功"}
-                    else:
-                        error_text = await response.text()
-                        self.logger.error(f"API错误 {response.status}: {error_text}")
-                        raise Exception(f"API错误 {response.status}: {error_text}")
-        except Exception as e:
-            self.logger.error(f"DELETE请求失败 {url}: {e}")
-            raise
+                        return await response.json()
+                    error_text = await response.text()
+                    self.logger.error(f"API错误 {response.status}: {error_text}")
+                    error = BookingAPIError(response.status, error_text)
+                    retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self._request_stats["timeouts"] += 1
+                error = e
+            
+            retryable = not isinstance(error, BookingAPIError) or error.status in RETRYABLE_STATUSES
+            if attempt >= retries or not retryable:
+                self.logger.error(f"{method}请求失败 {url}: {error!r}")
+                raise error
+            if retry_after is not None and retry_after > self.api_config.max_retry_after:
+                self.logger.error(f"{method}请求失败 {url}: Retry-After {retry_after}s 过长，不再重试")
+                raise error
+            
+            delay = self._retry_delay(attempt, retry_after)
+            remaining = remaining_deadline()
+            if remaining is not None and delay >= remaining:
+                self.logger.error(f"{method}请求失败 {url}: 剩余时限不足以重试")
+                raise error
+            self._request_stats["retries"] += 1
+            self.logger.warning(f"{method}请求失败 {url} (尝试 {attempt + 1}/{retries + 1})，{delay:.2f}s 后重试: {error!r}")
+            await asyncio.sleep(delay)
+    
+    async def _make_get_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """发送HTTP GET请求到API，并发的相同请求只发送一次"""
+        flight = self._single_flight.do(
+            make_cache_key(endpoint, params), lambda: self._request("GET", endpoint, params=params)
+        )
+        # 共享请求不受单个调用方时限约束，每个等待者各自按自己的时限放弃等待
+        remaining = remaining_deadline()
+        if remaining is None:
+            return await flight
+        return await asyncio.wait_for(flight, timeout=max(remaining, 0))
+    
+    async def _make_post_request(self, endpoint: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """发送HTTP POST请求到API（不重试）"""
+        return await self._request("POST", endpoint, data=data, ok_statuses=(200, 201))
+    
+    async def _make_delete_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """发送HTTP DELETE请求到API（不重试）"""
+        return await self._request("DELETE", endpoint, params=params, ok_statuses=(200, 204))
     
     async def create_appointment(self, username: str, customer_name: str, customer_phone: str, 
                                therapist_id: int, appointment_date: str, appointment_time: str,
@@ -110,6 +305,7 @@ class DatabaseAPIService:
         
         try:
             result = await self._make_post_request("/appointments", data)
+            self._invalidate_booking_caches(therapist_id, appointment_date)
             return {
                 "success": True,
                 "data": result,
@@ -172,8 +368,18 @@ class DatabaseAPIService:
         """
         params = {"username": username}
         
+        # 取消前查询预约所属的技师和日期，用于精确失效缓存
+        therapist_id, appointment_date = None, None
+        if self.cache is not None:
+            details = await self.get_appointment_details(appointment_id)
+            if isinstance(details, dict):
+                details = details.get("appointment", details)
+                therapist_id = details.get("therapist_id")
+                appointment_date = details.get("appointment_date")
+        
         try:
             result = await self._make_delete_request(f"/appointments/{appointment_id}", params)
+            self._invalidate_booking_caches(therapist_id, appointment_date)
             return {
                 "success": True,
                 "data": result,
@@ -201,7 +407,7 @@ class DatabaseAPIService:
         params = {"date": date}
         
         try:
-            result = await self._make_get_request(f"/appointments/availability/{therapist_id}", params)
+            result = await self._cached_get("availability", f"/appointments/availability/{therapist_id}", params)
             if isinstance(result, list):
                 return result
             return result.get("available_slots", [])
@@ -209,6 +415,70 @@ class DatabaseAPIService:
             self.logger.error(f"查询技师可用时间失败: {e}")
             return []
     
+    async def query_availability_batch(self, dates: List[str], therapist_ids: Optional[List[int]] = None,
+                                       therapist_name: Optional[str] = None,
+                                       store_name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        批量查询多个技师在多个日期的可用时间
+        
+        Args:
+            dates: 日期列表 (YYYY-MM-DD)
+            therapist_ids: 技师ID列表（可选，未提供时按姓名或门店从技师索引中查找）
+            therapist_name: 技师名称（可选）
+            store_name: 门店名称（可选）
+            
+        Returns:
+            按技师和日期合并的可用时间，单个查询失败不影响其他结果
+        """
+        dates = list(dict.fromkeys(d for d in (dates or []) if d))
+        if not dates:
+            return {"success": False, "error": "缺少查询日期", "results": []}
+        
+        if therapist_ids:
+            therapists = []
+            for therapist_id in dict.fromkeys(therapist_ids):
+                therapist = await self.get_therapist(therapist_id)
+                therapists.append(therapist or {"id": therapist_id})
+        elif therapist_name or store_name:
+            therapists = await self.search_therapists(therapist_name=therapist_name, store_name=store_name)
+            if therapist_name and store_name:
+                store_key = store_name.strip()
+                therapists = [t for t in therapists if store_key in str(t.get("store_name", ""))]
+        else:
+            return {"success": False, "error": "需要提供技师ID、技师名称或门店名称", "results": []}
+        
+        queries = [(t, d) for t in therapists if t.get("id") is not None for d in dates]
+        truncated = len(queries) > self.BATCH_AVAILABILITY_MAX_QUERIES
+        queries = queries[:self.BATCH_AVAILABILITY_MAX_QUERIES]
+        semaphore = asyncio.Semaphore(self.BATCH_AVAILABILITY_CONCURRENCY)
+        
+        async def query(therapist: Dict[str, Any], date: str) -> Dict[str, Any]:
+            item = {
+                "therapist_id": therapist["id"],
+                "therapist_name": therapist.get("name"),
+                "store_name": therapist.get("store_name"),
+                "date": date
+            }
+            async with semaphore:
+                try:
+                    result = await self._cached_get(
+                        "availability", f"/appointments/availability/{therapist['id']}", {"date": date}
+                    )
+                except Exception as e:
+                    self.logger.error(f"批量查询技师 {therapist['id']} {date} 可用时间失败: {e}")
+                    return {**item, "available_slots": [], "error": str(e)}
+            slots = result if isinstance(result, list) else result.get("available_slots", [])
+            return {**item, "available_slots": slots}
+        
+        results = await asyncio.gather(*(query(t, d) for t, d in queries))
+        return {
+            "success": True,
+            "results": results,
+            "available_count": sum(1 for r in results if r["available_slots"]),
+            "failed_count": sum(1 for r in results if "error" in r),
+            "truncated": truncated
+        }
+    
     async def search_therapists(self, therapist_name: Optional[str] = None, 
                                store_name: Optional[str] = None,
                                service_type: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -223,6 +493,15 @@ class DatabaseAPIService:
         Returns:
             技师列表
         """
+        # 只按姓名或只按门店查询时优先走内存索引，索引无结果再请求API
+        if not service_type and bool(therapist_name) != bool(store_name):
+            if therapist_name:
+                matches = await self.therapist_index.find_by_name(therapist_name)
+            else:
+                matches = await self.therapist_index.find_by_store(store_name)
+            if matches:
+                return matches
+        
         params = {"action": "query_schedule"}
         
         if therapist_name:
@@ -233,7 +512,7 @@ class DatabaseAPIService:
             params["service_type"] = service_type
         
         try:
-            result = await self._make_get_request("/therapists", params)
+            result = await self._cached_get("therapists", "/therapists", params)
             
             # 处理新的响应格式
             if isinstance(result, dict) and "therapists" in result:
@@ -265,7 +544,7 @@ class DatabaseAPIService:
         }
         
         try:
-            result = await self._make_get_request("/therapists", params)
+            result = await self._cached_get("schedule", "/therapists", params)
             return result.get("schedules", [])
         except Exception as e:
             self.logger.error(f"查询技师排班失败: {e}")
@@ -279,7 +558,7 @@ class DatabaseAPIService:
             门店列表
         """
         try:
-            result = await self._make_get_request("/stores")
+            result = await self._cached_get("stores", "/stores")
             if isinstance(result, list):
                 return result
             return result.get("stores", [])
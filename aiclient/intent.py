@@ -0,0 +1,307 @@
+"""
+本地意图识别模块
+关键词规则 + 字符n-gram TF-IDF模型识别客户意图，
+营业时间、地址等静态知识类问题直接从知识表回答，无需调用AI；
+预约、排班查询、知识表中没有确定答案的意图以及低置信度的消息交给AI处理
+"""
+
+import re
+import math
+import time
+import sqlite3
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from .reply_cache import normalize_message
+
+try:
+    import numpy as np
+except ImportError:  # numpy已在requirements.txt中声明；未安装时只使用关键词规则
+    np = None
+
+
+logger = logging.getLogger(__name__)
+
+
+class Intent:
+    """客户意图"""
+    HOURS = "hours"
+    ADDRESS = "address"
+    PARKING = "parking"
+    REFUND = "refund"
+    FEMALE_THERAPIST = "female_therapist"
+    INSURANCE = "insurance"
+    BOOKING = "booking"
+    AVAILABILITY = "availability"
+    OTHER = "other"
+
+
+@dataclass
+class KnowledgeEntry:
+    """静态知识表条目"""
+    intent: str
+    answer: Optional[str]  # None表示只识别意图、不直接回答
+    keywords: Tuple[str, ...]
+    examples: Tuple[str, ...] = ()  # 模型训练用的种子样本
+
+
+# 静态知识表，内容与客服提示词中的【基础信息】【预约规则】保持一致
+KNOWLEDGE_TABLE: Dict[str, KnowledgeEntry] = {
+    Intent.HOURS: KnowledgeEntry(
+        intent=Intent.HOURS,
+        answer="您好，我们的营业时间是9:00–21:00，全年无休，仅春节放假。",
+        # 不用单独的“营业”，避免“营业执照”之类的问题被当成营业时间
+        keywords=("营业时间", "几点营业", "周末营业", "还营业", "营业到几点", "开门", "关门", "几点下班",
+                  "开到几点", "春节放假", "节假日上班"),
+        examples=("你们几点开门", "晚上开到几点", "营业时间是多久", "周末营业吗", "过年开门吗",
+                  "节假日上班吗", "早上几点营业", "最晚几点关门")
+    ),
+    Intent.ADDRESS: KnowledgeEntry(
+        intent=Intent.ADDRESS,
+        answer="您好，您可以在大众点评搜索“名医堂”查看门店地址并直接导航，找不到的话我们也可以为您指路。",
+        keywords=("地址", "在哪里", "在哪儿", "怎么走", "怎么去", "位置", "导航", "哪个路"),
+        examples=("店在哪里", "地址发一下", "门店具体位置", "怎么过去", "地铁怎么走", "你们在什么路")
+    ),
+    Intent.PARKING: KnowledgeEntry(
+        intent=Intent.PARKING,
+        # 提示词中的停车信息仍是未填写的模板（免费/收费/周边停车区），没有可核实的答案，交给AI处理
+        answer=None,
+        keywords=("停车", "车位", "停车场", "开车过去"),
+        examples=("能停车吗", "有停车位吗", "停车收费吗", "开车去方便停吗", "附近有停车场吗")
+    ),
+    Intent.REFUND: KnowledgeEntry(
+        intent=Intent.REFUND,
+        answer="您好，团购可以在平台直接申请退款，也可以为您改约其他时间哦。",
+        keywords=("退款", "退钱", "退团购", "退券", "能退", "可以退"),
+        examples=("团购怎么退", "不想去了能退款吗", "买的券可以退吗", "退款流程是什么", "钱能退回来吗")
+    ),
+    Intent.FEMALE_THERAPIST: KnowledgeEntry(
+        intent=Intent.FEMALE_THERAPIST,
+        answer="您好，女技师可以预约的，如果您方便的时间没有女技师，也可以为您推荐同级的男技师。",
+        keywords=("女技师", "女师傅", "女老师", "女的技师", "女生按"),
+        examples=("有女技师吗", "可以安排女师傅吗", "想要女的按摩师", "有没有女老师", "女生给按吗")
+    ),
+    Intent.INSURANCE: KnowledgeEntry(
+        intent=Intent.INSURANCE,
+        answer="您好，我们暂时不支持医保支付哦。",
+        keywords=("医保", "社保卡", "医保卡"),
+        examples=("能刷医保吗", "可以用医保卡吗", "社保卡能用吗", "支持医保支付吗")
+    ),
+}
+
+# 需要查询或写入数据库的意图，必须交给AI处理（优先于静态知识规则）
+LLM_INTENT_RULES: Dict[str, Tuple[str, ...]] = {
+    Intent.BOOKING: ("预约", "预定", "预订", "订个", "约个", "约一下", "改约", "改期", "改时间",
+                     "取消", "确认", "姓名", "电话"),
+    Intent.AVAILABILITY: ("有空", "空位", "排班", "有时间", "几点有", "还有位", "满了", "今天", "明天",
+                          "后天", "周末有", "技师在", "师傅在", "哪个技师", "哪位技师"),
+}
+
+LLM_INTENT_EXAMPLES: Dict[str, Tuple[str, ...]] = {
+    Intent.BOOKING: ("我想预约", "帮我约一个", "预约推拿", "改一下时间", "取消预约", "确认一下",
+                     "帮我订一个位置", "我要约一下"),
+    Intent.AVAILABILITY: ("明天下午有空吗", "今天还有位置吗", "晚上还能约吗", "这周末有空位吗",
+                          "技师在不在", "现在过去要等吗", "哪个技师有时间"),
+    Intent.OTHER: ("好的", "谢谢", "嗯嗯", "收到", "多少钱", "效果怎么样", "按得疼吗", "你好",
+                   "有营业执照吗", "营业执照给看一下"),
+}
+
+
+@dataclass
+class IntentResult:
+    """意图识别结果"""
+    intent: str
+    confidence: float
+    source: str  # rule / model / fallback
+    latency_ms: float = 0.0
+
+    @property
+    def answer(self) -> Optional[str]:
+        """静态知识类意图的回答，其他意图返回None"""
+        entry = KNOWLEDGE_TABLE.get(self.intent)
+        return entry.answer if entry else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "intent": self.intent,
+            "confidence": round(self.confidence, 3),
+            "source": self.source,
+            "latency_ms": round(self.latency_ms, 3)
+        }
+
+
+def _char_ngrams(text: str) -> List[str]:
+    """字符一元与二元特征"""
+    return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+class TfidfIntentModel:
+    """字符n-gram TF-IDF + 类中心余弦相似度的意图模型（需要numpy）"""
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.idf = None
+        self.labels: List[str] = []
+        self.centroids = None
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def fit(self, texts: List[str], labels: List[str]):
+        """训练模型；texts应为已归一化的消息"""
+        if np is None:
+            raise RuntimeError("TF-IDF意图模型需要numpy")
+        documents = [_char_ngrams(text) for text in texts]
+        document_frequency = Counter(gram for doc in documents for gram in set(doc))
+        self.vocabulary = {gram: index for index, gram in enumerate(sorted(document_frequency))}
+        self.idf = np.array([
+            math.log((1 + len(documents)) / (1 + document_frequency[gram])) + 1
+            for gram in sorted(document_frequency)
+        ])
+        matrix = np.vstack([self._vectorize(doc) for doc in documents])
+        self.labels = sorted(set(labels))
+        label_array = np.array(labels)
+        centroids = np.vstack([matrix[label_array == label].mean(axis=0) for label in self.labels])
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        self.centroids = centroids / np.where(norms == 0, 1, norms)
+
+    def _vectorize(self, grams: List[str]):
+        vector = np.zeros(len(self.vocabulary))
+        for gram, count in Counter(grams).items():
+            index = self.vocabulary.get(gram)
+            if index is not None:
+                vector[index] = count
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """返回(意图, 余弦相似度)"""
+        similarities = self.centroids @ self._vectorize(_char_ngrams(text))
+        best = int(np.argmax(similarities))
+        return self.labels[best], float(similarities[best])
+
+
+def seed_examples() -> List[Tuple[str, str]]:
+    """知识表与AI意图的种子训练样本"""
+    samples = []
+    for entry in KNOWLEDGE_TABLE.values():
+        samples.extend((normalize_message(text), entry.intent) for text in entry.examples + entry.keywords)
+    for intent, examples in LLM_INTENT_EXAMPLES.items():
+        samples.extend((normalize_message(text), intent) for text in examples)
+    return samples
+
+
+def load_history_examples(db_path: str, limit: int = 20000) -> List[Tuple[str, str]]:
+    """从聊天历史数据库读取客户消息，用关键词规则弱标注后作为训练样本
+
+    只保留规则能确定意图的消息，其余消息不参与训练。
+    """
+    classifier = IntentClassifier()
+    samples = []
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            rows = conn.execute(
+                "SELECT DISTINCT content FROM messages WHERE role = 'user' LIMIT ?", (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logger.warning(f"[意图识别] 读取训练数据失败 ({db_path}): {e}")
+        return samples
+
+    for (content,) in rows:
+        normalized = normalize_message(content or "")
+        result = classifier.match_rules(normalized)
+        if result is not None:
+            samples.append((normalized, result.intent))
+    logger.info(f"[意图识别] 从 {db_path} 弱标注 {len(samples)}/{len(rows)} 条客户消息")
+    return samples
+
+
+class IntentClassifier:
+    """本地意图分类器
+
+    1. 含数字、过长或命中预约/排班关键词的消息 -> 交给AI
+    2. 恰好命中一个静态知识意图的关键词 -> 规则结果（置信度1.0）
+    3. 其余消息使用TF-IDF模型（numpy可用且已训练时），相似度低于阈值视为低置信度
+    """
+
+    def __init__(self, min_confidence: float = 0.5, max_message_length: int = 40):
+        self.min_confidence = min_confidence
+        self.max_message_length = max_message_length
+        self.model: Optional[TfidfIntentModel] = None
+        self._stats = {"classified": 0, "fast_path": 0, "rule": 0, "model": 0}
+
+    def train(self, db_path: Optional[str] = None) -> bool:
+        """用种子样本（以及可选的历史数据库）训练TF-IDF模型，numpy不可用时返回False"""
+        if np is None:
+            logger.info("[意图识别] 未安装numpy，仅使用关键词规则")
+            return False
+        samples = seed_examples()
+        if db_path:
+            samples.extend(load_history_examples(db_path))
+        model = TfidfIntentModel()
+        model.fit([text for text, _ in samples], [intent for _, intent in samples])
+        self.model = model
+        logger.info(f"[意图识别] 模型训练完成: {len(samples)} 条样本, {len(model.vocabulary)} 个特征")
+        return True
+
+    def match_rules(self, normalized: str) -> Optional[IntentResult]:
+        """关键词规则匹配，无法确定时返回None"""
+        for intent, keywords in LLM_INTENT_RULES.items():
+            if any(keyword in normalized for keyword in keywords):
+                return IntentResult(intent=intent, confidence=1.0, source="rule")
+
+        matched = [
+            entry.intent for entry in KNOWLEDGE_TABLE.values()
+            if any(keyword in normalized for keyword in entry.keywords)
+        ]
+        if len(matched) == 1:
+            return IntentResult(intent=matched[0], confidence=1.0, source="rule")
+        return None
+
+    def classify(self, customer_message: str) -> IntentResult:
+        """识别客户消息的意图"""
+        started = time.perf_counter()
+        result = self._classify(normalize_message(customer_message))
+        result.latency_ms = (time.perf_counter() - started) * 1000
+
+        self._stats["classified"] += 1
+        if result.answer is not None:
+            self._stats["fast_path"] += 1
+            self._stats[result.source] += 1
+        return result
+
+    def _classify(self, normalized: str) -> IntentResult:
+        if not normalized or len(normalized) > self.max_message_length:
+            return IntentResult(intent=Intent.OTHER, confidence=0.0, source="fallback")
+        if re.search(r"\d", normalized):
+            # 数字多为时间、电话等预约信息
+            return IntentResult(intent=Intent.BOOKING, confidence=1.0, source="rule")
+
+        result = self.match_rules(normalized)
+        if result is not None:
+            return result
+
+        if self.model is not None and self.model.is_trained:
+            intent, similarity = self.model.predict(normalized)
+            if similarity >= self.min_confidence:
+                return IntentResult(intent=intent, confidence=similarity, source="model")
+            return IntentResult(intent=Intent.OTHER, confidence=similarity, source="fallback")
+
+        return IntentResult(intent=Intent.OTHER, confidence=0.0, source="fallback")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分类统计"""
+        classified = self._stats["classified"]
+        return {
+            **self._stats,
+            "model_trained": bool(self.model and self.model.is_trained),
+            "fast_path_ratio": round(self._stats["fast_path"] / classified, 3) if classified else 0.0
+        }
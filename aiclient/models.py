@@ -13,6 +13,7 @@ class MessageRole(Enum):
     SYSTEM = "system"
     USER = "user"
     ASSISTANT = "assistant"
+    TOOL = "tool"
 
 
 @dataclass
@@ -21,13 +22,20 @@ class AIMessage:
     role: MessageRole
     content: str
     timestamp: Optional[datetime] = None
+    tool_calls: Optional[List[Dict[str, Any]]] = None  # assistant消息发起的工具调用
+    tool_call_id: Optional[str] = None  # tool消息对应的工具调用ID
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式"""
-        return {
+        data = {
             "role": self.role.value,
             "content": self.content
         }
+        if self.tool_calls:
+            data["tool_calls"] = self.tool_calls
+        if self.tool_call_id:
+            data["tool_call_id"] = self.tool_call_id
+        return data
 
 
 @dataclass
@@ -38,6 +46,8 @@ class AIRequest:
     temperature: Optional[float] = None
     stream: bool = False
     tools: Optional[List[Dict[str, Any]]] = None
+    max_retries: Optional[int] = None  # 覆盖适配器的重试次数，不发送给API
+    estimated_prompt_tokens: Optional[int] = None  # 发送前估算的提示词token数，不发送给API
     
     def to_openai_format(self) -> Dict[str, Any]:
         """转换为OpenAI API格式"""
@@ -65,11 +75,94 @@ class AIResponse:
     usage: Optional[Dict[str, int]] = None
     finish_reason: Optional[str] = None
     tool_calls: Optional[List[Dict[str, Any]]] = None
+    tool_latencies: Optional[List[Dict[str, Any]]] = None  # 每个工具调用的耗时与状态
+    from_cache: bool = False  # 是否来自回复缓存
+    intent: Optional[str] = None  # 本地意图识别直接回答时的意图
+    cached_tokens: Optional[int] = None  # 命中提供商前缀缓存的提示词token数
     timestamp: datetime = None
     
     def __post_init__(self):
         if self.timestamp is None:
             self.timestamp = datetime.now()
+        if self.cached_tokens is None and self.usage:
+            self.cached_tokens = extract_cached_tokens(self.usage)
+
+
+def extract_cached_tokens(usage: Dict[str, Any]) -> Optional[int]:
+    """从usage中提取命中前缀缓存的token数
+    
+    OpenAI/智谱: usage.prompt_tokens_details.cached_tokens
+    Deepseek: usage.prompt_cache_hit_tokens
+    """
+    details = usage.get("prompt_tokens_details") or {}
+    if details.get("cached_tokens") is not None:
+        return details["cached_tokens"]
+    return usage.get("prompt_cache_hit_tokens")
+
+
+@dataclass
+class AIStreamDelta:
+    """流式响应增量片段"""
+    content: str = ""
+    tool_calls: Optional[List[Dict[str, Any]]] = None  # 工具调用增量（带index）
+    finish_reason: Optional[str] = None
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    usage: Optional[Dict[str, int]] = None
+
+
+class AIStreamAccumulator:
+    """将流式增量片段合并为完整的AIResponse"""
+    
+    def __init__(self, model: str = "", provider: str = ""):
+        self.model = model
+        self.provider = provider
+        self.content_parts: List[str] = []
+        self.tool_calls: Dict[int, Dict[str, Any]] = {}
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[Dict[str, int]] = None
+    
+    def add(self, delta: AIStreamDelta):
+        """合并一个增量片段"""
+        if delta.content:
+            self.content_parts.append(delta.content)
+        if delta.model:
+            self.model = delta.model
+        if delta.finish_reason:
+            self.finish_reason = delta.finish_reason
+        if delta.usage:
+            self.usage = delta.usage
+        for tool_delta in delta.tool_calls or []:
+            index = tool_delta.get("index", len(self.tool_calls))
+            tool_call = self.tool_calls.setdefault(index, {
+                "id": "",
+                "type": "function",
+                "function": {"name": "", "arguments": ""}
+            })
+            if tool_delta.get("id"):
+                tool_call["id"] = tool_delta["id"]
+            if tool_delta.get("type"):
+                tool_call["type"] = tool_delta["type"]
+            function = tool_delta.get("function") or {}
+            if function.get("name"):
+                tool_call["function"]["name"] += function["name"]
+            if function.get("arguments"):
+                tool_call["function"]["arguments"] += function["arguments"]
+    
+    @property
+    def content(self) -> str:
+        return "".join(self.content_parts)
+    
+    def to_response(self) -> AIResponse:
+        """生成完整响应"""
+        return AIResponse(
+            content=self.content,
+            model=self.model,
+            provider=self.provider,
+            usage=self.usage,
+            finish_reason=self.finish_reason,
+            tool_calls=[self.tool_calls[i] for i in sorted(self.tool_calls)] or None
+        )
 
 
 @dataclass
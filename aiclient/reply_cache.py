@@ -0,0 +1,121 @@
+"""
+客服回复缓存模块
+对常见的静态问题（营业时间、停车、医保等）按归一化后的客户消息缓存AI回复
+"""
+
+import re
+import time
+import logging
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+from .models import AIResponse
+
+
+logger = logging.getLogger(__name__)
+
+# 句首客套语与句尾语气词，不影响问题语义
+LEADING_FILLERS = ("请问一下", "请问", "麻烦问一下", "问一下", "你好", "您好", "在吗", "老板")
+TRAILING_PARTICLES = "吗呢呀啊吧哦嘛么"
+
+# 出现这些词说明本轮依赖对话上下文或需要查询/写入数据库，不走缓存
+CONTEXT_MARKERS = (
+    "预约", "约", "改", "取消", "确认", "好的", "可以", "是的", "对的", "嗯",
+    "这个", "那个", "这位", "那位", "他", "她", "它", "刚才", "上次", "之前", "还是",
+    "今天", "明天", "后天", "有空", "空位",
+    "技师", "师傅", "老师", "电话", "姓",
+)
+
+
+def normalize_message(text: str) -> str:
+    """归一化客户消息：全角转半角、小写、去除标点空白与客套语"""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).lower()
+    if text.startswith("[客户]"):
+        text = text[len("[客户]"):]
+    text = "".join(
+        ch for ch in text
+        if not ch.isspace() and unicodedata.category(ch)[0] not in ("P", "S")
+    )
+    changed = True
+    while changed:
+        changed = False
+        for filler in LEADING_FILLERS:
+            if text.startswith(filler) and len(text) > len(filler):
+                text = text[len(filler):]
+                changed = True
+    return text.rstrip(TRAILING_PARTICLES) or text
+
+
+def is_cacheable_message(normalized: str, max_length: int = 40) -> bool:
+    """判断归一化后的消息是否是可缓存的独立静态问题"""
+    if not normalized or len(normalized) > max_length:
+        return False
+    if re.search(r"\d", normalized):
+        return False
+    return not any(marker in normalized for marker in CONTEXT_MARKERS)
+
+
+@dataclass
+class _CacheEntry:
+    response: AIResponse
+    expires_at: float
+
+
+class ReplyCache:
+    """LRU + TTL 回复缓存"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, max_message_length: int = 40):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_message_length = max_message_length
+        self._entries: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def make_key(self, customer_message: str, prompt_version: str) -> Optional[Tuple[str, str]]:
+        """生成缓存键；消息不可缓存时返回None并计入bypass"""
+        normalized = normalize_message(customer_message)
+        if not is_cacheable_message(normalized, self.max_message_length):
+            self._stats["bypassed"] += 1
+            return None
+        return (prompt_version, normalized)
+
+    def get(self, key: Tuple[str, str]) -> Optional[AIResponse]:
+        """查询缓存，命中时刷新LRU顺序"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        return entry.response
+
+    def put(self, key: Tuple[str, str], response: AIResponse):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._entries[key] = _CacheEntry(response=response, expires_at=time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        self._stats["stores"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "size": len(self._entries),
+            "hit_ratio": round(self._stats["hits"] / lookups, 3) if lookups else 0.0
+        }
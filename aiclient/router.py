@@ -0,0 +1,182 @@
+"""
+AI提供商路由模块
+基于延迟和错误率的EWMA统计与熔断器选择最健康的提供商
+"""
+
+import time
+import math
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+from .config import AIProvider
+
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState:
+    """熔断器状态"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+@dataclass
+class ProviderHealth:
+    """单个提供商的健康统计"""
+    provider: AIProvider
+    ewma_latency_ms: Optional[float] = None
+    ewma_error_rate: float = 0.0
+    consecutive_failures: int = 0
+    state: str = CircuitState.CLOSED
+    opened_at: Optional[float] = None
+    total_requests: int = 0
+    total_failures: int = 0
+    recent_latencies: deque = field(default_factory=lambda: deque(maxlen=200))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+            "ewma_error_rate": round(self.ewma_error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "state": self.state,
+            "total_requests": self.total_requests,
+            "total_failures": self.total_failures
+        }
+
+
+class ProviderRouter:
+    """健康感知的提供商路由器
+
+    - 每个提供商维护延迟与错误率的EWMA
+    - 连续失败达到阈值时打开熔断器；冷却后进入半开状态，
+      下一次请求成功则关闭熔断器，失败则重新打开
+    - 候选顺序按健康评分排序，评分相同时按静态优先级
+    """
+
+    def __init__(self, providers: List[AIProvider], alpha: float = 0.3,
+                 failure_threshold: int = 3, open_duration: float = 30.0,
+                 error_penalty: float = 4.0):
+        self.priority = list(providers)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+        self.error_penalty = error_penalty
+        self.health: Dict[AIProvider, ProviderHealth] = {
+            provider: ProviderHealth(provider=provider) for provider in providers
+        }
+
+    def sync(self, providers: List[AIProvider]):
+        """同步提供商列表（保留已有统计），列表顺序即静态优先级"""
+        self.priority = list(providers)
+        for provider in providers:
+            if provider not in self.health:
+                self.health[provider] = ProviderHealth(provider=provider)
+        for provider in list(self.health):
+            if provider not in providers:
+                del self.health[provider]
+
+    def _refresh_state(self, health: ProviderHealth, now: float):
+        """熔断器冷却结束后转为半开"""
+        if health.state == CircuitState.OPEN and now - health.opened_at >= self.open_duration:
+            health.state = CircuitState.HALF_OPEN
+            logger.info(f"[路由] {health.provider.value} 熔断冷却结束，进入半开状态")
+
+    def is_available(self, provider: AIProvider) -> bool:
+        """提供商当前是否允许接收请求"""
+        health = self.health.get(provider)
+        if health is None:
+            return False
+        self._refresh_state(health, time.monotonic())
+        return health.state != CircuitState.OPEN
+
+    def score(self, provider: AIProvider) -> float:
+        """健康评分（越小越好）：延迟EWMA按错误率加权"""
+        health = self.health[provider]
+        # 无延迟数据时视为最优，让新提供商也能获得流量
+        latency = health.ewma_latency_ms if health.ewma_latency_ms is not None else 0.0
+        return latency * (1 + self.error_penalty * health.ewma_error_rate) + health.ewma_error_rate * 1000
+
+    def candidates(self, preferred: Optional[AIProvider] = None) -> List[AIProvider]:
+        """按健康程度返回候选提供商列表
+
+        熔断打开的提供商排除在外；若全部熔断，则按最早熔断的顺序返回全部作为兜底。
+        指定的首选提供商只要未熔断就排在最前。
+        """
+        now = time.monotonic()
+        for health in self.health.values():
+            self._refresh_state(health, now)
+
+        available = [p for p in self.priority if self.health[p].state != CircuitState.OPEN]
+        if not available:
+            return sorted(self.priority, key=lambda p: self.health[p].opened_at or 0)
+
+        ordered = sorted(available, key=lambda p: (self.score(p), self.priority.index(p)))
+        if preferred in ordered:
+            ordered.remove(preferred)
+            ordered.insert(0, preferred)
+        return ordered
+
+    def record_success(self, provider: AIProvider, latency_ms: float):
+        """记录一次成功请求"""
+        health = self.health[provider]
+        health.total_requests += 1
+        health.recent_latencies.append(latency_ms)
+        if health.ewma_latency_ms is None:
+            health.ewma_latency_ms = latency_ms
+        else:
+            health.ewma_latency_ms = self.alpha * latency_ms + (1 - self.alpha) * health.ewma_latency_ms
+        health.ewma_error_rate = (1 - self.alpha) * health.ewma_error_rate
+        health.consecutive_failures = 0
+        if health.state != CircuitState.CLOSED:
+            logger.info(f"[路由] {provider.value} 请求成功，熔断器关闭")
+        health.state = CircuitState.CLOSED
+        health.opened_at = None
+
+    def record_latency_lower_bound(self, provider: AIProvider, latency_ms: float):
+        """记录被取消请求已等待的时间（真实延迟至少这么长），不计入成败
+
+        对冲请求胜出时首选请求被取消，若不记录，延迟窗口只剩较快的样本，
+        百分位持续偏低，对冲越发越多
+        """
+        health = self.health[provider]
+        health.recent_latencies.append(latency_ms)
+        if health.ewma_latency_ms is None:
+            health.ewma_latency_ms = latency_ms
+        else:
+            health.ewma_latency_ms = self.alpha * latency_ms + (1 - self.alpha) * health.ewma_latency_ms
+
+    def record_failure(self, provider: AIProvider, latency_ms: Optional[float] = None):
+        """记录一次失败请求，必要时打开熔断器"""
+        health = self.health[provider]
+        health.total_requests += 1
+        health.total_failures += 1
+        health.ewma_error_rate = self.alpha + (1 - self.alpha) * health.ewma_error_rate
+        if latency_ms is not None and health.ewma_latency_ms is not None:
+            health.ewma_latency_ms = self.alpha * latency_ms + (1 - self.alpha) * health.ewma_latency_ms
+        health.consecutive_failures += 1
+
+        if health.state == CircuitState.HALF_OPEN or health.consecutive_failures >= self.failure_threshold:
+            if health.state != CircuitState.OPEN:
+                logger.warning(
+                    f"[路由] {provider.value} 连续失败 {health.consecutive_failures} 次，熔断器打开 "
+                    f"{self.open_duration}秒"
+                )
+            health.state = CircuitState.OPEN
+            health.opened_at = time.monotonic()
+
+    def latency_percentile(self, provider: AIProvider, percentile: float,
+                           min_samples: int = 1) -> Optional[float]:
+        """最近请求延迟的百分位数（毫秒，含被对冲取消请求的下界），样本不足时返回None"""
+        samples = sorted(self.health[provider].recent_latencies)
+        if len(samples) < max(1, min_samples):
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(samples)))
+        return samples[min(rank, len(samples)) - 1]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取所有提供商的健康统计"""
+        return {provider.value: health.to_dict() for provider, health in self.health.items()}
@@ -277,14 +277,8 @@ class EmailNotificationService:
                     "message": "无法确定技师信息"
                 }
             
-            # 通过数据库服务查询技师详细信息
-            therapists = await self.database_service.search_therapists()
-            therapist_info = None
-            
-            for therapist in therapists:
-                if therapist.get("id") == therapist_id:
-                    therapist_info = therapist
-                    break
+            # 通过数据库服务的技师索引查询技师详细信息
+            therapist_info = await self.database_service.get_therapist(therapist_id)
             
             if not therapist_info:
                 return {
@@ -0,0 +1,12 @@
+"""
+本地替身服务
+用于离线测试和性能压测，不依赖外部网络
+"""
+
+from .booking_api import MockBookingAPI, FaultConfig, create_booking_app
+from .llm_api import MockLLMServer, LLMServerConfig, LatencyProfile, ToolRule, create_llm_app
+
+__all__ = [
+    "MockBookingAPI", "FaultConfig", "create_booking_app",
+    "MockLLMServer", "LLMServerConfig", "LatencyProfile", "ToolRule", "create_llm_app"
+]
@@ -0,0 +1,297 @@
+"""
+预约API本地替身
+实现DatabaseAPIService使用的 /stores、/therapists、/appointments、/appointments/availability/{id} 等接口，
+内置种子数据，可配置响应延迟和错误注入。
+
+用法：
+    python -m aiclient.testing.booking_api --port 8765 --latency-ms 50 --error-rate 0.05
+    BOOKING_API_BASE_URL=http://127.0.0.1:8765/api python your_script.py
+"""
+
+import copy
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 营业时间内的整点时段
+BUSINESS_HOURS = [f"{hour:02d}:00" for hour in range(9, 21)]
+
+SEED_STORES = [
+    {"id": 1, "name": "宜山路店", "address": "徐汇区宜山路 100 号", "phone": "021-60000001", "business_hours": "9:00-21:00"},
+    {"id": 2, "name": "静安店", "address": "静安区南京西路 200 号", "phone": "021-60000002", "business_hours": "9:00-21:00"},
+    {"id": 3, "name": "浦东店", "address": "浦东新区世纪大道 300 号", "phone": "021-60000003", "business_hours": "9:00-21:00"},
+]
+
+SEED_THERAPISTS = [
+    {"id": 1, "name": "李明", "gender": "男", "store_id": 1, "phone": "13800000001", "specialties": ["推拿", "颈肩调理"]},
+    {"id": 2, "name": "王芳", "gender": "女", "store_id": 1, "phone": "13800000002", "specialties": ["足疗", "推拿"]},
+    {"id": 3, "name": "张伟", "gender": "男", "store_id": 2, "phone": "13800000003", "specialties": ["正骨", "推拿"]},
+    {"id": 4, "name": "刘洋", "gender": "女", "store_id": 2, "phone": "13800000004", "specialties": ["艾灸", "拔罐"]},
+    {"id": 5, "name": "陈静", "gender": "女", "store_id": 3, "phone": "13800000005", "specialties": ["推拿", "艾灸"]},
+    {"id": 6, "name": "赵强", "gender": "男", "store_id": 3, "phone": "13800000006", "specialties": ["足疗", "刮痧"]},
+]
+
+
+@dataclass
+class FaultConfig:
+    """延迟与错误注入配置"""
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0  # 在latency_ms基础上增加 [0, jitter_ms] 的随机延迟
+    error_rate: float = 0.0  # 随机返回错误的概率
+    error_status: int = 503
+    retry_after: Optional[float] = None  # 错误响应附带的Retry-After（秒）
+    # 按路径前缀覆盖延迟（毫秒），最长前缀优先
+    path_latency_ms: Dict[str, float] = field(default_factory=dict)
+
+
+class BookingStore:
+    """替身服务的内存数据"""
+
+    def __init__(self):
+        self.stores = copy.deepcopy(SEED_STORES)
+        store_names = {s["id"]: s["name"] for s in self.stores}
+        self.therapists = [
+            {**copy.deepcopy(t), "store_name": store_names[t["store_id"]]} for t in SEED_THERAPISTS
+        ]
+        self.appointments: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+
+    def get_therapist(self, therapist_id: Any) -> Optional[Dict[str, Any]]:
+        return next((t for t in self.therapists if str(t["id"]) == str(therapist_id)), None)
+
+    def booked_times(self, therapist_id: Any, day: str) -> set:
+        return {
+            a["appointment_time"] for a in self.appointments.values()
+            if str(a["therapist_id"]) == str(therapist_id) and a["appointment_date"] == day
+            and a["status"] != "cancelled"
+        }
+
+    def available_slots(self, therapist_id: Any, day: str) -> List[Dict[str, Any]]:
+        booked = self.booked_times(therapist_id, day)
+        return [{"time": slot, "duration": 60} for slot in BUSINESS_HOURS if slot not in booked]
+
+    def add_appointment(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        appointment = {
+            "id": self._next_id,
+            "username": data["username"],
+            "customer_name": data["customer_name"],
+            "customer_phone": data["customer_phone"],
+            "therapist_id": int(data["therapist_id"]),
+            "appointment_date": data["appointment_date"],
+            "appointment_time": data["appointment_time"],
+            "service_type": data.get("service_type"),
+            "notes": data.get("notes"),
+            "status": "confirmed",
+            "created_at": datetime.now().isoformat(timespec="seconds")
+        }
+        self.appointments[self._next_id] = appointment
+        self._next_id += 1
+        return appointment
+
+
+def _error(status: int, message: str) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+def create_booking_app(faults: Optional[FaultConfig] = None, seed: int = 0,
+                       store: Optional[BookingStore] = None,
+                       stats: Optional[Counter] = None) -> web.Application:
+    """创建预约API替身应用，路由前缀为 /api；faults可在运行中修改，stats记录按路由的请求次数"""
+    faults = faults or FaultConfig()
+    data = store or BookingStore()
+    rng = random.Random(seed)
+    stats = stats if stats is not None else Counter()
+
+    @web.middleware
+    async def fault_middleware(request: web.Request, handler):
+        resource = request.match_info.route.resource
+        stats[f"{request.method} {resource.canonical if resource else request.path}"] += 1
+        stats["total"] += 1
+        latency = faults.latency_ms
+        matches = [p for p in faults.path_latency_ms if request.path.startswith(p)]
+        if matches:
+            latency = faults.path_latency_ms[max(matches, key=len)]
+        latency += rng.uniform(0, faults.jitter_ms) if faults.jitter_ms else 0.0
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+        if faults.error_rate and rng.random() < faults.error_rate:
+            stats["injected_errors"] += 1
+            headers = {"Retry-After": str(faults.retry_after)} if faults.retry_after is not None else None
+            return web.Response(status=faults.error_status, text="injected error", headers=headers)
+        return await handler(request)
+
+    async def health(request):
+        return web.json_response({"status": "ok"})
+
+    async def stores(request):
+        return web.json_response({"stores": data.stores})
+
+    async def therapists(request):
+        query = request.query
+        technician_id = query.get("technician_id")
+        if technician_id:
+            therapist = data.get_therapist(technician_id)
+            if therapist is None:
+                return _error(404, "技师不存在")
+            start = date.fromisoformat(query.get("start_date", date.today().isoformat()))
+            end = date.fromisoformat(query.get("end_date", start.isoformat()))
+            schedules = []
+            day = start
+            while day <= end and len(schedules) < 31:
+                schedules.append({
+                    "technician_id": therapist["id"],
+                    "date": day.isoformat(),
+                    "start_time": BUSINESS_HOURS[0],
+                    "end_time": "21:00",
+                    "booked": sorted(data.booked_times(therapist["id"], day.isoformat()))
+                })
+                day += timedelta(days=1)
+            return web.json_response({"schedules": schedules})
+
+        results = data.therapists
+        if query.get("therapist_name"):
+            results = [t for t in results if query["therapist_name"] in t["name"]]
+        if query.get("store_name"):
+            results = [t for t in results if query["store_name"] in t["store_name"]]
+        if query.get("service_type"):
+            results = [t for t in results if any(query["service_type"] in s for s in t["specialties"])]
+        return web.json_response({"therapists": results})
+
+    async def availability(request):
+        therapist_id = request.match_info["therapist_id"]
+        if data.get_therapist(therapist_id) is None:
+            return _error(404, "技师不存在")
+        day = request.query.get("date")
+        if not day:
+            return _error(400, "缺少date参数")
+        return web.json_response({
+            "therapist_id": int(therapist_id),
+            "date": day,
+            "available_slots": data.available_slots(therapist_id, day)
+        })
+
+    async def create_appointment(request):
+        try:
+            payload = await request.json()
+        except ValueError:
+            return _error(400, "请求体不是有效的JSON")
+        required = ["username", "customer_name", "customer_phone", "therapist_id",
+                    "appointment_date", "appointment_time"]
+        missing = [name for name in required if not payload.get(name)]
+        if missing:
+            return _error(400, f"缺少字段: {', '.join(missing)}")
+        if data.get_therapist(payload["therapist_id"]) is None:
+            return _error(404, "技师不存在")
+        if payload["appointment_time"] in data.booked_times(payload["therapist_id"], payload["appointment_date"]):
+            return _error(409, "该时间段已被预约")
+        appointment = data.add_appointment(payload)
+        return web.json_response({"appointment_id": appointment["id"], **appointment}, status=201)
+
+    async def user_appointments(request):
+        username = request.match_info["username"]
+        return web.json_response({
+            "appointments": [a for a in data.appointments.values() if a["username"] == username]
+        })
+
+    async def appointment_details(request):
+        appointment = data.appointments.get(int(request.match_info["appointment_id"]))
+        if appointment is None:
+            return _error(404, "预约不存在")
+        return web.json_response(appointment)
+
+    async def cancel_appointment(request):
+        appointment = data.appointments.get(int(request.match_info["appointment_id"]))
+        if appointment is None:
+            return _error(404, "预约不存在")
+        if appointment["username"] != request.query.get("username"):
+            return _error(403, "无权取消该预约")
+        appointment["status"] = "cancelled"
+        return web.json_response({"success": True, "appointment_id": appointment["id"]})
+
+    app = web.Application(middlewares=[fault_middleware])
+    app.router.add_get("/api/health", health)
+    app.router.add_get("/api/stores", stores)
+    app.router.add_get("/api/therapists", therapists)
+    app.router.add_get("/api/appointments/availability/{therapist_id}", availability)
+    app.router.add_get("/api/appointments/user/{username}", user_appointments)
+    app.router.add_post("/api/appointments", create_appointment)
+    app.router.add_get("/api/appointments/{appointment_id:\\d+}", appointment_details)
+    app.router.add_delete("/api/appointments/{appointment_id:\\d+}", cancel_appointment)
+    return app
+
+
+class MockBookingAPI:
+    """在本机端口上运行的预约API替身
+
+        async with MockBookingAPI(FaultConfig(latency_ms=20)) as api:
+            service = DatabaseAPIService(api.base_url)
+    """
+
+    def __init__(self, faults: Optional[FaultConfig] = None, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.faults = faults or FaultConfig()
+        self.store = BookingStore()
+        self.stats: Counter = Counter()  # 按路由统计的请求次数
+        self.app = create_booking_app(self.faults, seed, self.store, self.stats)
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        """DatabaseAPIService可直接使用的base_url"""
+        return f"http://{self.host}:{self.port}/api"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"预约API替身已启动: {self.base_url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="预约API本地替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的固定延迟")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="附加的随机延迟上限")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回错误的概率 (0-1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    faults = FaultConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        error_status=args.error_status, retry_after=args.retry_after
+    )
+    print(f"预约API替身: http://{args.host}:{args.port}/api")
+    web.run_app(create_booking_app(faults, args.seed), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+OpenAI兼容的聊天接口本地替身
+实现 /v1/chat/completions（含SSE流式），按配置的延迟分布和失败率响应，
+请求带工具时按关键词规则返回脚本化的工具调用，收到工具结果后给出最终回复。
+
+用法：
+    python -m aiclient.testing.llm_api --port 8766 --median-ms 800 --sigma 0.5 --failure-rate 0.02
+    OPENAI_API_KEY=mock OPENAI_BASE_URL=http://127.0.0.1:8766/v1 python your_script.py
+"""
+
+import json
+import math
+import time
+import random
+import asyncio
+import logging
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LatencyProfile:
+    """响应延迟分布（毫秒）
+
+    - fixed: 恒为median_ms
+    - uniform: [min_ms, max_ms] 均匀分布
+    - lognormal: 中位数median_ms、对数标准差sigma的对数正态分布（长尾）
+    另以tail_probability的概率额外增加tail_ms，用于模拟偶发的慢请求
+    """
+    distribution: str = "fixed"
+    median_ms: float = 0.0
+    sigma: float = 0.5
+    min_ms: float = 0.0
+    max_ms: float = 0.0
+    tail_probability: float = 0.0
+    tail_ms: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            latency = rng.uniform(self.min_ms, max(self.min_ms, self.max_ms))
+        elif self.distribution == "lognormal":
+            latency = self.median_ms * math.exp(rng.gauss(0, self.sigma)) if self.median_ms > 0 else 0.0
+        else:
+            latency = self.median_ms
+        if self.tail_probability and rng.random() < self.tail_probability:
+            latency += self.tail_ms
+        return max(0.0, latency)
+
+
+@dataclass
+class ToolRule:
+    """客户消息包含任一关键词时调用的工具"""
+    keywords: Tuple[str, ...]
+    function_name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+
+
+def default_tool_rules() -> List[ToolRule]:
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+    return [
+        ToolRule(("门店", "地址在哪", "哪家店"), "get_stores"),
+        ToolRule(("有空", "能约", "可以约", "空位"), "query_availability_batch",
+                 {"dates": [tomorrow], "store_name": "宜山路店"}),
+        ToolRule(("技师",), "search_therapists", {"store_name": "宜山路店"}),
+    ]
+
+
+@dataclass
+class LLMServerConfig:
+    """替身服务的行为配置（运行中可修改）"""
+    model: str = "mock-model"
+    latency: LatencyProfile = field(default_factory=LatencyProfile)
+    failure_rate: float = 0.0
+    failure_status: int = 500
+    retry_after: Optional[float] = None
+    stream_chunk_chars: int = 4  # 流式输出时每个片段的字符数
+    stream_chunk_delay_ms: float = 0.0
+    tool_rules: List[ToolRule] = field(default_factory=default_tool_rules)
+
+
+def _estimate_tokens(messages: List[Dict[str, Any]]) -> int:
+    return sum(len(str(m.get("content") or "")) for m in messages) // 2 + 4 * len(messages)
+
+
+def _last_user_message(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content") or "")
+    return ""
+
+
+def _tool_names(tools: Optional[List[Dict[str, Any]]]) -> set:
+    return {t.get("function", {}).get("name") for t in tools or []}
+
+
+def plan_reply(config: LLMServerConfig, payload: Dict[str, Any],
+               call_counter: int) -> Tuple[str, List[Dict[str, Any]]]:
+    """根据请求决定回复：返回(文本内容, 工具调用列表)"""
+    messages = payload.get("messages") or []
+    # 本轮用户消息之后已有工具结果时，给出最终回复
+    tool_results = []
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            break
+        if message.get("role") == "tool":
+            tool_results.append(message)
+    customer_message = _last_user_message(messages)
+    if tool_results:
+        return f"已为您查询（{len(tool_results)} 项结果），请问还需要什么帮助？", []
+
+    available = _tool_names(payload.get("tools"))
+    for rule in config.tool_rules:
+        if rule.function_name in available and any(k in customer_message for k in rule.keywords):
+            return "", [{
+                "id": f"call_{call_counter}",
+                "type": "function",
+                "function": {"name": rule.function_name, "arguments": json.dumps(rule.arguments, ensure_ascii=False)}
+            }]
+    return f"您好，关于「{customer_message[:20]}」，我们会尽快为您安排。", []
+
+
+def create_llm_app(config: Optional[LLMServerConfig] = None, seed: int = 0,
+                   stats: Optional[Counter] = None) -> web.Application:
+    """创建OpenAI兼容接口替身应用，路由为 /v1/chat/completions"""
+    config = config or LLMServerConfig()
+    rng = random.Random(seed)
+    stats = stats if stats is not None else Counter()
+
+    async def chat_completions(request: web.Request):
+        stats["requests"] += 1
+        payload = await request.json()
+        await asyncio.sleep(config.latency.sample(rng) / 1000)
+
+        if config.failure_rate and rng.random() < config.failure_rate:
+            stats["injected_failures"] += 1
+            headers = {"Retry-After": str(config.retry_after)} if config.retry_after is not None else None
+            return web.json_response({"error": {"message": "injected failure", "type": "server_error"}},
+                                     status=config.failure_status, headers=headers)
+
+        content, tool_calls = plan_reply(config, payload, stats["requests"])
+        if tool_calls:
+            stats["tool_calls"] += len(tool_calls)
+        prompt_tokens = _estimate_tokens(payload.get("messages") or [])
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": max(1, len(content) // 2),
+            "total_tokens": prompt_tokens + max(1, len(content) // 2)
+        }
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        completion_id = f"chatcmpl-mock-{stats['requests']}"
+
+        if not payload.get("stream"):
+            message = {"role": "assistant", "content": content or None}
+            if tool_calls:
+                message["tool_calls"] = tool_calls
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": config.model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+
+        async def send(delta: Dict[str, Any], finish: Optional[str] = None, extra: Optional[Dict] = None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": config.model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                **(extra or {})
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        await send({"role": "assistant", "content": ""})
+        step = max(1, config.stream_chunk_chars)
+        for start in range(0, len(content), step):
+            if config.stream_chunk_delay_ms:
+                await asyncio.sleep(config.stream_chunk_delay_ms / 1000)
+            await send({"content": content[start:start + step]})
+        for index, call in enumerate(tool_calls):
+            # 工具调用分两段发送：先名称，后参数，与真实服务的增量格式一致
+            await send({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                        "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            await send({"tool_calls": [{"index": index, "function": {"arguments": call["function"]["arguments"]}}]})
+        await send({}, finish=finish_reason)
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": config.model,
+                     "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+class MockLLMServer:
+    """在本机端口上运行的OpenAI兼容接口替身
+
+        async with MockLLMServer(LLMServerConfig(latency=LatencyProfile("lognormal", median_ms=300))) as llm:
+            os.environ["OPENAI_BASE_URL"] = llm.base_url
+    """
+
+    def __init__(self, config: Optional[LLMServerConfig] = None, seed: int = 0,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.config = config or LLMServerConfig()
+        self.stats: Counter = Counter()
+        self.app = create_llm_app(self.config, seed, self.stats)
+        self.host = host
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        """可直接用作OPENAI_BASE_URL的地址"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        logger.info(f"LLM接口替身已启动: {self.base_url}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI兼容接口本地替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median-ms", type=float, default=500.0)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--tail-probability", type=float, default=0.0)
+    parser.add_argument("--tail-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = LLMServerConfig(
+        latency=LatencyProfile(args.distribution, median_ms=args.median_ms, sigma=args.sigma,
+                               min_ms=args.median_ms / 2, max_ms=args.median_ms * 1.5,
+                               tail_probability=args.tail_probability, tail_ms=args.tail_ms),
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status
+    )
+    print(f"LLM接口替身: http://{args.host}:{args.port}/v1")
+    web.run_app(create_llm_app(config, args.seed), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+技师索引模块
+在内存中按ID、规范化姓名和门店索引技师名单，查询无需网络请求；
+名单过期后在后台刷新，刷新期间继续使用旧索引
+"""
+
+import re
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from .api_cache import create_background_task
+
+logger = logging.getLogger(__name__)
+
+# 客户常在姓名后附加的称呼
+NAME_SUFFIXES = ("技师", "老师", "师傅")
+
+
+def _normalize_text(text: Optional[str]) -> str:
+    return re.sub(r"\s+", "", str(text or "")).casefold()
+
+
+def normalize_therapist_name(name: Optional[str]) -> str:
+    """去空白、统一大小写并去掉称呼后缀，如 " 李 技师" -> "李" """
+    normalized = _normalize_text(name)
+    for suffix in NAME_SUFFIXES:
+        if normalized.endswith(suffix) and len(normalized) > len(suffix):
+            return normalized[:-len(suffix)]
+    return normalized
+
+
+class TherapistIndex:
+    """技师名单的内存索引
+
+    首次查询时同步加载；超过refresh_interval后查询仍返回当前索引，同时在后台刷新。
+    刷新失败时保留旧索引。同一时间最多一个刷新在进行，并发的查询等待同一次刷新；
+    ID未命中触发的重新加载按上次尝试时间（无论成败）限频，未命中的ID在miss_refresh_interval内直接返回None。
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[List[Dict[str, Any]]]],
+                 refresh_interval: float = 600.0, miss_refresh_interval: float = 30.0):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        # ID未命中时（可能是新入职技师）触发刷新的最小间隔
+        self.miss_refresh_interval = miss_refresh_interval
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._by_name: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_store: Dict[str, List[Dict[str, Any]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None  # 最近一次加载尝试（包括失败）的时间
+        self._missing: Dict[str, float] = {}  # 未命中的ID -> 过期时间
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._stats = {"refreshes": 0, "refresh_failures": 0, "hits": 0, "misses": 0}
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def build(self, therapists: List[Dict[str, Any]]):
+        """由技师名单重建索引（整体替换，查询不会看到半成品）"""
+        by_id, by_name, by_store = {}, {}, {}
+        for therapist in therapists:
+            if not isinstance(therapist, dict):
+                continue
+            if therapist.get("id") is not None:
+                by_id[str(therapist["id"])] = therapist
+            name = normalize_therapist_name(therapist.get("name"))
+            if name:
+                by_name.setdefault(name, []).append(therapist)
+            store = _normalize_text(therapist.get("store_name"))
+            if store:
+                by_store.setdefault(store, []).append(therapist)
+        self._by_id, self._by_name, self._by_store = by_id, by_name, by_store
+        self._missing.clear()
+        self._loaded_at = time.monotonic()
+
+    async def refresh(self) -> bool:
+        """重新加载技师名单，失败时保留旧索引"""
+        self._attempted_at = time.monotonic()
+        try:
+            therapists = await self.loader()
+        except Exception as e:
+            self._stats["refresh_failures"] += 1
+            logger.warning(f"[技师索引] 刷新失败，继续使用旧索引: {e}")
+            return False
+        self.build(therapists)
+        self._stats["refreshes"] += 1
+        logger.info(f"[技师索引] 已加载 {len(self._by_id)} 名技师")
+        return True
+
+    async def ensure_loaded(self):
+        """确保索引可用：未加载时同步加载，过期时后台刷新"""
+        if self._loaded_at is None:
+            await self._refresh_once()
+        elif time.monotonic() - self._loaded_at >= self.refresh_interval:
+            self._schedule_refresh()
+
+    def _schedule_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = create_background_task(self.refresh())
+        return self._refresh_task
+
+    async def _refresh_once(self) -> bool:
+        """等待当前的刷新完成，没有进行中的刷新时发起一次"""
+        # shield: 单个查询被取消时不取消其他查询共享的刷新
+        return await asyncio.shield(self._schedule_refresh())
+
+    async def get(self, therapist_id: Any) -> Optional[Dict[str, Any]]:
+        """按ID查找技师"""
+        await self.ensure_loaded()
+        key = str(therapist_id)
+        therapist = self._by_id.get(key)
+        now = time.monotonic()
+        if therapist is None and self._missing.get(key, 0) <= now and self._loaded_at is not None \
+                and now - (self._attempted_at or 0) >= self.miss_refresh_interval:
+            # 索引已有一段时间，可能缺少新技师，重新加载一次
+            await self._refresh_once()
+            therapist = self._by_id.get(key)
+        if therapist is None:
+            self._remember_miss(key)
+        self._stats["hits" if therapist else "misses"] += 1
+        return therapist
+
+    def _remember_miss(self, key: str):
+        """记录未命中的ID（如模型编造的ID），短时间内不再为它重新加载名单"""
+        now = time.monotonic()
+        if len(self._missing) >= 1024:
+            self._missing = {k: expires for k, expires in self._missing.items() if expires > now}
+            while len(self._missing) >= 1024:
+                del self._missing[next(iter(self._missing))]
+        self._missing[key] = now + self.miss_refresh_interval
+
+    async def find_by_name(self, name: str) -> List[Dict[str, Any]]:
+        """按姓名查找技师：先精确匹配规范化姓名，未命中时按包含关系模糊匹配"""
+        await self.ensure_loaded()
+        key = normalize_therapist_name(name)
+        if not key:
+            return []
+        matches = self._by_name.get(key)
+        if matches is None:
+            matches = [t for indexed, group in self._by_name.items() if key in indexed for t in group]
+        self._stats["hits" if matches else "misses"] += 1
+        return list(matches)
+
+    async def find_by_store(self, store_name: str) -> List[Dict[str, Any]]:
+        """按门店名称查找技师（精确匹配，未命中时按包含关系匹配）"""
+        await self.ensure_loaded()
+        key = _normalize_text(store_name)
+        if not key:
+            return []
+        matches = self._by_store.get(key)
+        if matches is None:
+            matches = [t for indexed, group in self._by_store.items() if key in indexed for t in group]
+        self._stats["hits" if matches else "misses"] += 1
+        return list(matches)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取索引统计"""
+        return {
+            **self._stats,
+            "therapists": len(self._by_id),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at is not None else None
+        }
@@ -0,0 +1,220 @@
+"""
+DatabaseManager的异步门面
+写操作交给专用写线程，排队中的写操作合并到同一个事务中提交（组提交）；
+读操作在只读连接池上执行。事件循环只等待Future，不再直接执行SQLite调用和fsync
+"""
+
+import time
+import queue
+import asyncio
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import DatabaseManager, connect
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[[sqlite3.Connection], Any]
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class AsyncDatabase:
+    """异步数据库访问
+
+    - 写：单个写线程按顺序执行，每批最多max_batch个操作、一次COMMIT；
+      每个操作在自己的SAVEPOINT中执行，失败只回滚该操作
+    - 读：read_connections个线程，每个线程一个只读连接（WAL下读不阻塞写）
+    - SQLite同一时间只允许一个写事务，所以写只用一个线程，靠组提交摊薄fsync；并发只放在读连接池上
+    - 方法的返回值和出错时的默认值与DatabaseManager的同名方法一致
+    """
+
+    def __init__(self, manager: DatabaseManager, read_connections: int = 2,
+                 max_batch: int = 256, commit_window: float = 0.002):
+        self.manager = manager
+        self.db_path = manager.db_path
+        self.max_batch = max(1, max_batch)
+        self.commit_window = commit_window  # 收到第一个写操作后再等待的秒数，用于凑批
+        self._write_queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(max_workers=max(1, read_connections), thread_name_prefix="db-read")
+        self._local = threading.local()
+        self._read_connections: List[sqlite3.Connection] = []
+        self._closed = False
+        self._stats = {"writes": 0, "write_errors": 0, "commits": 0, "max_batch_size": 0, "reads": 0}
+
+    # ---- 写 ----
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+                self._writer.start()
+
+    async def _write(self, op: WriteOp) -> Any:
+        if self._closed:
+            raise RuntimeError("数据库已关闭")
+        self._ensure_writer()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_queue.put((op, future, loop))
+        return await future
+
+    def _writer_loop(self):
+        conn = connect(self.db_path)
+        conn.isolation_level = None  # 手动管理事务
+        try:
+            while True:
+                item = self._write_queue.get()
+                if item is None:
+                    return
+                batch, stop = [item], False
+                deadline = time.monotonic() + self.commit_window
+                while len(batch) < self.max_batch:
+                    try:
+                        timeout = deadline - time.monotonic()
+                        item = self._write_queue.get(timeout=timeout) if timeout > 0 else self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                self._run_batch(conn, batch)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _run_batch(self, conn: sqlite3.Connection, batch: list):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, future, loop in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    result = op(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    results.append((future, loop, None, e))
+                else:
+                    results.append((future, loop, result, None))
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            results = [(future, loop, None, e) for _, future, loop in batch]
+
+        self._stats["commits"] += 1
+        self._stats["writes"] += len(batch)
+        self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(batch))
+        for future, loop, result, error in results:
+            if error is not None:
+                self._stats["write_errors"] += 1
+            try:
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    async def add_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批量去重并插入消息，返回新消息；出错时返回空列表"""
+        def op(conn):
+            new_messages, rows = self.manager._select_new_messages(conn, messages)
+            if rows:
+                self.manager._insert_message_rows(conn, rows)
+            return new_messages
+
+        try:
+            return await self._write(op)
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 批量添加 {len(messages)} 条消息失败: {e}")
+            return []
+
+    async def add_message(self, message: Dict[str, Any]):
+        """将一条消息添加到数据库"""
+        await self.add_messages([message])
+
+    async def save_chat_summary(self, chat_id: str, summary: str, covered_until: Tuple[str, str]):
+        """保存指定聊天的滚动摘要"""
+        try:
+            await self._write(lambda conn: self.manager._upsert_chat_summary(conn, chat_id, summary, covered_until))
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 保存对话摘要失败 (ChatID: {chat_id}): {e}")
+
+    # ---- 读 ----
+
+    def _reader(self) -> DatabaseManager:
+        """当前读线程的只读连接视图"""
+        view = getattr(self._local, "view", None)
+        if view is None:
+            conn = connect(self.db_path, readonly=True)
+            self._read_connections.append(conn)
+            view = self._local.view = self.manager.bind(conn)
+        return view
+
+    async def _read(self, method: str, *args) -> Any:
+        if self._closed:
+            raise RuntimeError("数据库已关闭")
+        self._stats["reads"] += 1
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: getattr(self._reader(), method)(*args))
+
+    async def is_message_processed(self, message_id: str) -> bool:
+        return await self._read("is_message_processed", message_id)
+
+    async def get_chat_history(self, chat_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        return await self._read("get_chat_history", chat_id, limit)
+
+    async def get_messages_after(self, chat_id: str, after: Optional[Tuple[str, str]],
+                                 limit: int) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str]]]:
+        return await self._read("get_messages_after", chat_id, after, limit)
+
+    async def count_messages(self, chat_id: str) -> int:
+        return await self._read("count_messages", chat_id)
+
+    async def count_messages_after(self, chat_id: str, after: Optional[Tuple[str, str]]) -> int:
+        return await self._read("count_messages_after", chat_id, after)
+
+    async def get_chat_summary(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read("get_chat_summary", chat_id)
+
+    # ---- 生命周期 ----
+
+    async def close(self):
+        """等待排队中的写操作提交后停止写线程，关闭读连接"""
+        if self._closed:
+            return
+        self._closed = True
+        await asyncio.to_thread(self._shutdown)
+
+    def _shutdown(self):
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+        self._readers.shutdown(wait=True)
+        for conn in self._read_connections:
+            conn.close()
+        self._read_connections.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取读写统计"""
+        commits = self._stats["commits"]
+        return {
+            **self._stats,
+            "avg_batch_size": round(self._stats["writes"] / commits, 2) if commits else 0.0,
+            "queued_writes": self._write_queue.qsize()
+        }
@@ -0,0 +1,131 @@
+"""
+按聊天串行的后台任务队列
+同一聊天的任务按提交顺序逐个执行，不同聊天的任务由固定数量的worker并发执行，
+WebSocket消息循环只负责提交任务，不再等待AI生成完成
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class ChatWorkQueue:
+    """按chat_id串行、全局限并发的任务队列
+
+    - 同一chat_id同时最多只有一个任务在执行，保证回复顺序和历史记录一致
+    - 全局最多workers个任务并发执行，避免突发流量压垮AI接口
+    - 单个聊天积压超过max_pending_per_chat时丢弃最旧的任务
+    - cancel_running可取消某个聊天正在执行的任务（如客户又发来新消息，旧回复已过期）
+    """
+
+    def __init__(self, workers: int = 4, max_pending_per_chat: int = 20):
+        self.workers = max(1, workers)
+        self.max_pending_per_chat = max(1, max_pending_per_chat)
+        self._pending: Dict[str, Deque[Job]] = {}
+        self._scheduled: Set[str] = set()  # 已在就绪队列中或正在执行的chat_id
+        self._running: Dict[str, asyncio.Task] = {}  # chat_id -> 正在执行的任务
+        self._ready: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0, "cancelled": 0}
+
+    def _ensure_workers(self):
+        """首次提交时在当前事件循环中启动worker"""
+        if self._worker_tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i), name=f"chat-worker-{i}") for i in range(self.workers)
+        ]
+
+    def submit(self, chat_id: str, job: Job):
+        """提交任务，立即返回；job为无参协程函数"""
+        self._ensure_workers()
+        pending = self._pending.setdefault(chat_id, deque())
+        if len(pending) >= self.max_pending_per_chat:
+            pending.popleft()
+            self._stats["dropped"] += 1
+            logger.warning(f"[任务队列] {chat_id}: 积压任务过多，丢弃最早的任务")
+        pending.append(job)
+        self._stats["submitted"] += 1
+        if chat_id not in self._scheduled:
+            self._scheduled.add(chat_id)
+            self._ready.put_nowait(chat_id)
+
+    async def _worker(self, index: int):
+        while True:
+            chat_id = await self._ready.get()
+            pending = self._pending.get(chat_id)
+            job = pending.popleft() if pending else None
+            try:
+                if job is not None:
+                    await self._run_job(chat_id, job)
+            finally:
+                if pending:
+                    # 该聊天还有任务，排到队尾，让其他聊天先执行
+                    self._ready.put_nowait(chat_id)
+                else:
+                    self._pending.pop(chat_id, None)
+                    self._scheduled.discard(chat_id)
+                self._ready.task_done()
+
+    async def _run_job(self, chat_id: str, job: Job):
+        # 任务在独立的Task中执行，单独取消任务时worker不受影响
+        task = asyncio.ensure_future(job())
+        self._running[chat_id] = task
+        try:
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        finally:
+            self._running.pop(chat_id, None)
+        if task.cancelled():
+            self._stats["cancelled"] += 1
+        elif task.exception() is not None:
+            self._stats["failed"] += 1
+            logger.error(f"[任务队列] {chat_id}: 任务执行失败: {task.exception()}", exc_info=task.exception())
+        else:
+            self._stats["completed"] += 1
+
+    def cancel_running(self, chat_id: str) -> bool:
+        """取消该聊天正在执行的任务，排队中的任务不受影响；返回是否有任务被取消"""
+        task = self._running.get(chat_id)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    def pending_count(self, chat_id: Optional[str] = None) -> int:
+        """排队中（未开始执行）的任务数"""
+        if chat_id is not None:
+            return len(self._pending.get(chat_id, ()))
+        return sum(len(p) for p in self._pending.values())
+
+    async def join(self):
+        """等待所有已提交的任务执行完毕"""
+        if self._ready is not None:
+            await self._ready.join()
+
+    async def stop(self):
+        """取消所有worker及正在执行的任务，丢弃排队中的任务"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._pending.clear()
+        self._scheduled.clear()
+        self._ready = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计"""
+        return {
+            **self._stats,
+            "pending": self.pending_count(),
+            "active_chats": len(self._scheduled),
+            "workers": len(self._worker_tasks)
+        }
@@ -0,0 +1,97 @@
+"""
+客户端连接的发送队列
+每个WebSocket连接有独立的有界发送队列和发送任务，单次发送有超时；
+慢客户端只会拖慢自己的队列，不会阻塞消息循环或其他连接
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+
+class ClientConnection:
+    """一个扩展连接的发送端
+
+    - send() 只把消息放入队列，立即返回
+    - 后台任务按顺序发送，单条消息超过send_timeout未发出时认为客户端已卡死，关闭连接让扩展重连
+    - 队列满时丢弃新消息并计数
+    """
+
+    def __init__(self, websocket, send_timeout: float = 5.0, max_queue: int = 100):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.chat_ids = set()  # 该连接负责的聊天
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_queue))
+        self._sender_task: Optional[asyncio.Task] = None
+        self._stats = {"sent": 0, "dropped": 0, "timeouts": 0}
+
+    @property
+    def name(self) -> str:
+        address = getattr(self.websocket, "remote_address", None) or ("?", "?")
+        return f"{address[0]}:{address[1]}"
+
+    @property
+    def is_open(self) -> bool:
+        return self._sender_task is not None and not self._sender_task.done()
+
+    def start(self):
+        if self._sender_task is None:
+            self._sender_task = asyncio.create_task(self._sender(), name=f"sender-{self.name}")
+
+    def send(self, message: Dict[str, Any]) -> bool:
+        """放入发送队列；连接已关闭或队列已满时返回False"""
+        if not self.is_open:
+            self._stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(json.dumps(message, ensure_ascii=False))
+            return True
+        except asyncio.QueueFull:
+            self._stats["dropped"] += 1
+            logger.warning(f"[发送] {self.name}: 发送队列已满，丢弃消息 {message.get('type')}")
+            return False
+
+    async def _sender(self):
+        while True:
+            data = await self._queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send(data), self.send_timeout)
+                self._stats["sent"] += 1
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                logger.warning(f"[发送] {self.name}: 发送超过 {self.send_timeout}s，关闭连接")
+                await self._close_websocket()
+                return
+            except websockets.exceptions.ConnectionClosed:
+                return
+            finally:
+                self._queue.task_done()
+
+    async def _close_websocket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(), self.send_timeout)
+        except Exception as e:
+            logger.debug(f"[发送] {self.name}: 关闭连接失败: {e}")
+
+    async def drain(self):
+        """等待队列中已有的消息发送完毕（发送任务退出时立即返回）"""
+        if not self.is_open:
+            return
+        join_task = asyncio.create_task(self._queue.join())
+        await asyncio.wait({join_task, self._sender_task}, return_when=asyncio.FIRST_COMPLETED)
+        join_task.cancel()
+
+    async def close(self):
+        """停止发送任务，丢弃未发送的消息"""
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+            await asyncio.gather(self._sender_task, return_exceptions=True)
+        self._stats["dropped"] += self._queue.qsize()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self._stats, "queued": self._queue.qsize(), "chats": len(self.chat_ids)}
@@ -24,6 +24,30 @@ class Config:
     PING_INTERVAL = int(os.getenv("PING_INTERVAL", 20))
     PING_TIMEOUT = int(os.getenv("PING_TIMEOUT", 10))
     MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", 10))
+    SEND_TIMEOUT = float(os.getenv("SEND_TIMEOUT", 5))  # 单条消息发送超时（秒），超时后关闭该连接
+    OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", 100))  # 每个连接待发送消息的上限
+    
+    # AI回复配置
+    AI_STREAMING = os.getenv("AI_STREAMING", "true").lower() == "true"
+    AI_WORKERS = int(os.getenv("AI_WORKERS", 4))  # 同时生成回复的聊天数上限
+    AI_MAX_PENDING_PER_CHAT = int(os.getenv("AI_MAX_PENDING_PER_CHAT", 20))
+    # 连发消息去抖：最后一条客户消息后等待的秒数，以及从第一条消息起最多等待的秒数
+    AI_DEBOUNCE_SECONDS = float(os.getenv("AI_DEBOUNCE_SECONDS", 1.5))
+    AI_DEBOUNCE_MAX_SECONDS = float(os.getenv("AI_DEBOUNCE_MAX_SECONDS", 5))
+    
+    # 聊天记录数据库的只读连接数（写操作由单独的写线程组提交）
+    DB_READ_CONNECTIONS = int(os.getenv("DB_READ_CONNECTIONS", 2))
+    # 写线程收到第一个写操作后再等待的秒数，让同一时刻到达的写操作合并到一次提交
+    DB_COMMIT_WINDOW = float(os.getenv("DB_COMMIT_WINDOW", 0.002))
+    
+    # 增量记忆协议：服务器保留游标的聊天数上限
+    MAX_MEMORY_CURSORS = int(os.getenv("MAX_MEMORY_CURSORS", 10000))
+    
+    # 对话滚动摘要配置：未被摘要覆盖的消息达到阈值时，后台把较早的消息合并进摘要
+    SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+    SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", 30))
+    SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", 12))  # 始终以原文发送的最近消息数
+    SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", 60))  # 单次合并的最多消息数
     
     # 大众点评特定配置
     DIANPING_DOMAIN = "dianping.com"
@@ -42,7 +66,16 @@ class Config:
                 "port": cls.WEBSOCKET_PORT,
                 "ping_interval": cls.PING_INTERVAL,
                 "ping_timeout": cls.PING_TIMEOUT,
-                "max_connections": cls.MAX_CONNECTIONS
+                "max_connections": cls.MAX_CONNECTIONS,
+                "send_timeout": cls.SEND_TIMEOUT
+            },
+            "ai": {
+                "streaming": cls.AI_STREAMING,
+                "workers": cls.AI_WORKERS,
+                "debounce_seconds": cls.AI_DEBOUNCE_SECONDS,
+                "summary_enabled": cls.SUMMARY_ENABLED,
+                "summary_trigger_messages": cls.SUMMARY_TRIGGER_MESSAGES,
+                "summary_keep_recent": cls.SUMMARY_KEEP_RECENT
             },
             "logging": {
                 "level": cls.LOG_LEVEL,
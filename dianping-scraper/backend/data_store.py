@@ -0,0 +1,219 @@
+"""
+有界数据存储
+内存中只保留最近的max_entries条数据，超出部分按批写入DATA_STORE_PATH下的gzip压缩追加文件，
+长时间运行时内存占用保持平稳；按data_id查询时先查内存，再只读取布隆过滤器表明可能包含该ID的落盘文件
+"""
+
+import os
+import re
+import gzip
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"^segment-(\d{6})\.jsonl\.gz$")
+
+
+class SegmentFilter:
+    """单个分段的布隆过滤器：大小固定，不存ID本身；可能误判存在，不会误判不存在"""
+
+    BITS_PER_ENTRY = 16
+    HASHES = 6
+
+    def __init__(self, capacity: int):
+        self.bits = max(64, capacity * self.BITS_PER_ENTRY)
+        self._array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, data_id: str):
+        digest = hashlib.blake2b(data_id.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.HASHES))
+
+    def add(self, data_id: str):
+        for position in self._positions(data_id):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, data_id: str) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(data_id))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._array)
+
+
+class DataStore:
+    """内存环形缓冲 + 压缩落盘的数据存储
+
+    - 超过max_entries时把最早的spill_batch条数据写入当前分段文件（一个gzip成员，JSON Lines格式）
+    - 分段文件超过segment_max_bytes或segment_max_entries条后开始写新文件，文件只追加不修改
+    - 写文件在线程中执行，不阻塞事件循环；写入完成前被换出的数据仍可查询
+    - 每个分段一个固定大小的布隆过滤器（条数上限保证误判率），写盘时更新，
+      已有分段在首次写盘或查询时扫描一次；所有过滤器都不包含的ID直接返回None，不读取任何分段
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, spill_batch: Optional[int] = None,
+                 segment_max_bytes: int = 16 * 1024 * 1024, segment_max_entries: int = 8192):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.spill_batch = max(1, spill_batch or self.max_entries // 10)
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_entries = max(1, segment_max_entries)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._spilling: Dict[str, Dict[str, Any]] = {}  # 正在写盘的数据
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._segment_index: Optional[int] = None
+        self._filters: Optional[Dict[int, SegmentFilter]] = None  # 分段序号 -> 布隆过滤器
+        self._segment_count = len(self._segment_indexes())
+        self._stats = {"stored": 0, "spilled": 0, "spill_failures": 0, "disk_lookups": 0, "false_positives": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, data_id: str) -> bool:
+        return data_id in self._entries
+
+    async def put(self, data_id: str, entry: Dict[str, Any]):
+        """保存一条数据，内存超限时把最早的一批数据写盘"""
+        self._entries[data_id] = entry
+        self._entries.move_to_end(data_id)
+        self._stats["stored"] += 1
+        if len(self._entries) > self.max_entries:
+            count = max(self.spill_batch, len(self._entries) - self.max_entries)
+            await self._spill([self._entries.popitem(last=False) for _ in range(min(count, len(self._entries)))])
+
+    async def get(self, data_id: str) -> Optional[Dict[str, Any]]:
+        """按data_id查询：内存 -> 写盘中 -> 过滤器可能包含该ID的落盘文件（从新到旧）"""
+        entry = self._entries.get(data_id)
+        if entry is None:
+            entry = self._spilling.get(data_id)
+        if entry is not None:
+            return entry
+        if self._filters is None:
+            async with self._lock():
+                await self._load_filters()
+        candidates = sorted(
+            (index for index, segment_filter in self._filters.items() if segment_filter.might_contain(data_id)),
+            reverse=True
+        )
+        for index in candidates:
+            self._stats["disk_lookups"] += 1
+            entry = await asyncio.to_thread(self._read_from_segment, index, data_id)
+            if entry is not None:
+                return entry
+            self._stats["false_positives"] += 1
+        return None
+
+    async def flush(self):
+        """把内存中的全部数据写盘（服务器停止时调用）"""
+        if self._entries:
+            batch = list(self._entries.items())
+            self._entries.clear()
+            await self._spill(batch)
+
+    async def _spill(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        if not batch:
+            return
+        for data_id, entry in batch:
+            self._spilling[data_id] = entry
+        try:
+            async with self._lock():
+                await self._load_filters()
+                current = self._filters.get(self._segment_index)
+                if current is not None and current.count >= self.segment_max_entries:
+                    self._segment_index += 1  # 当前分段的过滤器已满，换新文件以保持误判率
+                index = await asyncio.to_thread(self._write_batch, batch)
+                segment_filter = self._filters.setdefault(index, SegmentFilter(self.segment_max_entries))
+                for data_id, _ in batch:
+                    segment_filter.add(data_id)
+                self._segment_count = len(self._filters)
+            self._stats["spilled"] += len(batch)
+        except OSError as e:
+            self._stats["spill_failures"] += 1
+            logger.error(f"[数据存储] 写入 {self.path} 失败，丢弃 {len(batch)} 条数据: {e}")
+        finally:
+            for data_id, _ in batch:
+                self._spilling.pop(data_id, None)
+
+    def _lock(self) -> asyncio.Lock:
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    async def _load_filters(self):
+        """首次需要时扫描已有分段建立过滤器（调用方持有写锁）"""
+        if self._filters is None:
+            self._filters = await asyncio.to_thread(self._scan_segments)
+            self._segment_index = max(self._filters, default=0)
+            self._segment_count = len(self._filters)
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.path, f"segment-{index:06d}.jsonl.gz")
+
+    def _segment_indexes(self) -> List[int]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.path)) if m)
+
+    def _write_batch(self, batch: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """把一批数据作为一个gzip成员追加到当前分段文件，返回分段序号（在线程中执行）"""
+        os.makedirs(self.path, exist_ok=True)
+        if self._segment_index is None:
+            self._segment_index = (self._segment_indexes() or [0])[-1]
+        path = self._segment_path(self._segment_index)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            self._segment_index += 1
+            path = self._segment_path(self._segment_index)
+        lines = "".join(
+            json.dumps({"data_id": data_id, **entry}, ensure_ascii=False) + "\n" for data_id, entry in batch
+        )
+        with open(path, "ab") as f:
+            f.write(gzip.compress(lines.encode("utf-8")))
+        return self._segment_index
+
+    def _read_segment(self, index: int):
+        """逐条读取分段中的记录（在线程中执行）"""
+        with gzip.open(self._segment_path(index), "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _scan_segments(self) -> Dict[int, SegmentFilter]:
+        """扫描已有分段，为每个分段建立布隆过滤器（在线程中执行）"""
+        filters = {}
+        for index in self._segment_indexes():
+            segment_filter = filters[index] = SegmentFilter(self.segment_max_entries)
+            try:
+                for record in self._read_segment(index):
+                    segment_filter.add(str(record.get("data_id")))
+            except (OSError, EOFError, ValueError) as e:
+                logger.warning(f"[数据存储] 读取分段 {index} 失败: {e}")
+        return filters
+
+    def _read_from_segment(self, index: int, data_id: str) -> Optional[Dict[str, Any]]:
+        """在指定分段中查找data_id（在线程中执行）"""
+        found = None
+        try:
+            for record in self._read_segment(index):
+                if record.get("data_id") == data_id:
+                    found = record  # 同一文件中以最后写入的为准
+        except (OSError, EOFError, ValueError) as e:
+            logger.warning(f"[数据存储] 读取分段 {index} 失败: {e}")
+        if found is not None:
+            found.pop("data_id", None)
+        return found
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计（不访问磁盘）"""
+        return {
+            **self._stats,
+            "in_memory": len(self._entries),
+            "max_entries": self.max_entries,
+            "segments": self._segment_count,
+            "filter_bytes": sum(f.nbytes for f in (self._filters or {}).values())
+        }
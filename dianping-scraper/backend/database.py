@@ -4,10 +4,37 @@ import json
 import logging
 import threading
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 单条SQL语句中绑定参数的上限（旧版SQLite默认999）
+MAX_SQL_VARIABLES = 900
+
+# 聊天内消息的排序键（时间戳为空的消息排在最前，与ORDER BY timestamp, id一致）
+SORT_COLUMNS = "COALESCE(timestamp, ''), id"
+
+# 每个连接的参数：WAL下读写互不阻塞，synchronous=NORMAL只在检查点时fsync
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # 约16MB页缓存
+    "PRAGMA mmap_size=134217728",  # 128MB内存映射读取
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def connect(db_path: str, readonly: bool = False) -> sqlite3.Connection:
+    """打开一个应用了统一参数的连接；readonly为True时禁止写入"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
 class DatabaseManager:
     _instance = None
     _lock = threading.Lock()
@@ -25,8 +52,7 @@ class DatabaseManager:
     def _init_db(self):
         """初始化数据库和表"""
         try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = connect(self.db_path)
             cursor = self.conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS messages (
@@ -40,12 +66,53 @@ class DatabaseManager:
                 )
             ''')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_id ON messages (chat_id)')
+            # 每个聊天的滚动摘要：摘要覆盖到排序键为(covered_timestamp, covered_id)的消息（含），
+            # covered_count为保存时边界及之前的消息数，仅供统计
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    chat_id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    covered_count INTEGER NOT NULL,
+                    covered_timestamp TEXT,
+                    covered_id TEXT,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            self._migrate_summary_boundary(cursor)
             self.conn.commit()
             logger.info(f"[数据库] 数据库 '{self.db_path}' 初始化成功")
         except sqlite3.Error as e:
             logger.error(f"[数据库] 数据库初始化失败: {e}")
             raise
 
+    def _migrate_summary_boundary(self, cursor: sqlite3.Cursor):
+        """旧版摘要表只有covered_count：补充边界列，并取第covered_count条消息作为边界"""
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(chat_summaries)")}
+        if "covered_id" in columns:
+            return
+        cursor.execute("ALTER TABLE chat_summaries ADD COLUMN covered_timestamp TEXT")
+        cursor.execute("ALTER TABLE chat_summaries ADD COLUMN covered_id TEXT")
+        for chat_id, covered_count in cursor.execute(
+                "SELECT chat_id, covered_count FROM chat_summaries WHERE covered_count > 0").fetchall():
+            row = cursor.execute(
+                f"SELECT COALESCE(timestamp, ''), id FROM messages WHERE chat_id = ? "
+                f"ORDER BY {SORT_COLUMNS} LIMIT 1 OFFSET ?",
+                (chat_id, covered_count - 1)
+            ).fetchone()
+            if row:
+                cursor.execute(
+                    "UPDATE chat_summaries SET covered_timestamp = ?, covered_id = ? WHERE chat_id = ?",
+                    (row[0], row[1], chat_id)
+                )
+        logger.info("[数据库] 摘要表已迁移为按消息排序键记录覆盖边界")
+
+    def bind(self, conn: sqlite3.Connection) -> "DatabaseManager":
+        """返回使用另一个连接的视图（供其他线程上的读连接复用查询方法）"""
+        view = object.__new__(DatabaseManager)
+        view.__dict__.update(self.__dict__)
+        view.conn = conn
+        return view
+
     def _generate_message_id(self, message: Dict[str, Any]) -> str:
         """
         为消息生成一个确定性的唯一ID。
@@ -73,46 +140,179 @@ class DatabaseManager:
 
     def add_message(self, message: Dict[str, Any]):
         """将一条消息添加到数据库"""
-        message_id = self._generate_message_id(message)
-        if self.is_message_processed(message_id):
-            return
+        self.add_messages([message])
 
-        chat_id = message.get('chatId', 'unknown_chat')
-        role = message.get('role', 'unknown')
-        content = message.get('content', '')
-        timestamp = message.get('timestamp')
-        raw_data = json.dumps(message, ensure_ascii=False)
-
-        try:
-            cursor = self.conn.cursor()
+    def _find_existing_ids(self, conn: sqlite3.Connection, message_ids: List[str]) -> set:
+        """一次查询（按参数上限分块）找出已存在的消息ID"""
+        existing = set()
+        cursor = conn.cursor()
+        for start in range(0, len(message_ids), MAX_SQL_VARIABLES):
+            chunk = message_ids[start:start + MAX_SQL_VARIABLES]
             cursor.execute(
-                "INSERT INTO messages (id, chat_id, role, content, timestamp, raw_data) VALUES (?, ?, ?, ?, ?, ?)",
-                (message_id, chat_id, role, content, timestamp, raw_data)
+                f"SELECT id FROM messages WHERE id IN ({','.join('?' * len(chunk))})", chunk
             )
-            self.conn.commit()
-        except sqlite3.IntegrityError:
-             # 并发情况下可能重复插入，可以安全忽略
-            pass
+            existing.update(row[0] for row in cursor.fetchall())
+        return existing
+
+    def add_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        批量去重并插入消息，返回此前不在数据库中的消息（按原顺序，批内重复的只保留第一条）。
+        每条消息只计算一次ID，已存在的ID一次查询得出，新消息在同一个事务中插入。
+        """
+        try:
+            new_messages, rows = self._select_new_messages(self.conn, messages)
+            if rows:
+                with self.conn:
+                    self._insert_message_rows(self.conn, rows)
         except sqlite3.Error as e:
-            logger.error(f"[数据库] 添加消息失败 (ID: {message_id}): {e}")
+            logger.error(f"[数据库] 批量添加 {len(messages)} 条消息失败: {e}")
+            return []
+        return new_messages
+
+    def _select_new_messages(self, conn: sqlite3.Connection,
+                             messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[tuple]]:
+        """找出不在数据库中的消息，返回(新消息, 待插入的行)；出错时抛出sqlite3.Error"""
+        if not messages:
+            return [], []
+        ids = [self._generate_message_id(message) for message in messages]
+        existing = self._find_existing_ids(conn, list(dict.fromkeys(ids)))
+
+        new_messages, rows = [], []
+        for message_id, message in zip(ids, messages):
+            if message_id in existing:
+                continue
+            existing.add(message_id)
+            new_messages.append(message)
+            rows.append((
+                message_id,
+                message.get('chatId', 'unknown_chat'),
+                message.get('role', 'unknown'),
+                message.get('content', ''),
+                message.get('timestamp'),
+                json.dumps(message, ensure_ascii=False)
+            ))
+        return new_messages, rows
+
+    @staticmethod
+    def _insert_message_rows(conn: sqlite3.Connection, rows: List[tuple]):
+        conn.executemany(
+            "INSERT OR IGNORE INTO messages (id, chat_id, role, content, timestamp, raw_data) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
 
     def get_chat_history(self, chat_id: str, limit: int = 50) -> List[Dict[str, Any]]:
-        """获取指定聊天的历史记录"""
+        """获取指定聊天最近的limit条历史记录（按时间正序）"""
         history = []
         try:
             cursor = self.conn.cursor()
-            # 按时间戳和ID排序，确保顺序
+            # 按时间戳和ID倒序取最近的记录，再还原为正序
             cursor.execute(
-                "SELECT raw_data FROM messages WHERE chat_id = ? ORDER BY timestamp, id LIMIT ?",
+                "SELECT raw_data FROM messages WHERE chat_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
                 (chat_id, limit)
             )
             rows = cursor.fetchall()
-            for row in rows:
+            for row in reversed(rows):
                 history.append(json.loads(row['raw_data']))
         except sqlite3.Error as e:
             logger.error(f"[数据库] 获取聊天历史失败 (ChatID: {chat_id}): {e}")
         return history
 
+    def get_messages_after(self, chat_id: str, after: Optional[Tuple[str, str]],
+                           limit: int) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str]]]:
+        """按时间正序获取排序键在after之后的最多limit条消息，返回(消息, 最后一条的排序键)"""
+        messages, last_key = [], None
+        condition, params = "", [chat_id]
+        if after:
+            condition = f" AND ({SORT_COLUMNS}) > (?, ?)"
+            params.extend(after)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"SELECT COALESCE(timestamp, '') AS sort_ts, id, raw_data FROM messages "
+                f"WHERE chat_id = ?{condition} ORDER BY {SORT_COLUMNS} LIMIT ?",
+                (*params, limit)
+            )
+            for row in cursor.fetchall():
+                messages.append(json.loads(row['raw_data']))
+                last_key = (row['sort_ts'], row['id'])
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 获取边界后的消息失败 (ChatID: {chat_id}): {e}")
+            return [], None
+        return messages, last_key
+
+    def count_messages_after(self, chat_id: str, after: Optional[Tuple[str, str]]) -> int:
+        """获取指定聊天中排序键在after之后的消息数（after为None时为全部消息数）"""
+        if not after:
+            return self.count_messages(chat_id)
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                f"SELECT COUNT(*) FROM messages WHERE chat_id = ? AND ({SORT_COLUMNS}) > (?, ?)",
+                (chat_id, *after)
+            )
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 统计消息数失败 (ChatID: {chat_id}): {e}")
+            return 0
+
+    def count_messages(self, chat_id: str) -> int:
+        """获取指定聊天的消息总数"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,))
+            return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 统计消息数失败 (ChatID: {chat_id}): {e}")
+            return 0
+
+    def get_chat_summary(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """获取指定聊天的滚动摘要，covered_until为已覆盖的最后一条消息的排序键"""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT summary, covered_count, covered_timestamp, covered_id, updated_at "
+                "FROM chat_summaries WHERE chat_id = ?",
+                (chat_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            summary = dict(row)
+            covered_timestamp, covered_id = summary.pop("covered_timestamp"), summary.pop("covered_id")
+            summary["covered_until"] = (covered_timestamp, covered_id) if covered_id is not None else None
+            return summary
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 获取对话摘要失败 (ChatID: {chat_id}): {e}")
+            return None
+
+    def save_chat_summary(self, chat_id: str, summary: str, covered_until: Tuple[str, str]):
+        """保存指定聊天的滚动摘要，covered_until为摘要覆盖的最后一条消息的排序键"""
+        try:
+            with self.conn:
+                self._upsert_chat_summary(self.conn, chat_id, summary, covered_until)
+        except sqlite3.Error as e:
+            logger.error(f"[数据库] 保存对话摘要失败 (ChatID: {chat_id}): {e}")
+
+    @staticmethod
+    def _upsert_chat_summary(conn: sqlite3.Connection, chat_id: str, summary: str,
+                             covered_until: Tuple[str, str]):
+        covered_timestamp, covered_id = covered_until
+        conn.execute(
+            f"""
+            INSERT INTO chat_summaries (chat_id, summary, covered_count, covered_timestamp, covered_id, updated_at)
+            VALUES (?, ?, (SELECT COUNT(*) FROM messages WHERE chat_id = ? AND ({SORT_COLUMNS}) <= (?, ?)),
+                    ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(chat_id) DO UPDATE SET
+                summary = excluded.summary,
+                covered_count = excluded.covered_count,
+                covered_timestamp = excluded.covered_timestamp,
+                covered_id = excluded.covered_id,
+                updated_at = excluded.updated_at
+            """,
+            (chat_id, summary, chat_id, covered_timestamp, covered_id, covered_timestamp, covered_id)
+        )
+
     def close(self):
         """关闭数据库连接"""
         if self.conn:
@@ -10,13 +10,18 @@ import websockets
 import json
 import logging
 from datetime import datetime
-from typing import Set, Dict, Any, List
+from typing import Set, Dict, Any, List, Optional, Tuple
 import signal
 import sys
 import os
 
 # 导入新的数据库管理器
 from database import db_manager
+from async_database import AsyncDatabase
+from config import Config
+from chat_work_queue import ChatWorkQueue
+from client_connection import ClientConnection
+from data_store import DataStore
 
 # 添加AI客户端路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
@@ -48,8 +53,29 @@ class DianpingWebSocketServer:
         self.host = host
         self.port = port
         self.clients: Set[websockets.WebSocketServerProtocol] = set()
-        self.data_store: Dict[str, Any] = {}
+        self.connections: Dict[Any, ClientConnection] = {}  # websocket -> 发送队列
+        self.chat_owners: Dict[str, ClientConnection] = {}  # chat_id -> 负责该聊天的连接
+        # 最近的数据保留在内存中，超出MAX_DATA_ENTRIES的部分压缩写入DATA_STORE_PATH
+        self.data_store = DataStore(Config.DATA_STORE_PATH, max_entries=Config.MAX_DATA_ENTRIES)
+        # 聊天记录的读写在写线程和只读连接池上执行，不阻塞事件循环
+        self.history_db = AsyncDatabase(
+            db_manager, read_connections=Config.DB_READ_CONNECTIONS, commit_window=Config.DB_COMMIT_WINDOW
+        )
         self.ai_client = AIClient()
+        self._summary_tasks: Dict[str, asyncio.Task] = {}  # chat_id -> 后台摘要刷新任务
+        # AI回复在后台生成：同一聊天串行，不同聊天并发，消息循环不被阻塞
+        self.reply_queue = ChatWorkQueue(
+            workers=Config.AI_WORKERS, max_pending_per_chat=Config.AI_MAX_PENDING_PER_CHAT
+        )
+        # 连发消息合并：chat_id -> 尚未得到回复的客户消息、去抖定时器、首条消息到达时间
+        self._pending_customer_messages: Dict[str, List[str]] = {}
+        self._debounce_handles: Dict[str, asyncio.TimerHandle] = {}
+        self._debounce_started_at: Dict[str, float] = {}
+        # chat_id -> 客户消息版本号，生成期间版本变化说明回复已过期
+        self._reply_versions: Dict[str, int] = {}
+        self._reply_drafts: Dict[str, int] = {}  # 已向扩展推送过流式草稿的聊天 -> 生成版本
+        # 增量记忆协议：chat_id -> (扩展会话ID, 已处理的最大序号)
+        self._memory_cursors: Dict[str, Tuple[str, int]] = {}
         self.server = None
         self.is_stopping = False
         
@@ -63,8 +89,12 @@ class DianpingWebSocketServer:
     async def register_client(self, websocket):
         """注册新客户端连接"""
         self.clients.add(websocket)
-        client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        logger.info(f"[连接] 客户端: {client_info}")
+        connection = ClientConnection(
+            websocket, send_timeout=Config.SEND_TIMEOUT, max_queue=Config.OUTBOUND_QUEUE_SIZE
+        )
+        connection.start()
+        self.connections[websocket] = connection
+        logger.info(f"[连接] 客户端: {connection.name}")
         logger.info(f"[状态] 当前连接数: {len(self.clients)}")
         
         welcome_msg = {
@@ -72,21 +102,57 @@ class DianpingWebSocketServer:
             "message": "连接成功! 大众点评数据提取服务已就绪",
             "timestamp": datetime.now().isoformat()
         }
-        await websocket.send(json.dumps(welcome_msg, ensure_ascii=False))
+        connection.send(welcome_msg)
 
     async def unregister_client(self, websocket):
         """注销客户端连接"""
         self.clients.discard(websocket)
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            await connection.close()
+            for chat_id in connection.chat_ids:
+                if self.chat_owners.get(chat_id) is connection:
+                    del self.chat_owners[chat_id]
         client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
         logger.info(f"[断开] 客户端: {client_info}")
         logger.info(f"[状态] 当前连接数: {len(self.clients)}")
 
+    def _send(self, websocket, message: Dict[str, Any]) -> bool:
+        """通过该连接的发送队列发送消息，不等待发送完成"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        return connection.send(message)
+
+    def _track_chat_owner(self, websocket, data: Any):
+        """从memory_update和chat_context_switch中记录聊天由哪个连接负责，AI回复只发给该连接"""
+        if not isinstance(data, dict):
+            return
+        payload = data.get("payload") or {}
+        if data.get("type") == "memory_update":
+            chat_id = self._safe_get_value(payload.get("chatId"), "default_chat")
+        elif data.get("type") == "chat_context_switch":
+            chat_id = payload.get("newChatId")
+        else:
+            return
+        connection = self.connections.get(websocket)
+        if not chat_id or connection is None:
+            return
+        previous = self.chat_owners.get(chat_id)
+        if previous is not connection:
+            if previous is not None:
+                previous.chat_ids.discard(chat_id)
+                logger.info(f"[连接] 聊天 {chat_id} 改由 {connection.name} 负责")
+            self.chat_owners[chat_id] = connection
+            connection.chat_ids.add(chat_id)
+
     async def handle_message(self, websocket, message: str):
         """处理来自客户端的消息"""
         try:
             data = json.loads(message)
             timestamp = datetime.now().isoformat()
             
+            self._track_chat_owner(websocket, data)
             response = None
             if isinstance(data, list):
                 logger.info(f"[消息] 收到数据数组 (共 {len(data)} 条)")
@@ -101,14 +167,14 @@ class DianpingWebSocketServer:
             
             if response:
                 response["timestamp"] = datetime.now().isoformat()
-                await websocket.send(json.dumps(response, ensure_ascii=False))
+                self._send(websocket, response)
                 
         except json.JSONDecodeError as e:
             logger.error(f"[错误] JSON解析错误: {e}")
-            await websocket.send(json.dumps({"type": "error", "message": "JSON格式错误"}, ensure_ascii=False))
+            self._send(websocket, {"type": "error", "message": "JSON格式错误"})
         except Exception as e:
             logger.error(f"[错误] 消息处理错误: {e}", exc_info=True)
-            await websocket.send(json.dumps({"type": "error", "message": "服务器内部错误"}, ensure_ascii=False))
+            self._send(websocket, {"type": "error", "message": "服务器内部错误"})
 
     async def process_message_by_type(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """根据消息类型处理数据"""
@@ -122,6 +188,8 @@ class DianpingWebSocketServer:
             return await self.handle_chat_context_switch(data, timestamp)
         elif msg_type == "memory_update":
             return await self.handle_memory_update(data, timestamp)
+        elif msg_type == "get_data":
+            return await self.handle_get_data(data, timestamp)
         else:
             logger.warning(f"⚠️ 未知消息类型: {msg_type}")
             return {"type": "error", "message": f"未知的消息类型: {msg_type}"}
@@ -130,19 +198,29 @@ class DianpingWebSocketServer:
         """处理数据列表 (通常是历史消息)，现在主要用于记录"""
         logger.info(f"[数据] 提取到 {len(data_list)} 条数据 (此路径不再触发AI)")
         data_id = f"dianping_list_{timestamp}"
-        self.data_store[data_id] = {
+        await self.data_store.put(data_id, {
             "content": data_list, "timestamp": timestamp, "type": "dianping_data_list"
-        }
+        })
         return {"type": "data_received", "message": f"数据列表已接收 ({len(data_list)}条)", "data_id": data_id}
 
     async def handle_dianping_data(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """处理通用的大众点评数据对象"""
         content = data.get("payload", {})
         data_id = f"dianping_{timestamp}"
-        self.data_store[data_id] = {"content": content, "timestamp": timestamp, "type": "dianping_data_object"}
+        await self.data_store.put(data_id, {"content": content, "timestamp": timestamp, "type": "dianping_data_object"})
         logger.info(f"[数据] 存储数据对象: {data_id}")
         return {"type": "data_received", "message": "大众点评数据已接收", "data_id": data_id}
 
+    async def handle_get_data(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
+        """按data_id查询已接收的数据（包括已写入磁盘的数据）"""
+        data_id = (data.get("payload") or {}).get("data_id")
+        if not data_id:
+            return {"type": "error", "message": "缺少data_id"}
+        entry = await self.data_store.get(data_id)
+        if entry is None:
+            return {"type": "error", "message": f"数据不存在: {data_id}"}
+        return {"type": "data", "data_id": data_id, "entry": entry}
+
     async def handle_chat_context_switch(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """处理聊天对象切换 - 简化版，仅记录日志"""
         payload = data.get("payload", {})
@@ -154,79 +232,317 @@ class DianpingWebSocketServer:
     async def handle_memory_update(self, data: Dict[str, Any], timestamp: str) -> Dict[str, Any]:
         """
         使用数据库处理记忆更新，识别新消息并触发AI。
-        这是目前系统的核心AI触发器。
+        这是目前系统的核心AI触发器：新消息入库后立即确认，AI回复放入该聊天的后台队列生成并异步推送。
+
+        支持两种格式：
+        - 完整快照：conversationMemory 为扩展当前的全部记忆
+        - 增量：messages 只包含序号大于 baseSeq（服务器上次确认的游标）的消息
+        带 session 和序号的更新会在响应中返回新的 memoryCursor；服务器无法确认增量是否连续时返回 memory_resync，
+        扩展随后重发完整快照
         """
         payload = data.get("payload", {})
         chat_id = self._safe_get_value(payload.get("chatId"), "default_chat")
         contact_name = self._safe_get_value(payload.get("contactName"), "未知用户")
-        conversation_memory = payload.get("conversationMemory", [])
+        session = payload.get("session")
 
+        if "messages" in payload:
+            if self._needs_memory_resync(chat_id, session, payload):
+                logger.info(f"[记忆处理] {contact_name}: 增量不连续，请求完整快照")
+                return {"type": "memory_resync", "chatId": chat_id, "session": session, "message": "请发送完整记忆"}
+            conversation_memory = payload.get("messages") or []
+        else:
+            conversation_memory = payload.get("conversationMemory", [])
+        # 游标之前的消息已处理过，无需再计算ID和查询数据库
+        conversation_memory = self._skip_seen_messages(chat_id, session, conversation_memory)
+
+        response = await self._process_memory_messages(chat_id, contact_name, conversation_memory)
+        cursor = self._advance_memory_cursor(chat_id, session, conversation_memory)
+        if cursor is not None:
+            response.update({"chatId": chat_id, "session": session, "memoryCursor": cursor})
+        return response
+
+    def _memory_cursor(self, chat_id: str, session: Optional[str]) -> Optional[int]:
+        """该聊天在同一扩展会话下已处理的最大序号；会话不同（如页面刷新）时为None"""
+        known = self._memory_cursors.get(chat_id)
+        if session is None or known is None or known[0] != session:
+            return None
+        return known[1]
+
+    def _needs_memory_resync(self, chat_id: str, session: Optional[str], payload: Dict[str, Any]) -> bool:
+        """增量之前有未收到的消息，或服务器不知道扩展已确认的游标（如服务器重启）时需要完整快照"""
+        cursor = self._memory_cursor(chat_id, session)
+        if cursor is None:
+            return int(payload.get("baseSeq") or 0) > 0
+        seqs = [m.get("seq") for m in payload.get("messages") or [] if isinstance(m.get("seq"), int)]
+        return bool(seqs) and min(seqs) > cursor + 1
+
+    def _skip_seen_messages(self, chat_id: str, session: Optional[str],
+                            messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        cursor = self._memory_cursor(chat_id, session)
+        if cursor is None:
+            return messages
+        return [m for m in messages if not isinstance(m.get("seq"), int) or m["seq"] > cursor]
+
+    def _advance_memory_cursor(self, chat_id: str, session: Optional[str],
+                               messages: List[Dict[str, Any]]) -> Optional[int]:
+        """消息处理完成后推进游标，返回新游标；旧版扩展不带session时返回None"""
+        if session is None:
+            return None
+        seqs = [m["seq"] for m in messages if isinstance(m.get("seq"), int)]
+        cursor = max([self._memory_cursor(chat_id, session) or 0] + seqs)
+        self._memory_cursors.pop(chat_id, None)
+        self._memory_cursors[chat_id] = (session, cursor)
+        if len(self._memory_cursors) > Config.MAX_MEMORY_CURSORS:
+            # 丢弃最久未更新的聊天，其下次增量会触发一次完整快照
+            self._memory_cursors.pop(next(iter(self._memory_cursors)))
+        return cursor
+
+    async def _process_memory_messages(self, chat_id: str, contact_name: str,
+                                       conversation_memory: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """识别并存储新消息，有新的客户消息时排队生成AI回复"""
         if not conversation_memory:
             return { "type": "memory_ack", "message": "空记忆，无需更新" }
 
         logger.info(f"[记忆处理] 收到 {contact_name} ({chat_id}) 的 {len(conversation_memory)} 条记忆")
 
-        new_messages = []
         for message in conversation_memory:
             message['chatId'] = message.get('chatId', chat_id)
             message['contactName'] = message.get('contactName', contact_name)
-            
-            message_id = db_manager._generate_message_id(message)
-            
-            if not db_manager.is_message_processed(message_id):
-                new_messages.append(message)
+
+        # 一次查询去重、一个事务插入
+        new_messages = await self.history_db.add_messages(conversation_memory)
 
         if not new_messages:
             logger.info(f"[记忆处理] {contact_name}: 无新消息")
             return { "type": "memory_ack", "message": "无新消息" }
 
-        logger.info(f"[记忆处理] {contact_name}: 检测到 {len(new_messages)} 条新消息，将存入数据库")
+        logger.info(f"[记忆处理] {contact_name}: 检测到 {len(new_messages)} 条新消息，已存入数据库")
         for msg in new_messages:
-            db_manager.add_message(msg)
             logger.info(f"  -> [新消息] Role: {msg.get('role', 'N/A')}, Content: '{str(msg.get('content', ''))[:50]}...'")
 
-        new_customer_messages = [m for m in new_messages if m.get("role") == "user"]
+        # 只回复最后一条商家消息之后的客户消息：首次同步的完整快照中已被回复过的旧消息不再合并进提示词
+        new_customer_messages = []
+        for m in new_messages:
+            if m.get("role") == "user":
+                new_customer_messages.append(m)
+            else:
+                new_customer_messages = []
 
         if not new_customer_messages:
-            logger.info(f"[AI触发] {contact_name}: 新消息中无客户消息，不触发AI")
+            logger.info(f"[AI触发] {contact_name}: 新消息中无待回复的客户消息，不触发AI")
             return { "type": "memory_updated", "new_messages_count": len(new_messages) }
 
-        latest_customer_message = new_customer_messages[-1]
-        message_content = latest_customer_message.get("content", "")
-        
+        message_content = new_customer_messages[-1].get("content", "")
         logger.info(f"[AI触发] {contact_name}: 基于新消息 '{message_content[:50]}...' 触发AI")
+        self._queue_customer_messages(chat_id, contact_name, [m.get("content", "") for m in new_customer_messages])
+        return { "type": "memory_updated_and_ai_queued", "new_messages_count": len(new_messages) }
 
-        full_history = db_manager.get_chat_history(chat_id, limit=50)
-        logger.info(f"[AI触发] 为AI加载了 {len(full_history)} 条来自数据库的历史记录")
+    def _queue_customer_messages(self, chat_id: str, contact_name: str, contents: List[str]):
+        """
+        记录待回复的客户消息并（重新）开始去抖计时：
+        窗口内连发的消息合并为一次生成；正在生成的旧回复已过期，立即取消。
+        """
+        self._pending_customer_messages.setdefault(chat_id, []).extend(contents)
+        self._reply_versions[chat_id] = self._reply_versions.get(chat_id, 0) + 1
+        if self.reply_queue.cancel_running(chat_id):
+            logger.info(f"[AI触发] {contact_name}: 客户发来新消息，已取消正在生成的回复")
+
+        handle = self._debounce_handles.pop(chat_id, None)
+        if handle:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        started_at = self._debounce_started_at.setdefault(chat_id, loop.time())
+        # 客户持续发送时最多等待AI_DEBOUNCE_MAX_SECONDS
+        delay = min(Config.AI_DEBOUNCE_SECONDS, started_at + Config.AI_DEBOUNCE_MAX_SECONDS - loop.time())
+        if delay > 0:
+            self._debounce_handles[chat_id] = loop.call_later(delay, self._submit_reply, chat_id, contact_name)
+        else:
+            self._submit_reply(chat_id, contact_name)
 
-        try:
-            ai_response = await self.ai_client.generate_customer_service_reply(
-                customer_message=message_content,
-                conversation_history=full_history
-            )
+    def _submit_reply(self, chat_id: str, contact_name: str):
+        """去抖结束，把该聊天的回复生成放入后台队列"""
+        self._debounce_handles.pop(chat_id, None)
+        self._debounce_started_at.pop(chat_id, None)
+        self.reply_queue.submit(chat_id, lambda: self._generate_and_deliver_reply(chat_id, contact_name))
+
+    async def _generate_and_deliver_reply(self, chat_id: str, contact_name: str):
+        """
+        在后台为该聊天所有待回复的客户消息生成一条回复并推送给扩展。
+        历史在执行时加载，包含同一聊天之前已生成的回复；生成期间又有新消息时丢弃结果，由下一次生成合并回复。
+        """
+        customer_messages = list(self._pending_customer_messages.get(chat_id, []))
+        if not customer_messages:
+            return
+        version = self._reply_versions.get(chat_id)
+        message_content = "\n".join(customer_messages)
+        if len(customer_messages) > 1:
+            logger.info(f"[AI触发] {contact_name}: 合并 {len(customer_messages)} 条连发消息生成一次回复")
+
+        full_history = await self.history_db.get_chat_history(chat_id, limit=50)
+        conversation_summary, full_history = await self._apply_chat_summary(chat_id, full_history)
+        logger.info(
+            f"[AI触发] 为AI加载了 {len(full_history)} 条来自数据库的历史记录"
+            f"{'（附带滚动摘要）' if conversation_summary else ''}"
+        )
 
-            if ai_response and ai_response.content:
-                ai_response_text = ai_response.content
+        try:
+            if Config.AI_STREAMING:
+                ai_response_text = await self._stream_ai_reply(
+                    chat_id, contact_name, message_content, full_history, conversation_summary, version
+                )
+            else:
+                ai_response = await self.ai_client.generate_customer_service_reply(
+                    customer_message=message_content,
+                    conversation_history=full_history,
+                    conversation_summary=conversation_summary
+                )
+                ai_response_text = ai_response.content if ai_response else ""
+
+            if self._reply_versions.get(chat_id) != version:
+                logger.info(f"[AI回复] {contact_name}: 生成期间收到新消息，丢弃过期回复")
+                self._clear_reply_draft(chat_id, version, "stale")
+                return
+            self._consume_pending_messages(chat_id, len(customer_messages))
+
+            if ai_response_text:
                 logger.info(f"[AI回复] {contact_name}: {ai_response_text[:100]}...")
                 ai_reply_message = {
                     "type": "ai_reply", "chatId": chat_id, "contactName": contact_name,
                     "reply": ai_response_text, "timestamp": datetime.now().isoformat()
                 }
-                await self._broadcast_ai_reply(ai_reply_message)
+                self._reply_drafts.pop(chat_id, None)
+                self._send_ai_reply(ai_reply_message)
                 
                 db_message = {
                     "chatId": chat_id, "contactName": contact_name, "role": "assistant",
                     "content": ai_response_text, "timestamp": ai_reply_message["timestamp"]
                 }
-                db_manager.add_message(db_message)
+                await self.history_db.add_message(db_message)
                 logger.info(f"[数据库] 已存储AI对 {contact_name} 的回复")
             else:
                 logger.warning(f"[AI回复] {contact_name}: AI未返回有效回复")
+                self._clear_reply_draft(chat_id, version, "empty")
 
+        except asyncio.CancelledError:
+            self._clear_reply_draft(chat_id, version, "cancelled")
+            raise
         except Exception as e:
             logger.error(f"[AI触发] 调用AI时发生错误 for {contact_name}: {e}", exc_info=True)
+            self._clear_reply_draft(chat_id, version, "error")
+            if self._reply_versions.get(chat_id) == version:
+                self._consume_pending_messages(chat_id, len(customer_messages))
+
+        await self._schedule_summary_refresh(chat_id)
+
+    def _clear_reply_draft(self, chat_id: str, version: int, reason: str):
+        """该版本的流式草稿不会再有最终回复（取消、过期或出错），通知扩展清空草稿和输入框"""
+        if self._reply_drafts.get(chat_id) != version:
+            return
+        del self._reply_drafts[chat_id]
+        self._send_to_chat(chat_id, {
+            "type": "ai_reply_cancel", "chatId": chat_id, "version": version, "reason": reason
+        })
+        logger.info(f"[AI流式] {chat_id}: 草稿已作废（{reason}），通知扩展清空")
+
+    def _consume_pending_messages(self, chat_id: str, count: int):
+        """移除已得到回复的客户消息"""
+        remaining = self._pending_customer_messages.get(chat_id, [])[count:]
+        if remaining:
+            self._pending_customer_messages[chat_id] = remaining
+        else:
+            self._pending_customer_messages.pop(chat_id, None)
+
+    async def _apply_chat_summary(self, chat_id: str, history: List[Dict[str, Any]]):
+        """有滚动摘要时只保留摘要未覆盖的近期消息，返回(摘要文本, 历史)"""
+        if not Config.SUMMARY_ENABLED:
+            return None, history
+        summary = await self.history_db.get_chat_summary(chat_id)
+        if not summary:
+            return None, history
+        # 历史按同一排序键取最近的消息，边界之后的消息正好是末尾的uncovered条
+        uncovered = await self.history_db.count_messages_after(chat_id, summary["covered_until"])
+        if uncovered < len(history):
+            history = history[-uncovered:] if uncovered > 0 else []
+        return summary["summary"], history
+
+    async def _schedule_summary_refresh(self, chat_id: str):
+        """未被摘要覆盖的消息达到阈值时，在后台刷新滚动摘要，不阻塞回复"""
+        if not Config.SUMMARY_ENABLED or chat_id in self._summary_tasks:
+            return
+        summary = await self.history_db.get_chat_summary(chat_id)
+        covered_until = summary["covered_until"] if summary else None
+        if await self.history_db.count_messages_after(chat_id, covered_until) < Config.SUMMARY_TRIGGER_MESSAGES:
+            return
+        if chat_id in self._summary_tasks:  # 查询期间可能已有刷新任务启动
+            return
+        task = asyncio.create_task(self._refresh_chat_summary(chat_id))
+        self._summary_tasks[chat_id] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(chat_id, None))
 
-        return { "type": "memory_updated_and_ai_triggered", "new_messages_count": len(new_messages) }
+    async def _refresh_chat_summary(self, chat_id: str):
+        """把较早的、未被覆盖的消息合并进该聊天的滚动摘要（最近的消息保留原文）"""
+        try:
+            summary = await self.history_db.get_chat_summary(chat_id)
+            covered_until = summary["covered_until"] if summary else None
+            count = min(
+                await self.history_db.count_messages_after(chat_id, covered_until) - Config.SUMMARY_KEEP_RECENT,
+                Config.SUMMARY_MAX_BATCH
+            )
+            if count <= 0:
+                return
+            turns, last_key = await self.history_db.get_messages_after(chat_id, covered_until, count)
+            if not turns:
+                return
+            new_summary = await self.ai_client.update_conversation_summary(
+                summary["summary"] if summary else None, turns
+            )
+            if new_summary:
+                # 边界记为最后一条已摘要消息的排序键，之后补录的更早消息不会让边界前后的消息错位
+                await self.history_db.save_chat_summary(chat_id, new_summary, last_key)
+                logger.info(f"[对话摘要] {chat_id}: 摘要新覆盖 {len(turns)} 条消息，边界 {last_key}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"[对话摘要] {chat_id}: 刷新失败: {e}")
+
+    async def _stream_ai_reply(self, chat_id: str, contact_name: str,
+                               customer_message: str, history: List[Dict[str, Any]],
+                               conversation_summary: str = None, version: int = None) -> str:
+        """
+        流式生成AI回复，边生成边推送 ai_reply_delta，返回最后一轮的回复文本。
+        片段带上生成版本，扩展据此忽略已被新一轮生成取代的迟到片段；
+        调用工具之前的文字（如“我查一下”）不属于最终回复，下一轮开始时seq从0重新计数，扩展据此重置草稿。
+        """
+        parts = []
+        tool_round = False
+        first_delta = True
+        started_at = asyncio.get_running_loop().time()
+        async for delta in self.ai_client.stream_customer_service_reply(
+            customer_message=customer_message,
+            conversation_history=history,
+            conversation_summary=conversation_summary
+        ):
+            if delta.tool_calls or delta.finish_reason == "tool_calls":
+                tool_round = True
+            if not delta.content:
+                continue
+            if tool_round:
+                parts, tool_round = [], False  # 工具执行完毕，开始新一轮回复
+            if first_delta:
+                elapsed_ms = (asyncio.get_running_loop().time() - started_at) * 1000
+                logger.info(f"[AI流式] {contact_name}: 首个片段耗时 {elapsed_ms:.0f}ms")
+                first_delta = False
+            self._send_to_chat(chat_id, {
+                "type": "ai_reply_delta",
+                "chatId": chat_id,
+                "contactName": contact_name,
+                "seq": len(parts),
+                "version": version,
+                "delta": delta.content
+            })
+            self._reply_drafts[chat_id] = version
+            parts.append(delta.content)
+        return "".join(parts)
 
     async def handle_client(self, websocket):
         """主循环，处理单个客户端的所有通信"""
@@ -245,23 +561,23 @@ class DianpingWebSocketServer:
         logger.info(f"🚀 服务器已启动，监听于 ws://{self.host}:{self.port}")
         await self.server.wait_closed()
 
-    async def _broadcast_ai_reply(self, ai_response: Dict[str, Any]):
-        """向所有客户端广播AI回复"""
+    def _send_ai_reply(self, ai_response: Dict[str, Any]):
+        """把AI回复发送给负责该聊天的客户端"""
         message_to_send = {
             "type": "sendAIReply",
+            "chatId": ai_response.get("chatId"),
             "text": ai_response.get("reply", "")
         }
-        logger.info(f"[广播] AI回复指令已发送: {message_to_send['text'][:50]}...")
-        
-        disconnected_clients = []
-        for client in self.clients:
-            try:
-                await client.send(json.dumps(message_to_send, ensure_ascii=False))
-            except websockets.exceptions.ConnectionClosed:
-                disconnected_clients.append(client)
-        
-        for client in disconnected_clients:
-            await self.unregister_client(client)
+        if self._send_to_chat(message_to_send["chatId"], message_to_send):
+            logger.info(f"[发送] AI回复指令已发送: {message_to_send['text'][:50]}...")
+
+    def _send_to_chat(self, chat_id: str, message_to_send: Dict[str, Any]) -> bool:
+        """只发送给负责该聊天的连接，避免回复被输入到其他店铺的聊天窗口"""
+        connection = self.chat_owners.get(chat_id)
+        if connection is None:
+            logger.warning(f"[发送] 聊天 {chat_id} 没有对应的连接，丢弃消息 {message_to_send.get('type')}")
+            return False
+        return connection.send(message_to_send)
             
     async def stop(self):
         """优雅地停止服务器"""
@@ -272,6 +588,18 @@ class DianpingWebSocketServer:
         if self.server:
             self.server.close()
             await self.server.wait_closed()
+        for handle in self._debounce_handles.values():
+            handle.cancel()
+        self._debounce_handles.clear()
+        await self.reply_queue.stop()
+        for websocket in list(self.connections):
+            await self.unregister_client(websocket)
+        for task in list(self._summary_tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._summary_tasks.values(), return_exceptions=True)
+        await self.data_store.flush()
+        await self.ai_client.close()
+        await self.history_db.close()
         db_manager.close()
         logger.info("服务器已成功关闭")
 
@@ -28,7 +28,51 @@ function connectWebSocket() {
         console.log('[Background] 收到服务器消息:', event.data);
         try {
             const command = JSON.parse(event.data);
-            if (command.type === 'sendAIReply' && command.text) {
+            if (command.type === 'ai_reply_delta' && command.delta) {
+                // 流式片段：转发到活跃Tab，提前把草稿写入输入框
+                chrome.tabs.query({ active: true, url: "*://*.dianping.com/*" }, (tabs) => {
+                    if (tabs.length > 0) {
+                        chrome.tabs.sendMessage(tabs[0].id, {
+                            type: 'aiReplyDelta',
+                            chatId: command.chatId,
+                            seq: command.seq,
+                            version: command.version,
+                            delta: command.delta
+                        }, () => {
+                            if (chrome.runtime.lastError) {
+                                console.error('[Background] 转发AI回复片段失败:', chrome.runtime.lastError.message);
+                            }
+                        });
+                    }
+                });
+            } else if (command.type === 'ai_reply_cancel') {
+                // 流式草稿作废（生成被取消、过期或出错）：通知活跃Tab清空草稿
+                chrome.tabs.query({ active: true, url: "*://*.dianping.com/*" }, (tabs) => {
+                    if (tabs.length > 0) {
+                        chrome.tabs.sendMessage(tabs[0].id, {
+                            type: 'aiReplyCancel',
+                            chatId: command.chatId,
+                            version: command.version
+                        }, () => {
+                            if (chrome.runtime.lastError) {
+                                console.error('[Background] 转发草稿作废通知失败:', chrome.runtime.lastError.message);
+                            }
+                        });
+                    }
+                });
+            } else if (command.memoryCursor !== undefined || command.type === 'memory_resync') {
+                // 记忆游标确认/快照请求：按session区分，转发给所有大众点评页面
+                const forward = command.type === 'memory_resync'
+                    ? { type: 'memoryResync', chatId: command.chatId, session: command.session }
+                    : { type: 'memoryAck', chatId: command.chatId, session: command.session, cursor: command.memoryCursor };
+                chrome.tabs.query({ url: "*://*.dianping.com/*" }, (tabs) => {
+                    tabs.forEach(tab => chrome.tabs.sendMessage(tab.id, forward, () => {
+                        if (chrome.runtime.lastError) {
+                            console.warn('[Background] 转发记忆确认失败:', chrome.runtime.lastError.message);
+                        }
+                    }));
+                });
+            } else if (command.type === 'sendAIReply' && command.text) {
                 console.log(`[Background] 收到AI回复指令，准备发送: "${command.text}"`);
                 // Find the active Dianping tab and send the message to it
                 chrome.tabs.query({ active: true, url: "*://*.dianping.com/*" }, (tabs) => {
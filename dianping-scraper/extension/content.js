@@ -25,6 +25,17 @@
             this.conversationMemory = []; // 当前对话记忆
             this.isMemoryEnabled = true;
 
+            // 增量记忆协议：每条记忆带按聊天递增的序号，只发送服务器尚未确认的记忆
+            this.memorySession = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 8)}`;
+            this.memorySeq = {}; // chatId -> 已分配的最大序号
+            this.memoryAckedSeq = {}; // chatId -> 服务器确认的游标
+
+            // 流式AI回复草稿
+            this.replyDraft = { chatId: null, version: null, parts: [] };
+            this.draftVersionFloor = {}; // chatId -> 仍然有效的最小生成版本，更早版本的迟到片段被忽略
+            this.isTypingDraft = false;
+            this.pendingDraftText = null;
+
             this.selectors = {
                 chatMessageList: '.text-message.normal-text, .rich-message, .text-message.shop-text',
                 tuanInfo: '.tuan',
@@ -101,6 +112,22 @@
                             .then(result => sendResponse(result))
                             .catch(error => sendResponse({ status: 'failed', message: error.message }));
                         break;
+                    case 'aiReplyDelta':
+                        this.updateReplyDraft(request.chatId, request.seq, request.delta, request.version);
+                        sendResponse({ status: 'received' });
+                        break;
+                    case 'aiReplyCancel':
+                        this.clearReplyDraft(request.chatId, request.version);
+                        sendResponse({ status: 'received' });
+                        break;
+                    case 'memoryAck':
+                        this.handleMemoryAck(request.chatId, request.session, request.cursor);
+                        sendResponse({ status: 'received' });
+                        break;
+                    case 'memoryResync':
+                        this.handleMemoryResync(request.chatId, request.session);
+                        sendResponse({ status: 'received' });
+                        break;
                     case 'sendAIReply':
                         this.sendAIReply(request.text)
                              .then(result => sendResponse(result))
@@ -171,9 +198,56 @@
             });
         }
 
+        // 收到流式片段后更新输入框中的草稿（不发送）
+        updateReplyDraft(chatId, seq, delta, version) {
+            if (version !== undefined && version < (this.draftVersionFloor[chatId] || 0)) {
+                return; // 已被新一轮生成取代的迟到片段
+            }
+            if (version !== undefined) {
+                this.draftVersionFloor[chatId] = version;
+            }
+            if (this.replyDraft.chatId !== chatId || this.replyDraft.version !== version || seq === 0) {
+                this.replyDraft = { chatId: chatId, version: version, parts: [] };
+            }
+            this.replyDraft.parts[seq] = delta;
+            this.typeDraft(this.replyDraft.parts.join(''));
+        }
+
+        // 服务器通知该版本的草稿作废：清空草稿和输入框，并忽略该版本之后到达的片段
+        clearReplyDraft(chatId, version) {
+            this.draftVersionFloor[chatId] = Math.max(this.draftVersionFloor[chatId] || 0, version + 1);
+            if (this.replyDraft.chatId !== chatId || this.replyDraft.version > version) {
+                return;
+            }
+            this.replyDraft = { chatId: null, version: null, parts: [] };
+            this.pendingDraftText = null;
+            this.typeDraft('');
+        }
+
+        // 串行写入草稿：写入过程中到达的新片段只保留最新文本
+        typeDraft(text) {
+            if (this.isTypingDraft) {
+                this.pendingDraftText = text;
+                return;
+            }
+            this.isTypingDraft = true;
+            this._executeInjectedScript({ action: 'typeDraft', text: text })
+                .catch(error => console.warn('[ContentScript] 写入草稿失败:', error.message))
+                .finally(() => {
+                    this.isTypingDraft = false;
+                    if (this.pendingDraftText !== null) {
+                        const nextText = this.pendingDraftText;
+                        this.pendingDraftText = null;
+                        this.typeDraft(nextText);
+                    }
+                });
+        }
+
         // New function to handle sending AI replies
         sendAIReply(replyText) {
             console.log(`[ContentScript] Received request to send AI reply: "${replyText}"`);
+            this.replyDraft = { chatId: null, version: null, parts: [] };
+            this.pendingDraftText = null;
             
             // 将AI回复添加到记忆中
             const aiReplyData = {
@@ -464,12 +538,7 @@
             if (!this.isMemoryEnabled || !messageData) return;
             
             // 添加到本地记忆
-            this.conversationMemory.push({
-                role: messageData.messageType === 'customer' ? 'user' : 'assistant',
-                content: messageData.originalContent,
-                timestamp: messageData.timestamp,
-                messageId: messageData.id
-            });
+            this.conversationMemory.push(this.createMemoryItem(messageData));
             
             // 限制记忆长度，保留最近的20条消息
             if (this.conversationMemory.length > 20) {
@@ -695,12 +764,7 @@
             if (!this.isMemoryEnabled || !messageData) return;
             
             // 添加到本地记忆
-            this.conversationMemory.push({
-                role: messageData.messageType === 'customer' ? 'user' : 'assistant',
-                content: messageData.originalContent,
-                timestamp: messageData.timestamp,
-                messageId: messageData.id
-            });
+            this.conversationMemory.push(this.createMemoryItem(messageData));
             
             // 限制记忆长度，保留最近的20条消息
             if (this.conversationMemory.length > 20) {
@@ -713,7 +777,22 @@
             this.sendMemoryUpdate(messageData);
         }
 
+        createMemoryItem(messageData) {
+            const chatId = this.currentChatId;
+            this.memorySeq[chatId] = (this.memorySeq[chatId] || 0) + 1;
+            return {
+                role: messageData.messageType === 'customer' ? 'user' : 'assistant',
+                content: messageData.originalContent,
+                timestamp: messageData.timestamp,
+                messageId: messageData.id,
+                seq: this.memorySeq[chatId]
+            };
+        }
+
+        // 增量更新：只发送序号大于服务器游标的记忆（包括之前未确认的）
         sendMemoryUpdate(messageData) {
+            const chatId = this.currentChatId;
+            const baseSeq = this.memoryAckedSeq[chatId] || 0;
             try {
                 chrome.runtime.sendMessage({
                     type: 'extractedData',
@@ -721,16 +800,54 @@
                         type: 'memory_update',
                         payload: {
                             action: 'add_message',
+                            chatId: chatId,
+                            contactName: this.currentContactName,
+                            session: this.memorySession,
+                            baseSeq: baseSeq,
+                            messages: this.conversationMemory.filter(item => item.seq > baseSeq),
+                            timestamp: Date.now()
+                        }
+                    }
+                });
+            } catch (error) {
+                console.error('[记忆] 发送记忆更新错误:', error);
+            }
+        }
+
+        // 完整快照：服务器无法确认增量是否连续时重发全部记忆
+        sendMemorySnapshot() {
+            try {
+                chrome.runtime.sendMessage({
+                    type: 'extractedData',
+                    data: {
+                        type: 'memory_update',
+                        payload: {
+                            action: 'resync',
                             chatId: this.currentChatId,
                             contactName: this.currentContactName,
-                            message: messageData,
+                            session: this.memorySession,
                             conversationMemory: this.conversationMemory.slice(), // 发送当前记忆的副本
                             timestamp: Date.now()
                         }
                     }
                 });
+                console.log(`[记忆] 已发送完整记忆快照 (${this.conversationMemory.length}条): ${this.currentContactName}`);
             } catch (error) {
-                console.error('[记忆] 发送记忆更新错误:', error);
+                console.error('[记忆] 发送记忆快照错误:', error);
+            }
+        }
+
+        handleMemoryAck(chatId, session, cursor) {
+            if (session !== this.memorySession || typeof cursor !== 'number') return;
+            this.memoryAckedSeq[chatId] = Math.max(this.memoryAckedSeq[chatId] || 0, cursor);
+        }
+
+        handleMemoryResync(chatId, session) {
+            if (session !== this.memorySession) return;
+            this.memoryAckedSeq[chatId] = 0;
+            // 只有当前聊天的记忆还在本地，其他聊天在下次更新时重新同步
+            if (chatId === this.currentChatId) {
+                this.sendMemorySnapshot();
             }
         }
         
@@ -22,6 +22,8 @@
         console.log('[Injector] Executing task:', task);
         if (task.action === 'testAndSend') {
             performSend(task.text);
+        } else if (task.action === 'typeDraft') {
+            typeDraft(task.text);
         } else {
             reportResult('failed', `Unknown task action: ${task.action}`);
         }
@@ -87,6 +89,26 @@
         }
     }
 
+    // 只写入输入框，不点击发送（用于流式回复草稿）
+    function typeDraft(text) {
+        const iframes = document.querySelectorAll('iframe');
+        for (let i = 0; i < iframes.length; i++) {
+            try {
+                const doc = iframes[i].contentDocument;
+                if (!doc) continue;
+
+                const inputBox = doc.querySelector('pre[data-placeholder="请输入你要回复顾客的内容"].dzim-chat-input-container');
+                if (!inputBox) continue;
+
+                inputBox.textContent = text;
+                inputBox.dispatchEvent(new Event('input', { bubbles: true }));
+                reportResult('success', 'Draft updated.');
+                return;
+            } catch (e) { /* ignore */ }
+        }
+        reportResult('failed', 'Could not find the input box.');
+    }
+
     function findSendButton(doc) {
         const allButtons = doc.querySelectorAll('button.dzim-button.dzim-button-primary');
         for (const btn of allButtons) {
@@ -0,0 +1,150 @@
+"""
+客服回复端到端压测
+在本机启动OpenAI兼容接口替身和预约API替身，以固定并发驱动 AIClient.generate_customer_service_reply，
+输出 p50/p95/p99 延迟、吞吐（请求/秒）、错误数以及路由/对冲统计。延迟分布和失败率可调，结果可复现。
+
+用法:
+    python examples/benchmark_customer_service.py --requests 200 --concurrency 20 --median-ms 300 --sigma 0.6
+    # 首选提供商失败10%，观察回退到备用提供商
+    python examples/benchmark_customer_service.py --failure-rate 0.1 --fallback
+    # 首选提供商5%的请求额外慢2秒，观察对冲请求
+    python examples/benchmark_customer_service.py --tail-probability 0.05 --tail-ms 2000 --fallback --hedging
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiclient.testing import MockBookingAPI, FaultConfig, MockLLMServer, LLMServerConfig, LatencyProfile
+
+
+# 覆盖闲聊、门店、预约时间和技师问题，后三类会触发工具调用
+CUSTOMER_MESSAGES = [
+    "你好，我肩膀很酸，推拿能缓解吗",
+    "你们有哪些门店",
+    "明天晚上有空的技师吗",
+    "宜山路店有哪些技师",
+    "第一次去需要注意什么",
+    "腰不好做什么项目比较好",
+    "明天下午可以约吗",
+    "按完会不会疼",
+]
+
+# 带一轮历史，使请求附带工具列表（无历史的请求不带工具）
+CONVERSATION_HISTORY = [
+    {"role": "user", "content": "你好"},
+    {"role": "assistant", "content": "您好，请问有什么可以帮您？"},
+]
+
+
+def percentile(samples, p):
+    """最近秩法百分位"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+async def run_benchmark(args):
+    primary = LLMServerConfig(
+        latency=LatencyProfile(args.distribution, median_ms=args.median_ms, sigma=args.sigma,
+                               min_ms=args.median_ms / 2, max_ms=args.median_ms * 1.5,
+                               tail_probability=args.tail_probability, tail_ms=args.tail_ms),
+        failure_rate=args.failure_rate
+    )
+    secondary = LLMServerConfig(latency=LatencyProfile(args.distribution, median_ms=args.median_ms,
+                                                       sigma=args.sigma, min_ms=args.median_ms / 2,
+                                                       max_ms=args.median_ms * 1.5))
+
+    async with MockLLMServer(primary, seed=args.seed) as llm, \
+            MockLLMServer(secondary, seed=args.seed + 1) as fallback_llm, \
+            MockBookingAPI(FaultConfig(latency_ms=args.booking_latency_ms), seed=args.seed) as booking:
+        # AIConfig在创建时读取环境变量；空字符串会禁用对应提供商（不被.env覆盖）
+        os.environ.update({
+            "OPENAI_API_KEY": "mock-key",
+            "OPENAI_BASE_URL": llm.base_url,
+            "OPENAI_MODEL": "mock-model",
+            "DEEPSEEK_API_KEY": "mock-key" if args.fallback else "",
+            "DEEPSEEK_BASE_URL": fallback_llm.base_url,
+            "ZHIPU_API_KEY": "",
+            "BOOKING_API_BASE_URL": booking.base_url,
+            "AI_REPLY_CACHE": "true" if args.with_caches else "false",
+            "AI_INTENT_FAST_PATH": "true" if args.with_caches else "false",
+            "AI_HEDGING": "true" if args.hedging else "false",
+        })
+        from aiclient import AIClient
+
+        latencies, errors, providers = [], Counter(), Counter()
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(CUSTOMER_MESSAGES[i % len(CUSTOMER_MESSAGES)])
+
+        async with AIClient() as client:
+            async def worker():
+                while True:
+                    try:
+                        message = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    started_at = time.perf_counter()
+                    try:
+                        response = await client.generate_customer_service_reply(
+                            message, conversation_history=CONVERSATION_HISTORY
+                        )
+                        providers[response.provider] += 1
+                    except Exception as e:
+                        errors[type(e).__name__] += 1
+                        continue
+                    latencies.append((time.perf_counter() - started_at) * 1000)
+
+            wall_started_at = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            wall_seconds = time.perf_counter() - wall_started_at
+            status = client.get_status()
+
+    print(f"\n请求: {args.requests}  并发: {args.concurrency}  "
+          f"延迟分布: {args.distribution} median={args.median_ms}ms sigma={args.sigma}  "
+          f"失败率: {args.failure_rate}")
+    print(f"成功: {len(latencies)}  失败: {sum(errors.values())} {dict(errors) if errors else ''}")
+    print(f"吞吐: {len(latencies) / wall_seconds:.1f} 请求/秒  总耗时: {wall_seconds:.2f}s")
+    print(f"延迟(ms): p50={percentile(latencies, 50):.0f}  p95={percentile(latencies, 95):.0f}  "
+          f"p99={percentile(latencies, 99):.0f}  max={max(latencies, default=0):.0f}")
+    print(f"提供商: {dict(providers)}")
+    print(f"LLM替身: 首选 {dict(llm.stats)}  备用 {dict(fallback_llm.stats)}")
+    print(f"预约API替身: {booking.stats['total']} 次请求")
+    print(f"对冲: {status.get('hedging')}")
+    print(f"API缓存: {status.get('api_cache')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="客服回复端到端压测（本地替身，无需网络）")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median-ms", type=float, default=300.0)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--tail-probability", type=float, default=0.0)
+    parser.add_argument("--tail-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="首选提供商的失败率")
+    parser.add_argument("--booking-latency-ms", type=float, default=20.0)
+    parser.add_argument("--fallback", action="store_true", help="启用备用提供商（deepseek指向第二个替身）")
+    parser.add_argument("--hedging", action="store_true", help="启用对冲请求")
+    parser.add_argument("--with-caches", action="store_true", help="保留回复缓存和本地意图快速路径")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="输出客户端日志")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+本地意图识别离线评估报告
+输出标注样本上的准确率、误答率（本应交给AI却被本地回答）和分类延迟；
+指定聊天历史数据库时，额外统计真实客户消息中可由本地快速路径回答的比例
+
+用法:
+    python examples/intent_classifier_report.py [--db dianping_history.db] [--labels samples.tsv]
+
+labels文件每行一条 "消息<TAB>意图"，意图取值见 aiclient.intent.Intent
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiclient.intent import IntentClassifier, Intent, KNOWLEDGE_TABLE
+
+
+# 内置评估样本，与训练种子样本不重复
+EVALUATION_SAMPLES = [
+    ("请问你们几点开门？", Intent.HOURS),
+    ("晚上最晚营业到什么时候", Intent.HOURS),
+    ("春节放假吗", Intent.HOURS),
+    ("店铺地址在哪儿", Intent.ADDRESS),
+    ("从地铁站怎么走过去", Intent.ADDRESS),
+    ("发个定位给我", Intent.ADDRESS),
+    ("门口能停车么", Intent.PARKING),
+    ("开车过去停哪里", Intent.PARKING),
+    ("团购买错了怎么退款", Intent.REFUND),
+    ("券不用了可以退吗", Intent.REFUND),
+    ("有没有女技师", Intent.FEMALE_THERAPIST),
+    ("能安排女师傅按吗", Intent.FEMALE_THERAPIST),
+    ("能用医保卡支付吗", Intent.INSURANCE),
+    ("刷社保可以吗", Intent.INSURANCE),
+    ("我要预约明天下午", Intent.BOOKING),
+    ("帮我改一下预约时间", Intent.BOOKING),
+    ("我叫张三 电话13800000000", Intent.BOOKING),
+    ("今天晚上还有空位吗", Intent.AVAILABILITY),
+    ("王技师明天在吗", Intent.AVAILABILITY),
+    ("女技师后天有空吗", Intent.AVAILABILITY),
+    ("好的谢谢", Intent.OTHER),
+    ("小调理多少钱", Intent.OTHER),
+    ("按完会不会疼", Intent.OTHER),
+]
+
+
+def load_labels(path):
+    """读取 "消息<TAB>意图" 格式的标注文件"""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if "\t" in line:
+                text, intent = line.rstrip("\n").split("\t", 1)
+                samples.append((text, intent.strip()))
+    return samples
+
+
+def load_customer_messages(db_path, limit):
+    """读取聊天历史中的客户消息"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT content FROM messages WHERE role = 'user' ORDER BY processed_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [row[0] for row in rows if row[0]]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def timed_classify(classifier, texts, repeat):
+    """分类并记录每条消息的平均耗时（微秒）"""
+    results, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = classifier.classify(text)
+        latencies.append((time.perf_counter() - started) / repeat * 1e6)
+        results.append(result)
+    return results, latencies
+
+
+def print_latency(latencies):
+    print(f"  延迟(μs): p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+          f"p99={percentile(latencies, 99):.1f} mean={statistics.mean(latencies):.1f}")
+
+
+def report_accuracy(classifier, samples, repeat):
+    # 本地回答的静态意图以外，全部按"交给AI"计算
+    def routed(intent):
+        return intent if intent in KNOWLEDGE_TABLE else "llm"
+
+    results, latencies = timed_classify(classifier, [text for text, _ in samples], repeat)
+    confusion = defaultdict(Counter)
+    wrong_answers = []
+    for (text, expected), result in zip(samples, results):
+        predicted = routed(result.intent)
+        confusion[routed(expected)][predicted] += 1
+        if predicted != routed(expected) and predicted != "llm":
+            wrong_answers.append((text, expected, result))
+
+    correct = sum(counts[label] for label, counts in confusion.items())
+    fast_path = sum(1 for result in results if result.answer is not None)
+    print(f"\n== 标注样本评估 ({len(samples)} 条) ==")
+    print(f"  路由准确率: {correct / len(samples):.1%}")
+    print(f"  本地回答比例: {fast_path / len(samples):.1%}")
+    print(f"  误答（错误地本地回答）: {len(wrong_answers)}")
+    for text, expected, result in wrong_answers:
+        print(f"    - {text!r}: 期望 {expected}, 实际 {result.intent} ({result.source}, {result.confidence:.2f})")
+    print("  各意图召回率:")
+    for label in sorted(confusion):
+        counts = confusion[label]
+        print(f"    {label:<18} {counts[label]}/{sum(counts.values())}")
+    print_latency(latencies)
+
+
+def report_traffic(classifier, messages, repeat):
+    results, latencies = timed_classify(classifier, messages, repeat)
+    by_intent = Counter(result.intent for result in results if result.answer is not None)
+    by_source = Counter(result.source for result in results if result.answer is not None)
+    fast_path = sum(by_intent.values())
+    print(f"\n== 历史客户消息 ({len(messages)} 条) ==")
+    print(f"  本地回答比例: {fast_path / len(messages):.1%} (规则 {by_source['rule']}, 模型 {by_source['model']})")
+    for intent, count in by_intent.most_common():
+        print(f"    {intent:<18} {count}")
+    print_latency(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地意图识别离线评估")
+    parser.add_argument("--db", help="聊天历史数据库（dianping_history.db），用于训练和流量统计")
+    parser.add_argument("--labels", help="额外的标注样本文件（消息<TAB>意图）")
+    parser.add_argument("--min-confidence", type=float, default=0.5)
+    parser.add_argument("--limit", type=int, default=5000, help="最多读取的历史消息条数")
+    parser.add_argument("--repeat", type=int, default=20, help="每条消息重复分类次数，用于稳定延迟测量")
+    args = parser.parse_args()
+
+    classifier = IntentClassifier(min_confidence=args.min_confidence)
+    started = time.perf_counter()
+    trained = classifier.train(args.db)
+    print(f"TF-IDF模型: {'已训练' if trained else '未启用（缺少numpy），仅关键词规则'}"
+          f"，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    samples = list(EVALUATION_SAMPLES)
+    if args.labels:
+        samples.extend(load_labels(args.labels))
+    report_accuracy(classifier, samples, args.repeat)
+
+    if args.db:
+        messages = load_customer_messages(args.db, args.limit)
+        if messages:
+            report_traffic(classifier, messages, args.repeat)
+        else:
+            print(f"\n{args.db} 中没有客户消息")
+
+
+if __name__ == "__main__":
+    main()
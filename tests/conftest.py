@@ -0,0 +1,86 @@
+"""
+测试共用的脚本化AI适配器与客户端工厂
+"""
+
+import asyncio
+
+import pytest
+
+from aiclient import AIClient, AIProvider, AIResponse
+from aiclient.config import ModelConfig
+from aiclient.adapters import OpenAIAdapter
+
+
+class FakeAdapter(OpenAIAdapter):
+    """不发送网络请求的适配器
+
+    - 按顺序返回responses中的响应（其中的异常会被抛出），用完后返回content
+    - delay为每次请求的耗时，fail为True时请求失败；被取消时记录cancelled
+    - 工具调用不访问预约接口，按tool_delays耗时后返回成功，执行顺序记录在call_log
+    """
+
+    def __init__(self, responses=None, content="好的", provider=AIProvider.OPENAI,
+                 fail=False, delay=0, tool_delays=None):
+        super().__init__(ModelConfig(provider=provider, model_name="fake-model", api_key="test-key"))
+        self.responses = list(responses or [])
+        self.content = content
+        self.fail = fail
+        self.delay = delay
+        self.tool_delays = tool_delays or {}
+        self.requests = []
+        self.call_log = []
+        self.cancelled = False
+
+    @property
+    def calls(self):
+        return len(self.requests)
+
+    async def chat_completion(self, request):
+        self.requests.append(request)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise Exception("provider down")
+        if self.responses:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return AIResponse(content=self.content, model="fake-model", provider=self.config.provider.value)
+
+    async def execute_function_call(self, function_name, function_args):
+        self.call_log.append(("start", function_name))
+        await asyncio.sleep(self.tool_delays.get(function_name, 0))
+        self.call_log.append(("end", function_name))
+        return {"success": True, "data": [], "message": function_name}
+
+
+def make_client(*adapters, intent_classifier=True, reply_cache=True):
+    """使用给定适配器的AIClient；可关闭本地意图识别和回复缓存，确保请求到达适配器"""
+    client = AIClient()
+    if not intent_classifier:
+        client.intent_classifier = None
+    if not reply_cache:
+        client.reply_cache = None
+    client.adapters = {adapter.config.provider: adapter for adapter in adapters}
+    return client
+
+
+def text_response(content, provider="openai"):
+    return AIResponse(content=content, model="fake-model", provider=provider)
+
+
+def tool_call(call_id, name, arguments="{}"):
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+def tool_response(*tool_calls):
+    return AIResponse(content="", model="fake-model", provider="openai", tool_calls=list(tool_calls))
+
+
+@pytest.fixture
+def fake_adapter():
+    return FakeAdapter()
@@ -0,0 +1,120 @@
+"""
+测试AI适配器的连接池会话
+"""
+
+import pytest
+from contextlib import asynccontextmanager
+from aiohttp import web
+
+from aiclient.adapters.deepseek_adapter import DeepSeekAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole
+
+
+async def _chat_handler(request):
+    """模拟的chat/completions接口"""
+    return web.json_response({
+        "model": "mock-model",
+        "choices": [{
+            "message": {"role": "assistant", "content": "您好"},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+    })
+
+
+@asynccontextmanager
+async def mock_server():
+    """启动本地模拟服务器"""
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", _chat_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1"
+    await runner.cleanup()
+
+
+def _make_adapter(base_url: str) -> DeepSeekAdapter:
+    return DeepSeekAdapter(ModelConfig(
+        provider=AIProvider.DEEPSEEK,
+        model_name="mock-model",
+        api_key="test-key",
+        base_url=base_url,
+        max_retries=1
+    ))
+
+
+def _make_request() -> AIRequest:
+    return AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+
+class TestAdapterConnectionPool:
+    """测试适配器连接池"""
+
+    @pytest.mark.asyncio
+    async def test_session_is_reused_across_requests(self):
+        """多次请求复用同一会话和连接"""
+        async with mock_server() as base_url:
+            adapter = _make_adapter(base_url)
+            try:
+                for _ in range(3):
+                    response = await adapter.chat_completion(_make_request())
+                    assert response.content == "您好"
+
+                stats = adapter.get_pool_stats()
+                assert stats["requests"] == 3
+                assert stats["connections_created"] == 1
+                assert stats["connections_reused"] == 2
+                assert stats["in_use"] == 0
+                assert stats["session_open"] is True
+            finally:
+                await adapter.close()
+
+    @pytest.mark.asyncio
+    async def test_close_releases_session(self):
+        """关闭后会话释放，再次请求会重新创建"""
+        async with mock_server() as base_url:
+            adapter = _make_adapter(base_url)
+            await adapter.chat_completion(_make_request())
+            await adapter.close()
+            assert adapter.get_pool_stats()["session_open"] is False
+
+            await adapter.chat_completion(_make_request())
+            assert adapter.get_pool_stats()["connections_created"] == 2
+            await adapter.close()
+
+    @pytest.mark.asyncio
+    async def test_explicit_zero_retries_sends_once(self):
+        """显式max_retries=0不回退到配置的重试次数"""
+        hits = []
+
+        async def failing_handler(request):
+            hits.append(1)
+            return web.Response(status=500, text="boom")
+
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", failing_handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        adapter = DeepSeekAdapter(ModelConfig(
+            provider=AIProvider.DEEPSEEK,
+            model_name="mock-model",
+            api_key="test-key",
+            base_url=f"http://127.0.0.1:{port}/v1",
+            max_retries=3
+        ))
+        try:
+            request = _make_request()
+            request.max_retries = 0
+            with pytest.raises(Exception):
+                await adapter.chat_completion(request)
+            assert len(hits) == 1
+        finally:
+            await adapter.close()
+            await runner.cleanup()
@@ -0,0 +1,274 @@
+"""
+测试预约API响应缓存
+"""
+
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from aiclient.api_cache import APIResponseCache, CachePolicy, SingleFlight, make_cache_key
+from aiclient.database_service import DatabaseAPIService
+
+
+@asynccontextmanager
+async def mock_booking_api():
+    """启动本地模拟预约API，统计各路径的请求次数"""
+    hits = Counter()
+
+    async def stores(request):
+        hits["/stores"] += 1
+        await asyncio.sleep(0.05)
+        return web.json_response({"stores": [{"id": 1, "name": "总店"}]})
+
+    async def availability(request):
+        hits[request.path] += 1
+        return web.json_response({"available_slots": [{"time": "10:00", "version": hits[request.path]}]})
+
+    async def therapists(request):
+        hits["/therapists"] += 1
+        return web.json_response({"schedules": [{"technician_id": request.query.get("technician_id")}]})
+
+    async def create(request):
+        hits["POST /appointments"] += 1
+        return web.json_response({"appointment_id": 9}, status=201)
+
+    async def details(request):
+        hits[request.path] += 1
+        return web.json_response({"id": 9, "therapist_id": 3, "appointment_date": "2025-06-01"})
+
+    async def cancel(request):
+        hits["DELETE /appointments"] += 1
+        return web.json_response({"success": True})
+
+    app = web.Application()
+    app.router.add_get("/api/stores", stores)
+    app.router.add_get("/api/appointments/availability/{therapist_id}", availability)
+    app.router.add_get("/api/therapists", therapists)
+    app.router.add_post("/api/appointments", create)
+    app.router.add_get("/api/appointments/{appointment_id}", details)
+    app.router.add_delete("/api/appointments/{appointment_id}", cancel)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/api", hits
+    await runner.cleanup()
+
+
+def test_cache_key_ignores_order_and_none():
+    assert make_cache_key("/t", {"a": 1, "b": None, "c": "x"}) == make_cache_key("/t", {"c": "x", "a": "1"})
+
+
+class TestAPIResponseCache:
+    """测试缓存本身的命中、过期与淘汰"""
+
+    @pytest.mark.asyncio
+    async def test_fresh_hit_and_failures_not_cached(self):
+        cache = APIResponseCache({"stores": CachePolicy(ttl=60)})
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("API错误 500")
+            return {"stores": []}
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_fetch("stores", "/stores", None, fetch)
+        assert await cache.get_or_fetch("stores", "/stores", None, fetch) == {"stores": []}
+        assert await cache.get_or_fetch("stores", "/stores", None, fetch) == {"stores": []}
+
+        assert len(calls) == 2
+        stats = cache.get_stats()
+        assert (stats["hits"], stats["misses"]) == (1, 2)
+
+    @pytest.mark.asyncio
+    async def test_stale_value_served_while_refreshing(self):
+        cache = APIResponseCache({"therapists": CachePolicy(ttl=0.05, stale_ttl=60)})
+        versions = iter([1, 2])
+
+        async def fetch():
+            return next(versions)
+
+        assert await cache.get_or_fetch("therapists", "/therapists", {}, fetch) == 1
+        await asyncio.sleep(0.06)
+        assert await cache.get_or_fetch("therapists", "/therapists", {}, fetch) == 1
+        await asyncio.sleep(0.01)
+        assert await cache.get_or_fetch("therapists", "/therapists", {}, fetch) == 2
+
+        stats = cache.get_stats()
+        assert (stats["stale_hits"], stats["refreshes"], stats["hits"]) == (1, 1, 1)
+
+    @pytest.mark.asyncio
+    async def test_expired_without_stale_window_refetches(self):
+        cache = APIResponseCache({"availability": CachePolicy(ttl=0.01)})
+        versions = iter([1, 2])
+
+        async def fetch():
+            return next(versions)
+
+        await cache.get_or_fetch("availability", "/a", {"date": "d"}, fetch)
+        await asyncio.sleep(0.02)
+        assert await cache.get_or_fetch("availability", "/a", {"date": "d"}, fetch) == 2
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        cache = APIResponseCache({"stores": CachePolicy(ttl=60)}, max_entries=2)
+
+        async def fetch():
+            return "v"
+
+        for endpoint in ["/a", "/b", "/a", "/c"]:
+            await cache.get_or_fetch("stores", endpoint, None, fetch)
+
+        stats = cache.get_stats()
+        assert stats["evictions"] == 1
+        assert stats["size"] == 2
+        await cache.get_or_fetch("stores", "/a", None, fetch)
+        assert cache.get_stats()["hits"] == 2
+
+
+class TestDatabaseServiceCache:
+    """测试DatabaseAPIService的读缓存与写后失效"""
+
+    @pytest.mark.asyncio
+    async def test_repeated_reads_hit_cache(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url)
+            for _ in range(3):
+                assert await service.get_stores() == [{"id": 1, "name": "总店"}]
+                await service.query_therapist_availability(3, "2025-06-01")
+
+            assert hits["/stores"] == 1
+            assert hits["/api/appointments/availability/3"] == 1
+            stats = service.get_cache_stats()
+            assert stats["hit_ratio"] == round(4 / 6, 3)
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_create_invalidates_only_affected_therapist_and_date(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url)
+            await service.query_therapist_availability(3, "2025-06-01")
+            await service.query_therapist_availability(3, "2025-06-02")
+            await service.query_therapist_availability(4, "2025-06-01")
+            await service.query_technician_schedule(3, "2025-05-30", "2025-06-05")
+            await service.query_technician_schedule(3, "2025-06-10", "2025-06-12")
+
+            result = await service.create_appointment(
+                "u1", "张三", "13800000000", 3, "2025-06-01", "10:00"
+            )
+            assert result["success"]
+
+            await service.query_therapist_availability(3, "2025-06-01")
+            await service.query_therapist_availability(3, "2025-06-02")
+            await service.query_therapist_availability(4, "2025-06-01")
+            await service.query_technician_schedule(3, "2025-05-30", "2025-06-05")
+            await service.query_technician_schedule(3, "2025-06-10", "2025-06-12")
+
+            assert hits["/api/appointments/availability/3"] == 3
+            assert hits["/api/appointments/availability/4"] == 1
+            assert hits["/therapists"] == 3
+            assert service.get_cache_stats()["invalidations"] == 2
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_cancel_looks_up_appointment_to_invalidate(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url)
+            await service.query_therapist_availability(3, "2025-06-01")
+            await service.query_therapist_availability(3, "2025-06-02")
+
+            result = await service.cancel_appointment(9, "u1")
+            assert result["success"]
+
+            await service.query_therapist_availability(3, "2025-06-01")
+            await service.query_therapist_availability(3, "2025-06-02")
+            assert hits["/api/appointments/9"] == 1
+            assert hits["/api/appointments/availability/3"] == 3
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_cache_disabled(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url, cache_enabled=False)
+            await service.get_stores()
+            await service.get_stores()
+            assert hits["/stores"] == 2
+            assert service.get_cache_stats() is None
+            await service.close()
+
+
+class TestSingleFlight:
+    """测试并发相同请求的合并"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_gets_share_one_request(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url, cache_enabled=False)
+            results = await asyncio.gather(*[service.get_stores() for _ in range(5)])
+
+            assert all(stores == [{"id": 1, "name": "总店"}] for stores in results)
+            assert hits["/stores"] == 1
+            stats = service.get_request_stats()
+            assert (stats["requests"], stats["coalesced"], stats["inflight"]) == (5, 4, 0)
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_different_params_are_not_merged(self):
+        async with mock_booking_api() as (base_url, hits):
+            service = DatabaseAPIService(base_url, cache_enabled=False)
+            await asyncio.gather(
+                service.query_therapist_availability(3, "2025-06-01"),
+                service.query_therapist_availability(3, "2025-06-02"),
+            )
+            assert hits["/api/appointments/availability/3"] == 2
+            assert service.get_request_stats()["coalesced"] == 0
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_error_and_cancellation_are_isolated(self):
+        flight = SingleFlight()
+        started = asyncio.Event()
+
+        async def failing():
+            started.set()
+            await asyncio.sleep(0.02)
+            raise RuntimeError("API错误 503")
+
+        key = make_cache_key("/stores")
+        first = asyncio.create_task(flight.do(key, failing))
+        await started.wait()
+        second = asyncio.create_task(flight.do(key, failing))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        with pytest.raises(RuntimeError):
+            await second
+        assert first.cancelled()
+        assert flight.get_stats() == {"requests": 2, "coalesced": 1, "inflight": 0}
+
+    @pytest.mark.asyncio
+    async def test_caller_after_last_waiter_leaves_starts_new_request(self):
+        """最后一个等待者取消后，同一轮事件循环中到达的调用者发起新请求，而不是加入已取消的任务"""
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        key = make_cache_key("/stores")
+        first = asyncio.create_task(flight.do(key, fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        assert await flight.do(key, fetch) == 2
+        assert len(calls) == 2
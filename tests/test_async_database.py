@@ -0,0 +1,139 @@
+"""
+测试数据库异步门面：写线程组提交、单操作回滚、WAL和只读连接
+"""
+
+import asyncio
+import importlib
+import os
+import sqlite3
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """独立数据库文件上的DatabaseManager（绕过单例）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(tmp_path / "history.db")
+    manager.conn = None
+    manager._init_db()
+    yield manager
+    manager.close()
+
+
+@pytest.fixture
+def async_database(monkeypatch):
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    return importlib.import_module("async_database")
+
+
+def message(i, chat_id="c1"):
+    return {"chatId": chat_id, "role": "user", "content": f"消息{i}", "timestamp": f"2025-01-01T00:00:{i:02d}"}
+
+
+def test_connections_use_wal_and_tuned_pragmas(manager):
+    assert manager.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert manager.conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert manager.conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_group_committed(manager, async_database):
+    db = async_database.AsyncDatabase(manager, commit_window=0.05)
+
+    results = await asyncio.gather(*[db.add_messages([message(i)]) for i in range(50)])
+
+    assert all(len(new) == 1 for new in results)
+    stats = db.get_stats()
+    assert stats["writes"] == 50
+    assert stats["commits"] < 50
+    assert await db.count_messages("c1") == 50
+    assert await db.add_messages([message(0), message(50)]) == [message(50)]
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_default_window_shares_one_commit(manager, async_database):
+    """默认提交窗口内先后到达的写操作合并到一次提交"""
+    db = async_database.AsyncDatabase(manager)
+
+    async def write(i):
+        await asyncio.sleep(i * 0.0001)  # 写操作在约1ms内陆续到达，而不是同时在队列中
+        return await db.add_messages([message(i)])
+
+    await asyncio.gather(*[write(i) for i in range(10)])
+
+    stats = db.get_stats()
+    assert stats["writes"] == 10
+    assert stats["commits"] == 1
+    assert stats["max_batch_size"] == 10
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_failing_write_rolls_back_only_itself(manager, async_database):
+    db = async_database.AsyncDatabase(manager, commit_window=0.05)
+
+    def broken(conn):
+        manager._insert_message_rows(conn, [("x", "c1", "user", "半条", None, "{}")])
+        raise sqlite3.IntegrityError("模拟失败")
+
+    results = await asyncio.gather(
+        db.add_messages([message(1)]), db._write(broken), db.add_messages([message(2)]),
+        return_exceptions=True
+    )
+
+    assert results[0] == [message(1)]
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert results[2] == [message(2)]
+    assert not await db.is_message_processed("x")
+    assert [m["content"] for m in await db.get_chat_history("c1")] == ["消息1", "消息2"]
+    assert db.get_stats()["write_errors"] == 1
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_read_connections_are_read_only(manager, async_database):
+    db = async_database.AsyncDatabase(manager)
+    await db.add_messages([message(1)])
+
+    assert await db.count_messages("c1") == 1
+    reader = await asyncio.get_running_loop().run_in_executor(db._readers, db._reader)
+    with pytest.raises(sqlite3.OperationalError):
+        reader.conn.execute("DELETE FROM messages")
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_close_commits_queued_writes(manager, async_database):
+    db = async_database.AsyncDatabase(manager)
+    pending = [asyncio.ensure_future(db.add_messages([message(i)])) for i in range(10)]
+    await asyncio.sleep(0)
+
+    await db.close()
+
+    assert all(len(new) == 1 for new in await asyncio.gather(*pending))
+    assert manager.count_messages("c1") == 10
+    with pytest.raises(RuntimeError):
+        await db.add_message(message(11))
+
+
+@pytest.mark.asyncio
+async def test_summary_round_trip(manager, async_database):
+    db = async_database.AsyncDatabase(manager)
+
+    await db.add_messages([message(i) for i in range(5)])
+    turns, key = await db.get_messages_after("c1", None, 3)
+    await db.save_chat_summary("c1", "客户询问项目", key)
+
+    summary = await db.get_chat_summary("c1")
+    assert summary["summary"] == "客户询问项目"
+    assert summary["covered_until"] == key
+    assert summary["covered_count"] == len(turns) == 3
+    assert await db.count_messages_after("c1", key) == 2
+    await db.close()
@@ -0,0 +1,110 @@
+"""
+测试批量查询技师可用时间
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from aiclient import AIProvider
+from aiclient.config import ModelConfig
+from aiclient.adapters import OpenAIAdapter
+from aiclient.database_service import DatabaseAPIService
+
+ROSTER = [
+    {"id": 1, "name": "李明", "store_name": "宜山路店"},
+    {"id": 2, "name": "王芳", "store_name": "宜山路店"},
+    {"id": 3, "name": "张伟", "store_name": "静安店"},
+]
+
+
+@asynccontextmanager
+async def mock_booking_api(delay=0.02):
+    """本地模拟预约API，记录可用时间请求的最大并发数"""
+    state = {"active": 0, "max_active": 0, "requests": []}
+
+    async def therapists(request):
+        return web.json_response({"therapists": ROSTER})
+
+    async def availability(request):
+        therapist_id = request.match_info["therapist_id"]
+        state["requests"].append((therapist_id, request.query["date"]))
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        await asyncio.sleep(delay)
+        state["active"] -= 1
+        if therapist_id == "2":
+            return web.Response(status=404, text="therapist not found")
+        slots = [{"time": "19:00"}] if therapist_id == "1" else []
+        return web.json_response({"available_slots": slots})
+
+    app = web.Application()
+    app.router.add_get("/api/therapists", therapists)
+    app.router.add_get("/api/appointments/availability/{therapist_id}", availability)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/api", state
+    await runner.cleanup()
+
+
+class TestAvailabilityBatch:
+    """测试DatabaseAPIService.query_availability_batch"""
+
+    @pytest.mark.asyncio
+    async def test_store_fan_out_merges_results(self):
+        async with mock_booking_api() as (base_url, state):
+            service = DatabaseAPIService(base_url)
+            result = await service.query_availability_batch(["2025-06-01", "2025-06-02"], store_name="宜山路店")
+
+            assert result["success"]
+            assert len(result["results"]) == 4
+            assert result["available_count"] == 2
+            assert result["failed_count"] == 2
+            first = result["results"][0]
+            assert first["therapist_name"] == "李明"
+            assert first["available_slots"] == [{"time": "19:00"}]
+            assert sorted(state["requests"]) == [
+                ("1", "2025-06-01"), ("1", "2025-06-02"), ("2", "2025-06-01"), ("2", "2025-06-02")
+            ]
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        async with mock_booking_api() as (base_url, state):
+            service = DatabaseAPIService(base_url)
+            service.BATCH_AVAILABILITY_CONCURRENCY = 2
+            dates = [f"2025-06-0{d}" for d in range(1, 6)]
+            result = await service.query_availability_batch(dates, therapist_ids=[1, 3])
+
+            assert len(result["results"]) == 10
+            assert state["max_active"] == 2
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_requires_dates_and_target(self):
+        service = DatabaseAPIService("http://127.0.0.1:9/api")
+        assert not (await service.query_availability_batch([], therapist_ids=[1]))["success"]
+        assert not (await service.query_availability_batch(["2025-06-01"]))["success"]
+
+    @pytest.mark.asyncio
+    async def test_exposed_as_tool(self):
+        async with mock_booking_api() as (base_url, _):
+            adapter = OpenAIAdapter(ModelConfig(
+                provider=AIProvider.OPENAI, model_name="gpt-4o-mini", api_key="test-key"
+            ))
+            adapter.database_service = DatabaseAPIService(base_url)
+            names = [tool["function"]["name"] for tool in adapter.get_database_tools()]
+            assert "query_availability_batch" in names
+
+            result = await adapter.execute_function_call(
+                "query_availability_batch", {"dates": ["2025-06-01"], "therapist_name": "李明"}
+            )
+            assert result["success"]
+            assert [r["therapist_id"] for r in result["results"]] == [1]
+            assert "1 个有可用时间" in result["message"]
+            await adapter.database_service.close()
@@ -0,0 +1,166 @@
+"""
+测试预约API请求的连接池、超时、重试与调用方时限
+"""
+
+import time
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from aiclient import AIClient
+from aiclient.config import BookingAPIConfig
+from aiclient.database_service import DatabaseAPIService, BookingAPIError, request_deadline, _parse_retry_after
+
+
+@asynccontextmanager
+async def mock_booking_api(failures=0, retry_after="0", slow_seconds=1.0):
+    """本地模拟预约API：/flaky 前failures次返回503，/slow 延迟响应"""
+    state = {"flaky": 0, "posts": 0, "slow": 0}
+
+    async def flaky(request):
+        state["flaky"] += 1
+        if state["flaky"] <= failures:
+            return web.Response(status=503, text="busy", headers={"Retry-After": retry_after})
+        return web.json_response({"stores": [{"id": 1}]})
+
+    async def create(request):
+        state["posts"] += 1
+        return web.Response(status=503, text="busy")
+
+    async def slow(request):
+        state["slow"] += 1
+        await asyncio.sleep(slow_seconds)
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_get("/api/flaky", flaky)
+    app.router.add_post("/api/appointments", create)
+    app.router.add_get("/api/slow", slow)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/api", state
+    await runner.cleanup()
+
+
+def _service(base_url, **overrides):
+    config = BookingAPIConfig(base_url=base_url, cache_enabled=False, retry_backoff_base=0.01, **overrides)
+    return DatabaseAPIService(api_config=config)
+
+
+def test_endpoint_timeout_uses_longest_prefix():
+    config = BookingAPIConfig()
+    assert config.get_timeout("/appointments/availability/3") == 5.0
+    assert config.get_timeout("/appointments/12") == 10.0
+    assert config.get_timeout("/unknown") == config.default_timeout
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after("2") == 2.0
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert _parse_retry_after("soon") is None
+
+
+class TestBookingAPIRequests:
+    """测试DatabaseAPIService的请求策略"""
+
+    @pytest.mark.asyncio
+    async def test_session_is_shared(self):
+        async with mock_booking_api() as (base_url, _):
+            service = _service(base_url)
+            await service._make_get_request("/flaky")
+            session = service._session
+            await service._make_get_request("/flaky", {"page": 2})
+            assert service._session is session
+            await service.close()
+            assert service._session is None
+
+    @pytest.mark.asyncio
+    async def test_get_retries_honor_retry_after(self):
+        async with mock_booking_api(failures=2, retry_after="0.05") as (base_url, state):
+            service = _service(base_url)
+            started_at = time.monotonic()
+            result = await service._make_get_request("/flaky")
+
+            assert result == {"stores": [{"id": 1}]}
+            assert state["flaky"] == 3
+            assert time.monotonic() - started_at >= 0.1
+            assert service.get_request_stats()["retries"] == 2
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_long_retry_after_is_not_waited(self):
+        async with mock_booking_api(failures=5, retry_after="120") as (base_url, state):
+            service = _service(base_url)
+            with pytest.raises(BookingAPIError) as excinfo:
+                await service._make_get_request("/flaky")
+            assert excinfo.value.status == 503
+            assert state["flaky"] == 1
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_post_is_not_retried(self):
+        async with mock_booking_api() as (base_url, state):
+            service = _service(base_url)
+            result = await service.create_appointment("u1", "张三", "13800000000", 1, "2025-06-01", "10:00")
+            assert not result["success"]
+            assert state["posts"] == 1
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_per_endpoint_timeout(self):
+        async with mock_booking_api() as (base_url, state):
+            service = _service(base_url, timeouts={"/slow": 0.1}, get_retries=1)
+            started_at = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await service._make_get_request("/slow")
+            assert time.monotonic() - started_at < 0.6
+            assert state["slow"] == 2
+            assert service.get_request_stats()["timeouts"] == 2
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_caller_deadline_bounds_request_and_retries(self):
+        async with mock_booking_api() as (base_url, _):
+            service = _service(base_url, get_retries=3)
+            started_at = time.monotonic()
+            with request_deadline(0.15):
+                with pytest.raises(asyncio.TimeoutError):
+                    await service._make_get_request("/slow")
+            assert time.monotonic() - started_at < 0.5
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_expired_deadline_fails_fast(self):
+        service = _service("http://127.0.0.1:9/api")
+        with request_deadline(0):
+            with pytest.raises(asyncio.TimeoutError):
+                await service._make_post_request("/appointments", {})
+        assert service.get_request_stats()["deadline_exceeded"] == 1
+
+
+class SlowToolAdapter:
+    """执行工具时阻塞的适配器"""
+
+    async def execute_function_call(self, function_name, function_args):
+        await asyncio.sleep(1)
+        return {"success": True}
+
+
+@pytest.mark.asyncio
+async def test_tool_call_does_not_outlive_loop_deadline():
+    client = AIClient()
+    started_at = time.monotonic()
+    result = await client._execute_single_tool_call(
+        SlowToolAdapter(),
+        {"id": "1", "function": {"name": "get_stores", "arguments": "{}"}},
+        deadline=time.monotonic() + 0.05
+    )
+    assert time.monotonic() - started_at < 0.5
+    assert not result["success"]
+    assert "超时" in result["content"]
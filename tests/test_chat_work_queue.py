@@ -0,0 +1,310 @@
+"""
+测试按聊天串行的后台任务队列，以及memory_update不再阻塞消息循环
+"""
+
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """在临时目录中导入后端模块（数据库与日志文件写入临时目录）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    return tmp_path
+
+
+@pytest.fixture
+def db(backend):
+    """独立数据库文件上的DatabaseManager（绕过单例）"""
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(backend / "history.db")
+    manager.conn = None
+    manager._init_db()
+    yield manager
+    manager.close()
+
+
+class TestChatWorkQueue:
+
+    @pytest.mark.asyncio
+    async def test_jobs_for_same_chat_run_in_order(self, backend):
+        queue = importlib.import_module("chat_work_queue").ChatWorkQueue(workers=4)
+        order, running = [], set()
+
+        def job(name):
+            async def run():
+                assert "c1" not in running
+                running.add("c1")
+                await asyncio.sleep(0.01)
+                order.append(name)
+                running.discard("c1")
+            return run
+
+        for i in range(3):
+            queue.submit("c1", job(i))
+        await asyncio.wait_for(queue.join(), 2)
+        await queue.stop()
+
+        assert order == [0, 1, 2]
+        assert queue.get_stats()["completed"] == 3
+
+    @pytest.mark.asyncio
+    async def test_different_chats_run_concurrently_up_to_worker_limit(self, backend):
+        queue = importlib.import_module("chat_work_queue").ChatWorkQueue(workers=2)
+        active, peak = 0, 0
+
+        async def job():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.05)
+            active -= 1
+
+        for i in range(5):
+            queue.submit(f"c{i}", job)
+        await asyncio.wait_for(queue.join(), 2)
+        await queue.stop()
+
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_job_does_not_stop_chat(self, backend):
+        queue = importlib.import_module("chat_work_queue").ChatWorkQueue(workers=1)
+        done = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def succeed():
+            done.append(True)
+
+        queue.submit("c1", fail)
+        queue.submit("c1", succeed)
+        await asyncio.wait_for(queue.join(), 2)
+        await queue.stop()
+
+        assert done == [True]
+        assert queue.get_stats()["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_backlog_drops_oldest_jobs(self, backend):
+        queue = importlib.import_module("chat_work_queue").ChatWorkQueue(workers=1, max_pending_per_chat=2)
+        gate = asyncio.Event()
+        ran = []
+
+        async def blocker():
+            await gate.wait()
+
+        def job(name):
+            async def run():
+                ran.append(name)
+            return run
+
+        queue.submit("c1", blocker)
+        await asyncio.sleep(0)  # blocker开始执行
+        for i in range(4):
+            queue.submit("c1", job(i))
+        gate.set()
+        await asyncio.wait_for(queue.join(), 2)
+        await queue.stop()
+
+        assert ran == [2, 3]
+        assert queue.get_stats()["dropped"] == 2
+
+    @pytest.mark.asyncio
+    async def test_cancel_running_keeps_worker_alive(self, backend):
+        queue = importlib.import_module("chat_work_queue").ChatWorkQueue(workers=1)
+        started, done = asyncio.Event(), []
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        async def quick():
+            done.append(True)
+
+        queue.submit("c1", slow)
+        await started.wait()
+        queue.submit("c1", quick)
+        assert queue.cancel_running("c1") is True
+        await asyncio.wait_for(queue.join(), 2)
+        await queue.stop()
+
+        assert done == [True]
+        assert queue.get_stats()["cancelled"] == 1
+        assert queue.cancel_running("c1") is False
+
+
+class SlowReplyClient:
+    """在收到放行信号前不返回的AI客户端"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.calls = []
+
+    async def generate_customer_service_reply(self, customer_message, conversation_history=None,
+                                              conversation_summary=None):
+        self.calls.append(customer_message)
+        await self.release.wait()
+        return type("Reply", (), {"content": f"回复：{customer_message}"})()
+
+    async def close(self):
+        pass
+
+
+class FakeWebSocket:
+    remote_address = ("127.0.0.1", 50000)
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def memory_update(chat_id, *contents):
+    return json.dumps({"type": "memory_update", "payload": {
+        "chatId": chat_id, "contactName": "张三",
+        "conversationMemory": [{"role": "user", "content": content} for content in contents]
+    }})
+
+
+@pytest.fixture
+def make_server(db, monkeypatch):
+    """创建使用临时数据库和慢速AI客户端的服务器"""
+    server_module = importlib.import_module("server")
+    monkeypatch.setattr(server_module, "db_manager", db)
+    monkeypatch.setattr(server_module.Config, "AI_STREAMING", False)
+    monkeypatch.setattr(server_module.Config, "SUMMARY_ENABLED", False)
+
+    async def make(debounce_seconds=0.0, debounce_max_seconds=5.0):
+        monkeypatch.setattr(server_module.Config, "AI_DEBOUNCE_SECONDS", debounce_seconds)
+        monkeypatch.setattr(server_module.Config, "AI_DEBOUNCE_MAX_SECONDS", debounce_max_seconds)
+        server = server_module.DianpingWebSocketServer()
+        await server.ai_client.close()
+        server.ai_client = SlowReplyClient()
+        websocket = FakeWebSocket()
+        await server.register_client(websocket)
+        return server, websocket
+
+    return make
+
+
+async def flush(server):
+    """等待所有连接的发送队列清空"""
+    for connection in list(server.connections.values()):
+        await asyncio.wait_for(connection.drain(), 1)
+
+
+async def finish(server):
+    """等待后台回复生成和发送完毕，然后停止队列和连接"""
+    await asyncio.wait_for(server.reply_queue.join(), 1)
+    await flush(server)
+    await server.reply_queue.stop()
+    for websocket in list(server.connections):
+        await server.unregister_client(websocket)
+
+
+def sent_replies(websocket):
+    return [m["text"] for m in websocket.sent if m["type"] == "sendAIReply"]
+
+
+@pytest.mark.asyncio
+async def test_memory_update_is_acknowledged_before_reply(make_server, db):
+    server, websocket = await make_server()
+
+    await asyncio.wait_for(server.handle_message(websocket, memory_update("c1", "明天有空吗")), 1)
+    # AI仍在生成时，同一连接上的其他消息照常处理
+    await asyncio.wait_for(server.handle_message(websocket, json.dumps({"type": "ping"})), 1)
+    await flush(server)
+    for _ in range(50):  # 历史在读线程中加载，等生成任务开始调用AI
+        if server.ai_client.calls:
+            break
+        await asyncio.sleep(0.01)
+
+    assert [m["type"] for m in websocket.sent] == ["welcome", "memory_updated_and_ai_queued", "pong"]
+    assert server.ai_client.calls == ["明天有空吗"]
+
+    server.ai_client.release.set()
+    await finish(server)
+
+    assert websocket.sent[-1] == {"type": "sendAIReply", "chatId": "c1", "text": "回复：明天有空吗"}
+    assert db.get_chat_history("c1")[-1]["content"] == "回复：明天有空吗"
+
+
+@pytest.mark.asyncio
+async def test_snapshot_replies_only_to_messages_after_last_shop_reply(make_server):
+    """首次同步的完整快照中，已被商家回复过的旧客户消息不合并进提示词"""
+    server, websocket = await make_server()
+    server.ai_client.release.set()
+    snapshot = json.dumps({"type": "memory_update", "payload": {
+        "chatId": "c1", "contactName": "张三",
+        "conversationMemory": [
+            {"role": "user", "content": "上周的问题"},
+            {"role": "assistant", "content": "已回复"},
+            {"role": "user", "content": "你好"},
+            {"role": "user", "content": "明天有空吗"},
+        ]
+    }})
+
+    await server.handle_message(websocket, snapshot)
+    await finish(server)
+
+    assert server.ai_client.calls == ["你好\n明天有空吗"]
+
+
+@pytest.mark.asyncio
+async def test_burst_of_messages_is_coalesced_into_one_generation(make_server):
+    server, websocket = await make_server(debounce_seconds=0.05)
+    server.ai_client.release.set()
+
+    for content in ("你好", "想约推拿", "明天下午"):
+        await server.handle_message(websocket, memory_update("c1", content))
+        await asyncio.sleep(0.01)
+    assert server.ai_client.calls == []
+
+    await asyncio.sleep(0.1)
+    await finish(server)
+
+    assert server.ai_client.calls == ["你好\n想约推拿\n明天下午"]
+    assert sent_replies(websocket) == ["回复：你好\n想约推拿\n明天下午"]
+
+
+@pytest.mark.asyncio
+async def test_debounce_is_bounded_by_max_wait(make_server):
+    server, websocket = await make_server(debounce_seconds=0.05, debounce_max_seconds=0.08)
+    server.ai_client.release.set()
+
+    for i in range(6):
+        await server.handle_message(websocket, memory_update("c1", f"消息{i}"))
+        await asyncio.sleep(0.03)
+
+    assert server.ai_client.calls, "客户持续发送时也应在最长等待后生成回复"
+    await asyncio.sleep(0.1)
+    await finish(server)
+
+
+@pytest.mark.asyncio
+async def test_new_message_cancels_stale_generation(make_server, db):
+    server, websocket = await make_server()
+
+    await server.handle_message(websocket, memory_update("c1", "明天有空吗"))
+    await asyncio.sleep(0.01)
+    assert server.ai_client.calls == ["明天有空吗"]
+
+    await server.handle_message(websocket, memory_update("c1", "下午三点"))
+    server.ai_client.release.set()
+    await finish(server)
+
+    assert server.ai_client.calls == ["明天有空吗", "明天有空吗\n下午三点"]
+    assert sent_replies(websocket) == ["回复：明天有空吗\n下午三点"]
+    assert server.reply_queue.get_stats()["cancelled"] == 1
+    assert [m["role"] for m in db.get_chat_history("c1")].count("assistant") == 1
@@ -0,0 +1,106 @@
+"""
+测试按token预算构建对话上下文
+"""
+
+import logging
+
+from aiclient import AIProvider
+from aiclient.config import ModelConfig
+from aiclient.adapters import OpenAIAdapter
+from aiclient.context_builder import ContextBuilder, TokenCounter, estimate_tokens, MESSAGE_OVERHEAD_TOKENS
+from aiclient.models import AIMessage, MessageRole
+
+
+class FixedCounter(TokenCounter):
+    """每个字符计1个token的计数器，便于精确断言"""
+
+    def __init__(self):
+        self.model_name = "fixed"
+        self._encoding = None
+
+    def count_text(self, text):
+        return len(text or "")
+
+
+def _messages(*contents):
+    return [AIMessage(role=MessageRole.USER, content=content) for content in contents]
+
+
+def test_estimate_tokens():
+    """中文按字计，其他字符约4个一token"""
+    assert estimate_tokens("营业时间") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("9点到店ok") == 3 + 1
+
+
+class TestContextBuilder:
+    """测试历史选择"""
+
+    def test_keeps_most_recent_within_budget(self):
+        builder = ContextBuilder(FixedCounter(), token_limit=100, reply_reserve=20, window_step=1)
+        history = _messages("a" * 30, "b" * 16, "c" * 16, "d" * 16)
+        fixed = _messages("系统")
+
+        kept, decision = builder.select_history(history, fixed)
+
+        # 预算 = 100 - 20 - (2 + 4 + 3) = 71，每条历史 16 + 4 = 20 tokens
+        assert decision.history_budget == 71
+        assert [m.content[0] for m in kept] == ["b", "c", "d"]
+        assert decision.history_tokens == 60
+        assert decision.estimated_prompt_tokens == 9 + 60
+
+    def test_long_message_does_not_crowd_out_recent_turns(self):
+        """一条超长的早期消息被丢弃，而不是挤掉最近的对话"""
+        builder = ContextBuilder(FixedCounter(), token_limit=200, reply_reserve=50, window_step=1)
+        history = _messages("x" * 500, "最近一条")
+
+        kept, _ = builder.select_history(history, _messages("系统"))
+
+        assert [m.content for m in kept] == ["最近一条"]
+
+    def test_tools_and_reply_are_reserved(self):
+        builder = ContextBuilder(FixedCounter(), token_limit=500, reply_reserve=50, window_step=1)
+        tools = [{"type": "function", "function": {"name": "get_stores"}}]
+
+        _, without_tools = builder.select_history([], _messages("系统"))
+        _, with_tools = builder.select_history([], _messages("系统"), tools)
+
+        assert with_tools.tools_tokens > 0
+        assert with_tools.history_budget == without_tools.history_budget - with_tools.tools_tokens
+
+    def test_window_start_is_aligned(self):
+        """窗口起点按步长对齐，新增消息时历史前缀保持不变"""
+        per_message = 1 + MESSAGE_OVERHEAD_TOKENS
+        builder = ContextBuilder(FixedCounter(), token_limit=30 * per_message + 7, reply_reserve=0, window_step=10)
+        starts = set()
+        for count in range(31, 41):
+            history = _messages(*[str(i % 10) for i in range(count)])
+            kept, _ = builder.select_history(history, _messages(""))
+            assert len(kept) <= 30
+            starts.add(count - len(kept))
+        assert starts == {10}
+
+    def test_budget_exhausted_keeps_no_history(self, caplog):
+        builder = ContextBuilder(FixedCounter(), token_limit=10, reply_reserve=10)
+        with caplog.at_level(logging.WARNING):
+            kept, decision = builder.select_history(_messages("hi"), _messages("系统"))
+        assert kept == []
+        assert decision.history_budget == 0
+        assert "占满" in caplog.text
+
+
+def test_adapter_logs_decision_and_estimates_tokens(caplog):
+    """适配器按模型token上限裁剪历史，并记录决策"""
+    adapter = OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI, model_name="gpt-4o-mini", api_key="test-key",
+        max_tokens=500, context_token_limit=3500
+    ))
+    history = [{"role": "user", "content": "我想了解一下项目" * 20} for _ in range(50)]
+
+    with caplog.at_level(logging.INFO):
+        request = adapter.create_customer_service_prompt_with_history("可以预约吗", history)
+
+    assert 0 < len(request.messages) - 2 < 50
+    assert request.estimated_prompt_tokens <= 3500 - 500
+    assert "[上下文]" in caplog.text
+    assert "estimated_prompt_tokens" not in request.to_openai_format()
@@ -0,0 +1,131 @@
+"""
+测试对话滚动摘要
+"""
+
+import importlib
+import os
+import sys
+
+import pytest
+
+from aiclient import AIProvider
+from aiclient.adapters.base import CONVERSATION_SUMMARY_PROMPT
+from aiclient.models import MessageRole
+
+from conftest import FakeAdapter, make_client
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """独立数据库文件上的DatabaseManager（绕过单例）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(tmp_path / "history.db")
+    manager.conn = None
+    manager._init_db()
+    yield manager
+    manager.close()
+
+
+def test_summary_storage(db):
+    for i in range(5):
+        db.add_message({"chatId": "c1", "role": "user", "content": f"消息{i}", "timestamp": f"2025-01-01T00:00:0{i}"})
+
+    assert db.count_messages("c1") == 5
+    assert [m["content"] for m in db.get_chat_history("c1", limit=2)] == ["消息3", "消息4"]
+    assert db.get_chat_summary("c1") is None
+
+    first, first_key = db.get_messages_after("c1", None, 3)
+    assert [m["content"] for m in first] == ["消息0", "消息1", "消息2"]
+    db.save_chat_summary("c1", "客户询问项目", first_key)
+    rest, last_key = db.get_messages_after("c1", first_key, 10)
+    assert [m["content"] for m in rest] == ["消息3", "消息4"]
+    db.save_chat_summary("c1", "客户张三询问项目", last_key)
+
+    summary = db.get_chat_summary("c1")
+    assert summary["summary"] == "客户张三询问项目"
+    assert summary["covered_until"] == last_key
+    assert summary["covered_count"] == 5
+    assert db.count_messages_after("c1", last_key) == 0
+
+
+def test_late_message_with_older_timestamp_does_not_shift_boundary(db):
+    """补录的更早消息不会让已摘要的消息再次被摘要"""
+    for i in range(5):
+        db.add_message({"chatId": "c1", "role": "user", "content": f"消息{i}", "timestamp": f"2025-01-01T00:00:0{i}"})
+    _, key = db.get_messages_after("c1", None, 3)
+    db.save_chat_summary("c1", "客户询问项目", key)
+
+    db.add_message({"chatId": "c1", "role": "user", "content": "补录", "timestamp": "2025-01-01T00:00:00.5"})
+
+    assert db.count_messages_after("c1", db.get_chat_summary("c1")["covered_until"]) == 2
+    rest, _ = db.get_messages_after("c1", key, 10)
+    assert [m["content"] for m in rest] == ["消息3", "消息4"]
+
+
+def test_legacy_summary_count_is_migrated_to_boundary(db):
+    """只有covered_count的旧摘要表迁移为第covered_count条消息的排序键"""
+    for i in range(4):
+        db.add_message({"chatId": "c1", "role": "user", "content": f"消息{i}", "timestamp": f"t{i}"})
+    db.conn.executescript("""
+        DROP TABLE chat_summaries;
+        CREATE TABLE chat_summaries (chat_id TEXT PRIMARY KEY, summary TEXT NOT NULL,
+                                     covered_count INTEGER NOT NULL, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO chat_summaries (chat_id, summary, covered_count) VALUES ('c1', '旧摘要', 2);
+    """)
+    db.close()
+
+    db._init_db()
+
+    summary = db.get_chat_summary("c1")
+    assert summary["summary"] == "旧摘要"
+    assert summary["covered_until"][0] == "t1"
+    assert [m["content"] for m in db.get_messages_after("c1", summary["covered_until"], 10)[0]] == ["消息2", "消息3"]
+
+
+def test_prompt_includes_summary_before_recent_history(fake_adapter):
+    adapter = fake_adapter
+    request = adapter.create_customer_service_prompt_with_history(
+        "那就明天吧", [{"role": "assistant", "content": "您想约哪天？"}], conversation_summary="客户张三想约推拿"
+    )
+
+    assert [m.role for m in request.messages] == [
+        MessageRole.SYSTEM, MessageRole.SYSTEM, MessageRole.ASSISTANT, MessageRole.USER
+    ]
+    assert "客户张三想约推拿" in request.messages[1].content
+
+
+class TestClientSummary:
+    """测试AIClient的摘要生成与使用"""
+
+    @pytest.mark.asyncio
+    async def test_update_merges_previous_summary_and_turns(self):
+        adapter = FakeAdapter(content=" 客户张三想约明天下午的推拿 ", provider=AIProvider.DEEPSEEK)
+        client = make_client(adapter, intent_classifier=False, reply_cache=False)
+
+        summary = await client.update_conversation_summary("客户张三想约推拿", [
+            {"role": "user", "content": "明天下午可以吗"},
+            {"role": "assistant", "content": "可以的"},
+        ])
+
+        assert summary == "客户张三想约明天下午的推拿"
+        request = adapter.requests[0]
+        assert request.messages[0].content == CONVERSATION_SUMMARY_PROMPT
+        assert "客户张三想约推拿" in request.messages[1].content
+        assert "客户：明天下午可以吗" in request.messages[1].content
+        assert "客服：可以的" in request.messages[1].content
+
+    @pytest.mark.asyncio
+    async def test_reply_prepends_summary(self):
+        adapter = FakeAdapter(provider=AIProvider.DEEPSEEK)
+        client = make_client(adapter, intent_classifier=False, reply_cache=False)
+
+        await client.generate_customer_service_reply(
+            "那就这样", conversation_history=[], conversation_summary="客户张三已确认明天15点"
+        )
+
+        assert "客户张三已确认明天15点" in adapter.requests[0].messages[1].content
@@ -0,0 +1,132 @@
+"""
+测试有界数据存储：内存上限、压缩落盘和按data_id查询
+"""
+
+import gzip
+import importlib
+import json
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+@pytest.fixture
+def data_store_module(monkeypatch):
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    return importlib.import_module("data_store")
+
+
+def entry(i):
+    return {"content": {"text": f"消息{i}"}, "timestamp": f"t{i}", "type": "dianping_data_object"}
+
+
+@pytest.mark.asyncio
+async def test_memory_is_bounded_and_evicted_entries_spill_to_disk(data_store_module, tmp_path):
+    store = data_store_module.DataStore(str(tmp_path / "data"), max_entries=10, spill_batch=5)
+
+    for i in range(100):
+        await store.put(f"id{i}", entry(i))
+        assert len(store) <= 10
+
+    stats = store.get_stats()
+    assert stats["stored"] == 100
+    assert stats["spilled"] + stats["in_memory"] == 100
+    assert "id99" in store and "id0" not in store
+
+    files = os.listdir(tmp_path / "data")
+    assert files == ["segment-000000.jsonl.gz"]
+    with gzip.open(tmp_path / "data" / files[0], "rt", encoding="utf-8") as f:
+        first = json.loads(f.readline())
+    assert first == {"data_id": "id0", **entry(0)}
+
+
+@pytest.mark.asyncio
+async def test_get_finds_entries_in_memory_and_on_disk(data_store_module, tmp_path):
+    store = data_store_module.DataStore(str(tmp_path), max_entries=4, spill_batch=2)
+    for i in range(20):
+        await store.put(f"id{i}", entry(i))
+
+    assert await store.get("id19") == entry(19)
+    assert await store.get("id3") == entry(3)
+    assert await store.get("missing") is None
+    assert store.get_stats()["disk_lookups"] == 1  # 过滤器排除的ID不读取分段
+
+
+@pytest.mark.asyncio
+async def test_miss_reads_no_segment(data_store_module, tmp_path, monkeypatch):
+    store = data_store_module.DataStore(str(tmp_path), max_entries=2, spill_batch=2, segment_max_bytes=1)
+    for i in range(10):
+        await store.put(f"id{i}", entry(i))
+    await store.flush()
+    reopened = data_store_module.DataStore(str(tmp_path), max_entries=2, spill_batch=2, segment_max_bytes=1)
+    assert await reopened.get("id0") == entry(0)  # 首次查询扫描已有分段建立索引
+
+    reads = []
+    original = reopened._read_segment
+    monkeypatch.setattr(reopened, "_read_segment", lambda index: reads.append(index) or original(index))
+
+    assert await reopened.get("missing") is None
+    assert reads == []
+    assert await reopened.get("id7") == entry(7)
+    assert len(reads) == 1
+
+
+@pytest.mark.asyncio
+async def test_index_memory_is_bounded_per_segment(data_store_module, tmp_path, monkeypatch):
+    """过滤器按分段固定大小，分段条数达到上限时换新文件；统计不访问磁盘"""
+    store = data_store_module.DataStore(str(tmp_path), max_entries=2, spill_batch=2, segment_max_entries=4)
+    for i in range(20):
+        await store.put(f"id{i}", entry(i))
+    await store.flush()
+
+    stats = store.get_stats()
+    filter_bytes = data_store_module.SegmentFilter(4).nbytes
+    assert stats["segments"] == len(os.listdir(tmp_path)) == 5
+    assert stats["filter_bytes"] == 5 * filter_bytes
+    assert all([await store.get(f"id{i}") == entry(i) for i in range(20)])
+
+    monkeypatch.setattr(os, "listdir", lambda path: pytest.fail("get_stats不应访问磁盘"))
+    assert store.get_stats()["segments"] == 5
+
+
+@pytest.mark.asyncio
+async def test_segments_rotate_and_survive_restart(data_store_module, tmp_path):
+    store = data_store_module.DataStore(str(tmp_path), max_entries=2, spill_batch=2, segment_max_bytes=1)
+    for i in range(10):
+        await store.put(f"id{i}", entry(i))
+    await store.flush()
+
+    assert len(store) == 0
+    assert store.get_stats()["segments"] > 1
+
+    reopened = data_store_module.DataStore(str(tmp_path), max_entries=2, spill_batch=2, segment_max_bytes=1)
+    for i in range(10, 14):
+        await reopened.put(f"id{i}", entry(i))
+    assert all([await reopened.get(f"id{i}") == entry(i) for i in range(14)])
+
+
+@pytest.mark.asyncio
+async def test_server_get_data_returns_spilled_entry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    server_module = importlib.import_module("server")
+    monkeypatch.setattr(server_module.Config, "DATA_STORE_PATH", str(tmp_path / "data"))
+    monkeypatch.setattr(server_module.Config, "MAX_DATA_ENTRIES", 2)
+    server = server_module.DianpingWebSocketServer()
+    await server.ai_client.close()
+
+    ids = []
+    for i in range(5):
+        response = await server.process_message_by_type(
+            {"type": "dianping_data", "payload": {"n": i}}, f"2025-01-01T00:00:0{i}"
+        )
+        ids.append(response["data_id"])
+
+    assert len(server.data_store) <= 2
+    found = await server.process_message_by_type({"type": "get_data", "payload": {"data_id": ids[0]}}, "t")
+    assert found["type"] == "data"
+    assert found["entry"]["content"] == {"n": 0}
+    missing = await server.process_message_by_type({"type": "get_data", "payload": {"data_id": "nope"}}, "t")
+    assert missing["type"] == "error"
@@ -0,0 +1,65 @@
+"""
+测试DatabaseManager的批量去重与插入
+"""
+
+import importlib
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """独立数据库文件上的DatabaseManager（绕过单例）"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(tmp_path / "history.db")
+    manager.conn = None
+    manager._init_db()
+    yield manager
+    manager.close()
+
+
+def message(content, role="user", chat_id="c1"):
+    return {"chatId": chat_id, "role": role, "content": content, "timestamp": content}
+
+
+def test_add_messages_returns_only_new_messages_in_order(db):
+    db.add_message(message("已有"))
+
+    new = db.add_messages([message("a"), message("已有"), message("b"), message("a")])
+
+    assert [m["content"] for m in new] == ["a", "b"]
+    assert db.count_messages("c1") == 3
+    assert db.add_messages([message("a"), message("b")]) == []
+
+
+def test_add_messages_uses_one_query_and_one_transaction(db):
+    db.add_messages([message(f"旧{i}") for i in range(10)])
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+
+    new = db.add_messages([message(f"旧{i}") for i in range(10)] + [message(f"新{i}") for i in range(10)])
+
+    db.conn.set_trace_callback(None)
+    assert len(new) == 10
+    selects = [s for s in statements if s.startswith("SELECT")]
+    inserts = [s for s in statements if s.startswith("INSERT")]
+    commits = [s for s in statements if s == "COMMIT"]
+    assert len(selects) == 1
+    assert len(inserts) == 10  # executemany在同一事务中逐行执行
+    assert len(commits) == 1
+
+
+def test_add_messages_handles_batches_larger_than_parameter_limit(db):
+    messages = [message(f"消息{i}") for i in range(2000)]
+    db.add_messages(messages[:1000])
+
+    new = db.add_messages(messages)
+
+    assert len(new) == 1000
+    assert db.count_messages("c1") == 2000
@@ -118,15 +118,13 @@ class TestEmailNotificationService:
     def mock_database_service(self):
         """模拟数据库服务"""
         mock_service = AsyncMock()
-        # 模拟技师查询结果
-        mock_service.search_therapists.return_value = [
-            {
-                "id": 1,
-                "name": "李技师",
-                "phone": "13812345678",
-                "store_name": "中心店"
-            }
-        ]
+        # 模拟技师索引查询结果
+        mock_service.get_therapist.return_value = {
+            "id": 1,
+            "name": "李技师",
+            "phone": "13812345678",
+            "store_name": "中心店"
+        }
         return mock_service
     
     @pytest.fixture
@@ -185,7 +183,8 @@ class TestEmailNotificationService:
         assert "13812345678@163.com" in result["message"]
         
         # 验证数据库查询被调用
-        mock_database_service.search_therapists.assert_called_once()
+        mock_database_service.get_therapist.assert_called_once_with(1)
+        mock_database_service.search_therapists.assert_not_called()
         
         # 验证邮件发送器被正确调用
         mock_email_sender.execute.assert_called_once()
@@ -257,8 +256,8 @@ class TestEmailNotificationService:
             "appointment_time": "14:00"
         }
         
-        # 模拟技师查询为空
-        mock_database_service.search_therapists.return_value = []
+        # 模拟技师索引中不存在
+        mock_database_service.get_therapist.return_value = None
         
         result = await email_service.send_therapist_notification_email(appointment_info)
         
@@ -348,9 +347,9 @@ class TestEmailNotificationPerformance:
         # 模拟并发发送
         mock_email_sender = AsyncMock()
         mock_database_service = AsyncMock()
-        mock_database_service.search_therapists.return_value = [{
+        mock_database_service.get_therapist.return_value = {
             "id": 1, "name": "李技师", "phone": "13812345678"
-        }]
+        }
         
         email_service = EmailNotificationService(
             email_sender=mock_email_sender,
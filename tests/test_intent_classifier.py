@@ -0,0 +1,129 @@
+"""
+测试本地意图识别快速路径
+"""
+
+import sqlite3
+import pytest
+
+from aiclient.intent import IntentClassifier, Intent, KNOWLEDGE_TABLE, load_history_examples
+
+from conftest import FakeAdapter, make_client
+
+
+class TestIntentRules:
+    """测试关键词规则"""
+
+    def setup_method(self):
+        self.classifier = IntentClassifier()
+
+    @pytest.mark.parametrize("message,intent", [
+        ("营业时间？", Intent.HOURS),
+        ("晚上开到几点", Intent.HOURS),
+        ("周末营业吗", Intent.HOURS),
+        ("你们店在哪里", Intent.ADDRESS),
+        ("团购能退吗？", Intent.REFUND),
+        ("有女技师吗", Intent.FEMALE_THERAPIST),
+        ("可以用医保吗", Intent.INSURANCE),
+    ])
+    def test_static_intents_are_answered(self, message, intent):
+        result = self.classifier.classify(message)
+        assert result.intent == intent
+        assert result.answer == KNOWLEDGE_TABLE[intent].answer
+
+    @pytest.mark.parametrize("message", [
+        "我想预约",
+        "女技师明天有空吗",
+        "今天还有位置吗",
+        "下午3点可以吗",
+        "好的",
+        "营业执照有吗",
+    ])
+    def test_booking_and_unknown_go_to_llm(self, message):
+        assert self.classifier.classify(message).answer is None
+
+    def test_parking_is_recognized_but_not_answered(self):
+        """停车信息未配置，识别出意图但不做本地回答"""
+        result = self.classifier.classify("有停车位吗")
+        assert result.intent == Intent.PARKING
+        assert result.answer is None
+
+    def test_ambiguous_static_keywords_go_to_llm(self):
+        """同时命中多个静态意图时不做本地回答"""
+        assert self.classifier.classify("停车场在哪里").answer is None
+
+
+def test_history_examples_are_weakly_labelled(tmp_path):
+    """历史数据库中规则能确定意图的客户消息作为训练样本"""
+    db_path = str(tmp_path / "history.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE messages (id TEXT, chat_id TEXT, role TEXT, content TEXT)")
+    conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?)", [
+        ("1", "c1", "user", "[客户] 几点关门啊"),
+        ("2", "c1", "assistant", "营业到21:00"),
+        ("3", "c2", "user", "按得疼吗"),
+    ])
+    conn.commit()
+    conn.close()
+
+    assert load_history_examples(db_path) == [("几点关门", Intent.HOURS)]
+
+
+def test_model_generalizes_to_paraphrases():
+    """TF-IDF模型识别规则未覆盖的说法"""
+    pytest.importorskip("numpy")
+    classifier = IntentClassifier(min_confidence=0.3)
+    assert classifier.train()
+
+    result = classifier.classify("能刷社保吗")
+    assert result.source == "model"
+    assert result.intent == Intent.INSURANCE
+
+
+class TestClientFastPath:
+    """测试AIClient的本地快速路径"""
+
+    def setup_method(self):
+        self.adapter = FakeAdapter(content="AI回复")
+        self.client = make_client(self.adapter)
+
+    @pytest.mark.asyncio
+    async def test_static_question_skips_llm(self):
+        response = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+
+        assert self.adapter.calls == 0
+        assert response.provider == "local"
+        assert response.intent == Intent.HOURS
+        assert self.client.get_status()["intent_classifier"]["fast_path"] == 1
+
+    @pytest.mark.asyncio
+    async def test_follow_up_depending_on_history_uses_llm(self):
+        """有更早的对话时，承接上文的追问交给AI，完整的静态问题仍在本地回答"""
+        history = [
+            {"role": "user", "content": "我是张三"},
+            {"role": "assistant", "content": "张三您好"},
+        ]
+
+        follow_up = await self.client.generate_customer_service_reply(
+            "那个能用医保吗", conversation_history=history + [{"role": "user", "content": "那个能用医保吗"}]
+        )
+        standalone = await self.client.generate_customer_service_reply(
+            "营业时间？", conversation_history=history + [{"role": "user", "content": "营业时间？"}]
+        )
+
+        assert follow_up.content == "AI回复"
+        assert self.adapter.calls == 1
+        assert standalone.provider == "local"
+
+    @pytest.mark.asyncio
+    async def test_booking_question_uses_llm(self):
+        response = await self.client.generate_customer_service_reply("我想预约", conversation_history=[])
+
+        assert self.adapter.calls == 1
+        assert response.content == "AI回复"
+
+    @pytest.mark.asyncio
+    async def test_stream_static_question(self):
+        deltas = [d async for d in self.client.stream_customer_service_reply("医保能用吗", conversation_history=[])]
+
+        assert self.adapter.calls == 0
+        assert deltas[0].content == KNOWLEDGE_TABLE[Intent.INSURANCE].answer
@@ -0,0 +1,138 @@
+"""
+测试memory_update的增量协议：序号、服务器游标和完整快照重同步
+"""
+
+import importlib
+import os
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+class IdleClient:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """使用临时数据库、不生成AI回复的服务器"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(tmp_path / "history.db")
+    manager.conn = None
+    manager._init_db()
+    module = importlib.import_module("server")
+    monkeypatch.setattr(module, "db_manager", manager)
+    monkeypatch.setattr(module.Config, "AI_DEBOUNCE_SECONDS", 60.0)
+    monkeypatch.setattr(module.Config, "AI_DEBOUNCE_MAX_SECONDS", 60.0)
+    instance = module.DianpingWebSocketServer()
+    instance.db = manager
+    return instance
+
+
+def item(seq, content, role="user"):
+    return {"role": role, "content": content, "seq": seq}
+
+
+def snapshot(items, session="s1"):
+    return {"type": "memory_update", "payload": {
+        "chatId": "c1", "contactName": "张三", "session": session, "conversationMemory": items
+    }}
+
+
+def delta(items, base_seq, session="s1"):
+    return {"type": "memory_update", "payload": {
+        "chatId": "c1", "contactName": "张三", "session": session, "baseSeq": base_seq, "messages": items
+    }}
+
+
+async def update(server, message):
+    return await server.handle_memory_update(message, "t")
+
+
+@pytest.mark.asyncio
+async def test_snapshot_then_delta_advances_cursor(server):
+    await server.ai_client.close()
+    server.ai_client = IdleClient()
+
+    first = await update(server, snapshot([item(1, "你好"), item(2, "您好", "assistant")]))
+    assert first["memoryCursor"] == 2
+    assert first["session"] == "s1"
+
+    second = await update(server, delta([item(3, "明天有空吗")], base_seq=2))
+    assert second["type"] == "memory_updated_and_ai_queued"
+    assert second["new_messages_count"] == 1
+    assert second["memoryCursor"] == 3
+    assert server.db.count_messages("c1") == 3
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_already_acknowledged_messages_are_not_rehashed(server, monkeypatch):
+    await server.ai_client.close()
+    server.ai_client = IdleClient()
+    items = [item(i, f"消息{i}") for i in range(1, 21)]
+    await update(server, snapshot(items))
+
+    hashed = []
+    generate_id = server.db._generate_message_id
+    monkeypatch.setattr(server.db, "_generate_message_id", lambda m: hashed.append(m) or generate_id(m))
+
+    # 扩展未收到确认，重发全部记忆：游标之前的消息直接跳过
+    response = await update(server, snapshot(items + [item(21, "新消息")]))
+
+    assert [m["content"] for m in hashed if m.get("seq")] == ["新消息"]
+    assert response["new_messages_count"] == 1
+    assert response["memoryCursor"] == 21
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_gap_in_delta_requests_resync(server):
+    await server.ai_client.close()
+    server.ai_client = IdleClient()
+    await update(server, snapshot([item(1, "你好")]))
+
+    response = await update(server, delta([item(3, "第三条")], base_seq=1))
+
+    assert response["type"] == "memory_resync"
+    assert response["chatId"] == "c1"
+    assert server.db.count_messages("c1") == 1
+
+    recovered = await update(server, snapshot([item(1, "你好"), item(2, "第二条"), item(3, "第三条")]))
+    assert recovered["new_messages_count"] == 2
+    assert recovered["memoryCursor"] == 3
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_unknown_session_with_acknowledged_base_requests_resync(server):
+    await server.ai_client.close()
+    server.ai_client = IdleClient()
+
+    # 服务器重启后不知道扩展已确认到哪里
+    restarted = await update(server, delta([item(8, "在吗")], base_seq=7))
+    assert restarted["type"] == "memory_resync"
+
+    # 页面刷新后的新会话从0开始，不需要快照
+    fresh = await update(server, delta([item(1, "在吗")], base_seq=0, session="s2"))
+    assert fresh["memoryCursor"] == 1
+    await server.stop()
+
+
+@pytest.mark.asyncio
+async def test_legacy_snapshot_without_session_has_no_cursor(server):
+    await server.ai_client.close()
+    server.ai_client = IdleClient()
+
+    response = await update(server, {"type": "memory_update", "payload": {
+        "chatId": "c1", "contactName": "张三", "conversationMemory": [{"role": "user", "content": "你好"}]
+    }})
+
+    assert response["type"] == "memory_updated_and_ai_queued"
+    assert "memoryCursor" not in response
+    await server.stop()
@@ -0,0 +1,106 @@
+"""
+测试OpenAI兼容接口替身
+"""
+
+import random
+
+import pytest
+
+from aiclient import AIClient, AIProvider
+from aiclient.config import ModelConfig
+from aiclient.adapters import OpenAIAdapter
+from aiclient.models import AIStreamAccumulator
+from aiclient.testing import MockLLMServer, MockBookingAPI, LLMServerConfig, LatencyProfile
+from aiclient.testing.llm_api import plan_reply
+
+HISTORY = [
+    {"role": "user", "content": "你好"},
+    {"role": "assistant", "content": "您好，请问有什么可以帮您？"},
+]
+
+
+def _adapter(base_url):
+    return OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI, model_name="mock-model", api_key="mock-key",
+        base_url=base_url, max_retries=1
+    ))
+
+
+def test_latency_profiles():
+    rng = random.Random(0)
+    assert LatencyProfile("fixed", median_ms=100).sample(rng) == 100
+    uniform = [LatencyProfile("uniform", min_ms=50, max_ms=150).sample(rng) for _ in range(200)]
+    assert 50 <= min(uniform) and max(uniform) <= 150
+    lognormal = sorted(LatencyProfile("lognormal", median_ms=100, sigma=0.5).sample(rng) for _ in range(2001))
+    assert 85 < lognormal[1000] < 115
+    tail = LatencyProfile("fixed", median_ms=10, tail_probability=1.0, tail_ms=500)
+    assert tail.sample(rng) == 510
+
+
+def test_plan_reply_calls_tool_then_answers():
+    config = LLMServerConfig()
+    tools = [{"type": "function", "function": {"name": "get_stores"}}]
+    payload = {"messages": [{"role": "user", "content": "你们有哪些门店"}], "tools": tools}
+
+    content, tool_calls = plan_reply(config, payload, 1)
+    assert content == ""
+    assert tool_calls[0]["function"]["name"] == "get_stores"
+
+    payload["messages"] += [
+        {"role": "assistant", "content": None, "tool_calls": tool_calls},
+        {"role": "tool", "tool_call_id": "call_1", "content": "{}"},
+    ]
+    content, tool_calls = plan_reply(config, payload, 2)
+    assert tool_calls == [] and content
+
+    # 请求不带工具时直接回复
+    assert plan_reply(config, {"messages": payload["messages"][:1]}, 3)[1] == []
+
+
+@pytest.mark.asyncio
+async def test_streaming_tool_calls():
+    async with MockLLMServer() as llm:
+        adapter = _adapter(llm.base_url)
+        request = adapter.create_customer_service_prompt_with_history("宜山路店有哪些技师", HISTORY)
+        accumulator = AIStreamAccumulator()
+        async for delta in adapter.chat_completion_stream(request):
+            accumulator.add(delta)
+        response = accumulator.to_response()
+        await adapter.close()
+
+    assert response.finish_reason == "tool_calls"
+    assert response.tool_calls[0]["function"]["name"] == "search_therapists"
+    assert response.usage["prompt_tokens"] > 0
+
+
+@pytest.mark.asyncio
+async def test_injected_failure():
+    async with MockLLMServer(LLMServerConfig(failure_rate=1.0, failure_status=503)) as llm:
+        adapter = _adapter(llm.base_url)
+        with pytest.raises(Exception, match="503"):
+            await adapter.chat_completion(adapter.create_customer_service_prompt("你好"))
+        await adapter.close()
+    assert llm.stats["injected_failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_end_to_end_with_tools(monkeypatch):
+    """AIClient经由环境变量指向替身，完成一次带工具调用的回复"""
+    async with MockLLMServer(LLMServerConfig(latency=LatencyProfile("fixed", median_ms=5))) as llm, \
+            MockBookingAPI() as booking:
+        for name, value in {
+            "OPENAI_API_KEY": "mock-key", "OPENAI_BASE_URL": llm.base_url,
+            "DEEPSEEK_API_KEY": "", "ZHIPU_API_KEY": "",
+            "BOOKING_API_BASE_URL": booking.base_url,
+            "AI_REPLY_CACHE": "false", "AI_INTENT_FAST_PATH": "false",
+        }.items():
+            monkeypatch.setenv(name, value)
+
+        async with AIClient() as client:
+            response = await client.generate_customer_service_reply("你们有哪些门店", conversation_history=HISTORY)
+
+    assert response.provider == "openai"
+    assert "已为您查询" in response.content
+    assert [t["name"] for t in response.tool_latencies] == ["get_stores"]
+    assert llm.stats["requests"] == 2
+    assert booking.stats["GET /api/stores"] == 1
@@ -0,0 +1,93 @@
+"""
+测试静态提示词前缀与提供商前缀缓存统计
+"""
+
+import pytest
+
+from aiclient import AIProvider, AIResponse
+from aiclient.config import ModelConfig
+from aiclient.adapters import OpenAIAdapter, DeepSeekAdapter
+from aiclient.adapters.base import CUSTOMER_SERVICE_PROMPT_WITH_HISTORY
+from aiclient.models import AIStreamAccumulator, AIStreamDelta
+
+from conftest import FakeAdapter, make_client
+
+
+def _history(count):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"消息{i}"}
+        for i in range(count)
+    ]
+
+
+class TestStaticPrefix:
+    """测试请求前缀稳定性"""
+
+    def setup_method(self):
+        self.adapter = OpenAIAdapter(ModelConfig(
+            provider=AIProvider.OPENAI, model_name="gpt-4o-mini", api_key="test-key"
+        ))
+
+    def test_prefix_is_identical_across_requests(self):
+        """不同客户消息的请求共享系统提示词与同一份工具列表"""
+        first = self.adapter.create_customer_service_prompt_with_history("有哪些门店", _history(4))
+        second = self.adapter.create_customer_service_prompt_with_history("我想预约", _history(6))
+
+        assert first.messages[0].content == second.messages[0].content == CUSTOMER_SERVICE_PROMPT_WITH_HISTORY
+        assert first.tools is second.tools
+        assert [m.content for m in first.messages[1:5]] == [m.content for m in second.messages[1:5]]
+
+    def test_customer_message_not_in_system_prompt(self):
+        """无历史时系统提示词也不拼接客户消息"""
+        request = self.adapter.create_customer_service_prompt("营业时间？")
+        other = self.adapter.create_customer_service_prompt("停车？")
+
+        assert request.messages[0].content == other.messages[0].content
+        assert request.messages[-1].content == "营业时间？"
+
+    def test_no_tools_without_function_calling(self):
+        adapter = DeepSeekAdapter(ModelConfig(
+            provider=AIProvider.DEEPSEEK, model_name="deepseek-chat", api_key="test-key"
+        ))
+        assert adapter.create_customer_service_prompt_with_history("你好", _history(2)).tools is None
+
+
+class TestCachedTokens:
+    """测试cached_tokens提取"""
+
+    def test_openai_usage(self):
+        response = AIResponse(content="", model="m", provider="openai", usage={
+            "prompt_tokens": 2000, "completion_tokens": 20,
+            "prompt_tokens_details": {"cached_tokens": 1792}
+        })
+        assert response.cached_tokens == 1792
+
+    def test_deepseek_usage(self):
+        response = AIResponse(content="", model="m", provider="deepseek", usage={
+            "prompt_tokens": 2000, "prompt_cache_hit_tokens": 1920, "prompt_cache_miss_tokens": 80
+        })
+        assert response.cached_tokens == 1920
+
+    def test_missing_usage(self):
+        assert AIResponse(content="", model="m", provider="zhipu", usage={"prompt_tokens": 10}).cached_tokens is None
+
+    def test_stream_accumulator(self):
+        accumulator = AIStreamAccumulator()
+        accumulator.add(AIStreamDelta(content="你好"))
+        accumulator.add(AIStreamDelta(usage={"prompt_tokens": 100, "prompt_tokens_details": {"cached_tokens": 64}}))
+        assert accumulator.to_response().cached_tokens == 64
+
+
+@pytest.mark.asyncio
+async def test_client_reports_prompt_cache_savings():
+    usage = {"prompt_tokens": 1000, "prompt_cache_hit_tokens": 768}
+    adapter = FakeAdapter(provider=AIProvider.DEEPSEEK, responses=[
+        AIResponse(content="好的", model="fake-model", provider="deepseek", usage=usage) for _ in range(2)
+    ])
+    client = make_client(adapter, intent_classifier=False, reply_cache=False)
+
+    await client.generate_customer_service_reply("按得疼吗", conversation_history=[])
+    await client.generate_customer_service_reply("按得疼吗", conversation_history=[])
+
+    stats = client.get_status()["prompt_cache"]
+    assert stats == {"responses": 2, "prompt_tokens": 2000, "cached_tokens": 1536, "hit_ratio": 0.768}
@@ -0,0 +1,173 @@
+"""
+测试健康感知的提供商路由、熔断与对冲请求
+"""
+
+import pytest
+
+from aiclient import AIProvider
+from aiclient.router import ProviderRouter, CircuitState
+
+from conftest import FakeAdapter, make_client
+
+
+class TestProviderRouter:
+    """测试路由器统计与熔断"""
+
+    def test_static_priority_without_stats(self):
+        """无统计数据时按静态优先级"""
+        router = ProviderRouter([AIProvider.OPENAI, AIProvider.ZHIPU])
+        assert router.candidates() == [AIProvider.OPENAI, AIProvider.ZHIPU]
+
+    def test_prefers_lower_latency(self):
+        """延迟EWMA更低的提供商排在前面"""
+        router = ProviderRouter([AIProvider.OPENAI, AIProvider.ZHIPU])
+        router.record_success(AIProvider.OPENAI, 3000)
+        router.record_success(AIProvider.ZHIPU, 500)
+        assert router.candidates()[0] == AIProvider.ZHIPU
+
+    def test_circuit_opens_after_threshold(self):
+        """连续失败达到阈值后熔断"""
+        router = ProviderRouter([AIProvider.OPENAI, AIProvider.ZHIPU], failure_threshold=2)
+        router.record_failure(AIProvider.OPENAI)
+        assert router.is_available(AIProvider.OPENAI)
+        router.record_failure(AIProvider.OPENAI)
+        assert not router.is_available(AIProvider.OPENAI)
+        assert router.candidates() == [AIProvider.ZHIPU]
+        assert router.candidates(preferred=AIProvider.OPENAI) == [AIProvider.ZHIPU]
+
+    def test_half_open_after_cooldown(self):
+        """冷却后半开，成功则关闭，失败则立即重新打开"""
+        router = ProviderRouter([AIProvider.OPENAI], failure_threshold=1, open_duration=0)
+        router.record_failure(AIProvider.OPENAI)
+        assert router.is_available(AIProvider.OPENAI)
+        assert router.health[AIProvider.OPENAI].state == CircuitState.HALF_OPEN
+
+        router.record_failure(AIProvider.OPENAI)
+        assert router.health[AIProvider.OPENAI].state == CircuitState.OPEN
+
+        router.record_success(AIProvider.OPENAI, 100)
+        assert router.health[AIProvider.OPENAI].state == CircuitState.CLOSED
+
+    def test_all_open_still_returns_candidates(self):
+        """全部熔断时仍返回候选作为兜底"""
+        router = ProviderRouter([AIProvider.OPENAI, AIProvider.ZHIPU], failure_threshold=1)
+        router.record_failure(AIProvider.OPENAI)
+        router.record_failure(AIProvider.ZHIPU)
+        assert router.candidates() == [AIProvider.OPENAI, AIProvider.ZHIPU]
+
+
+class TestClientRouting:
+    """测试AIClient的路由与快速失败"""
+
+    def setup_method(self):
+        self.primary = FakeAdapter(provider=AIProvider.OPENAI, fail=True)
+        self.backup = FakeAdapter(provider=AIProvider.DEEPSEEK)
+        self.client = make_client(self.primary, self.backup, intent_classifier=False)
+
+    @pytest.mark.asyncio
+    async def test_fail_fast_to_backup(self):
+        """有备用提供商时首选只尝试一次，立即切换"""
+        response = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+
+        assert response.provider == "deepseek"
+        assert self.primary.requests[0].max_retries == 1
+        # 最后一个备用提供商使用完整重试
+        assert self.backup.requests[0].max_retries is None
+
+    @pytest.mark.asyncio
+    async def test_routes_away_after_failure(self):
+        """失败后错误率上升，新请求直接路由到健康的提供商"""
+        await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+        response = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+
+        assert response.provider == "deepseek"
+        assert len(self.primary.requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_overrides_preferred_provider(self):
+        """熔断后即使指定首选提供商也不再调用"""
+        threshold = self.client.config.routing.failure_threshold
+        for _ in range(threshold):
+            await self.client.generate_customer_service_reply(
+                "营业时间？", preferred_provider=AIProvider.OPENAI, conversation_history=[]
+            )
+        assert len(self.primary.requests) == threshold
+
+        response = await self.client.generate_customer_service_reply(
+            "营业时间？", preferred_provider=AIProvider.OPENAI, conversation_history=[]
+        )
+
+        assert response.provider == "deepseek"
+        assert len(self.primary.requests) == threshold
+        stats = self.client.get_status()["provider_health"]
+        assert stats["openai"]["state"] == CircuitState.OPEN
+
+
+class TestHedging:
+    """测试对冲请求"""
+
+    def setup_method(self):
+        self.client = make_client(intent_classifier=False)
+        self.client.config.routing.hedging_enabled = True
+        self.client.config.routing.hedge_default_delay_ms = 50
+
+    @pytest.mark.asyncio
+    async def test_hedge_fires_and_wins_when_primary_is_slow(self):
+        """首选过慢时对冲请求先完成，首选请求被取消"""
+        primary = FakeAdapter(provider=AIProvider.OPENAI, delay=1.0)
+        backup = FakeAdapter(provider=AIProvider.DEEPSEEK, delay=0.01)
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: backup}
+
+        response = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+
+        assert response.provider == "deepseek"
+        assert primary.cancelled is True
+        assert self.client.get_hedge_stats() == {"eligible": 1, "fired": 1, "won": 1}
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_when_primary_is_fast(self):
+        """首选在对冲等待时间内返回时不发对冲请求"""
+        primary = FakeAdapter(provider=AIProvider.OPENAI)
+        backup = FakeAdapter(provider=AIProvider.DEEPSEEK)
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: backup}
+
+        response = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+
+        assert response.provider == "openai"
+        assert backup.requests == []
+        assert self.client.get_hedge_stats()["fired"] == 0
+
+    @pytest.mark.asyncio
+    async def test_hedge_delay_uses_latency_percentile(self):
+        """样本充足时按近期延迟百分位确定对冲等待时间"""
+        self.client.config.routing.hedge_min_samples = 10
+        self.client.config.routing.hedge_percentile = 90
+        self.client.adapters = {
+            AIProvider.OPENAI: FakeAdapter(provider=AIProvider.OPENAI),
+            AIProvider.DEEPSEEK: FakeAdapter(provider=AIProvider.DEEPSEEK),
+        }
+        self.client._candidate_providers()
+        for latency in range(100, 1100, 100):
+            self.client.router.record_success(AIProvider.OPENAI, latency)
+
+        assert self.client._hedge_delay(AIProvider.OPENAI) == pytest.approx(0.9)
+
+    @pytest.mark.asyncio
+    async def test_cancelled_primary_keeps_percentile_from_drifting(self):
+        """对冲胜出时首选的等待时间计入窗口，百分位不会只剩快速样本而持续下降"""
+        self.client.reply_cache = None
+        self.client.config.routing.hedge_min_samples = 4
+        self.client.config.routing.hedge_percentile = 90
+        primary = FakeAdapter(provider=AIProvider.OPENAI)
+        backup = FakeAdapter(provider=AIProvider.DEEPSEEK, delay=0.01)
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: backup}
+
+        # 首选一半请求很快，一半很慢（慢的都会被对冲取消）
+        for i in range(10):
+            primary.delay = 0.005 if i % 2 == 0 else 0.5
+            await self.client.generate_customer_service_reply(
+                "营业时间？", preferred_provider=AIProvider.OPENAI, conversation_history=[]
+            )
+
+        assert self.client.get_hedge_stats()["won"] == 5
+        assert self.client._hedge_delay(AIProvider.OPENAI) >= 0.05
@@ -0,0 +1,141 @@
+"""
+测试客服回复缓存
+"""
+
+import pytest
+
+from aiclient.reply_cache import ReplyCache, normalize_message, is_cacheable_message
+
+from conftest import FakeAdapter, make_client, text_response, tool_call, tool_response
+
+
+class TestNormalization:
+    """测试消息归一化与可缓存判断"""
+
+    def test_full_width_and_punctuation_folding(self):
+        """全角/半角、标点、客套语与语气词归一"""
+        assert normalize_message("营业时间？") == "营业时间"
+        assert normalize_message("请问 营业时间是?") == normalize_message("营业时间是")
+        assert normalize_message("[客户] 可以用医保吗？！") == "可以用医保"
+        assert normalize_message("ＷＩＦＩ密码") == "wifi密码"
+
+    def test_context_dependent_messages_are_not_cacheable(self):
+        """依赖上下文或需要工具的消息不缓存"""
+        assert is_cacheable_message(normalize_message("有停车位吗"))
+        assert not is_cacheable_message(normalize_message("明天下午3点可以预约吗"))
+        assert not is_cacheable_message(normalize_message("那个技师在吗"))
+        assert not is_cacheable_message(normalize_message("好的"))
+
+
+class TestReplyCache:
+    """测试LRU与TTL淘汰"""
+
+    def test_lru_eviction(self):
+        cache = ReplyCache(max_entries=2)
+        cache.put(("v", "a"), text_response("A"))
+        cache.put(("v", "b"), text_response("B"))
+        cache.get(("v", "a"))
+        cache.put(("v", "c"), text_response("C"))
+
+        assert cache.get(("v", "b")) is None
+        assert cache.get(("v", "a")).content == "A"
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_ttl_expiry(self):
+        cache = ReplyCache(ttl=0)
+        cache.put(("v", "a"), text_response("A"))
+
+        assert cache.get(("v", "a")) is None
+        assert cache.get_stats()["expired"] == 1
+
+    def test_prompt_version_is_part_of_key(self):
+        cache = ReplyCache()
+        assert cache.make_key("营业时间？", "v1") != cache.make_key("营业时间？", "v2")
+
+
+class TestClientReplyCache:
+    """测试AIClient对回复缓存的使用"""
+
+    def setup_method(self):
+        self.client = make_client(intent_classifier=False)
+
+    @pytest.mark.asyncio
+    async def test_identical_questions_cost_one_llm_call(self):
+        """不同聊天中的相同问题只调用一次AI"""
+        adapter = FakeAdapter([text_response("营业时间：9:00–21:00")])
+        self.client.adapters = {adapter.config.provider: adapter}
+
+        first = await self.client.generate_customer_service_reply("营业时间？", conversation_history=[])
+        second = await self.client.generate_customer_service_reply("请问，营业时间?", conversation_history=[])
+
+        assert adapter.calls == 1
+        assert first.from_cache is False
+        assert second.from_cache is True
+        assert second.content == first.content
+        assert self.client.get_status()["reply_cache"]["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_history_holding_only_the_current_message_is_cached(self):
+        """服务器先存入本轮消息再加载历史，历史里只有本轮消息时仍可共享缓存"""
+        adapter = FakeAdapter([text_response("营业时间：9:00–21:00")])
+        self.client.adapters = {adapter.config.provider: adapter}
+
+        first = await self.client.generate_customer_service_reply(
+            "营业时间？", conversation_history=[{"role": "user", "content": "营业时间？"}]
+        )
+        second = await self.client.generate_customer_service_reply(
+            "请问营业时间", conversation_history=[{"role": "user", "content": "[客户] 请问营业时间"}]
+        )
+        followup = await self.client.generate_customer_service_reply(
+            "营业时间？", conversation_history=[
+                {"role": "user", "content": "我是张三"},
+                {"role": "assistant", "content": "张三您好"},
+                {"role": "user", "content": "营业时间？"},
+            ]
+        )
+
+        assert second.from_cache is True
+        assert second.content == first.content
+        assert followup.from_cache is False
+        assert adapter.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_tool_replies_are_not_cached(self):
+        """调用过工具的回复不写入缓存"""
+        adapter = FakeAdapter([
+            tool_response(tool_call("1", "get_stores")),
+            text_response("我们有两家门店"),
+            text_response("我们有两家门店"),
+        ])
+        self.client.adapters = {adapter.config.provider: adapter}
+
+        await self.client.generate_customer_service_reply("有哪些门店", conversation_history=[])
+        await self.client.generate_customer_service_reply("有哪些门店", conversation_history=[])
+
+        assert adapter.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_replies_conditioned_on_history_are_not_shared(self):
+        """带对话历史或摘要的回复不读也不写缓存，不会发给另一个聊天的客户"""
+        adapter = FakeAdapter([
+            text_response("张三您好，您明天15点的预约在总店"),
+            text_response("李四您好，您还没有预约"),
+            text_response("您之前约的是推拿"),
+        ])
+        self.client.adapters = {adapter.config.provider: adapter}
+
+        zhang = await self.client.generate_customer_service_reply(
+            "在哪个店", conversation_history=[{"role": "user", "content": "我是张三，约了明天15点"}]
+        )
+        li = await self.client.generate_customer_service_reply(
+            "在哪个店", conversation_history=[{"role": "user", "content": "我是李四"}]
+        )
+        summarized = await self.client.generate_customer_service_reply(
+            "在哪个店", conversation_history=[], conversation_summary="客户王五约过推拿"
+        )
+
+        assert adapter.calls == 3
+        assert li.content == "李四您好，您还没有预约"
+        assert not li.from_cache and not summarized.from_cache
+        assert zhang.content != li.content
+        assert self.client.get_status()["reply_cache"]["size"] == 0
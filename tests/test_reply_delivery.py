@@ -0,0 +1,267 @@
+"""
+测试AI回复按聊天定向发送，以及每个连接独立的发送队列
+"""
+
+import asyncio
+import importlib
+import json
+import os
+
+import pytest
+
+from aiclient.models import AIStreamDelta
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dianping-scraper", "backend")
+
+
+class ReplyClient:
+    """立即返回固定格式回复的AI客户端"""
+
+    async def generate_customer_service_reply(self, customer_message, conversation_history=None,
+                                              conversation_summary=None):
+        return type("Reply", (), {"content": f"回复：{customer_message}"})()
+
+    async def close(self):
+        pass
+
+
+class FakeWebSocket:
+    """记录发送内容；hang为True时发送永远不完成"""
+
+    def __init__(self, port, hang=False):
+        self.remote_address = ("127.0.0.1", port)
+        self.hang = hang
+        self.sent = []
+        self.closed = False
+
+    async def send(self, message):
+        if self.hang:
+            await asyncio.Event().wait()
+        self.sent.append(json.loads(message))
+
+    async def close(self):
+        self.closed = True
+
+
+def memory_update(chat_id, content):
+    return json.dumps({"type": "memory_update", "payload": {
+        "chatId": chat_id, "contactName": chat_id,
+        "conversationMemory": [{"role": "user", "content": content}]
+    }})
+
+
+def replies(websocket):
+    return [(m["chatId"], m["text"]) for m in websocket.sent if m["type"] == "sendAIReply"]
+
+
+@pytest.fixture
+def server_module(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(BACKEND_DIR)
+    database = importlib.import_module("database")
+    manager = object.__new__(database.DatabaseManager)
+    manager.db_path = str(tmp_path / "history.db")
+    manager.conn = None
+    manager._init_db()
+    module = importlib.import_module("server")
+    monkeypatch.setattr(module, "db_manager", manager)
+    monkeypatch.setattr(module.Config, "AI_STREAMING", False)
+    monkeypatch.setattr(module.Config, "SUMMARY_ENABLED", False)
+    monkeypatch.setattr(module.Config, "AI_DEBOUNCE_SECONDS", 0.0)
+    yield module
+    manager.close()
+
+
+async def make_server(server_module):
+    server = server_module.DianpingWebSocketServer()
+    await server.ai_client.close()
+    server.ai_client = ReplyClient()
+    return server
+
+
+async def settle(server):
+    await asyncio.wait_for(server.reply_queue.join(), 1)
+    for connection in list(server.connections.values()):
+        await asyncio.wait_for(connection.drain(), 1)
+
+
+async def shutdown(server):
+    await server.reply_queue.stop()
+    for websocket in list(server.connections):
+        await server.unregister_client(websocket)
+
+
+@pytest.mark.asyncio
+async def test_reply_goes_only_to_connection_that_owns_chat(server_module):
+    server = await make_server(server_module)
+    shop_a, shop_b = FakeWebSocket(1), FakeWebSocket(2)
+    await server.register_client(shop_a)
+    await server.register_client(shop_b)
+
+    await server.handle_message(shop_a, memory_update("chat_a", "你好"))
+    await server.handle_message(shop_b, memory_update("chat_b", "在吗"))
+    await settle(server)
+    await shutdown(server)
+
+    assert replies(shop_a) == [("chat_a", "回复：你好")]
+    assert replies(shop_b) == [("chat_b", "回复：在吗")]
+
+
+@pytest.mark.asyncio
+async def test_context_switch_moves_chat_to_new_connection(server_module):
+    server = await make_server(server_module)
+    old, new = FakeWebSocket(1), FakeWebSocket(2)
+    await server.register_client(old)
+    await server.register_client(new)
+
+    await server.handle_message(old, memory_update("c1", "你好"))
+    await settle(server)
+    await server.handle_message(new, json.dumps({"type": "chat_context_switch", "payload": {"newChatId": "c1"}}))
+    await server.handle_message(new, memory_update("c1", "还在吗"))
+    await settle(server)
+    await shutdown(server)
+
+    assert replies(old) == [("c1", "回复：你好")]
+    assert replies(new) == [("c1", "回复：还在吗")]
+
+
+@pytest.mark.asyncio
+async def test_disconnect_releases_chats(server_module):
+    server = await make_server(server_module)
+    websocket = FakeWebSocket(1)
+    await server.register_client(websocket)
+    await server.handle_message(websocket, memory_update("c1", "你好"))
+    await settle(server)
+
+    await server.unregister_client(websocket)
+
+    assert "c1" not in server.chat_owners
+    assert server._send_to_chat("c1", {"type": "sendAIReply"}) is False
+    await shutdown(server)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_others(server_module, monkeypatch):
+    monkeypatch.setattr(server_module.Config, "SEND_TIMEOUT", 0.1)
+    server = await make_server(server_module)
+    slow, fast = FakeWebSocket(1, hang=True), FakeWebSocket(2)
+    await server.register_client(slow)
+    await server.register_client(fast)
+
+    # 慢连接的welcome卡住，但消息处理和另一个连接的回复不受影响
+    await asyncio.wait_for(server.handle_message(slow, memory_update("slow_chat", "你好")), 1)
+    await asyncio.wait_for(server.handle_message(fast, memory_update("fast_chat", "你好")), 1)
+    await asyncio.wait_for(server.reply_queue.join(), 1)
+    await asyncio.wait_for(server.connections[fast].drain(), 1)
+    assert replies(fast) == [("fast_chat", "回复：你好")]
+
+    # 发送超时后关闭慢连接，让扩展重连
+    await asyncio.sleep(0.2)
+    assert slow.closed
+    assert server.connections[slow].get_stats()["timeouts"] == 1
+    await shutdown(server)
+
+
+@pytest.mark.asyncio
+async def test_full_outbound_queue_drops_messages(server_module, monkeypatch):
+    monkeypatch.setattr(server_module.Config, "OUTBOUND_QUEUE_SIZE", 2)
+    server = await make_server(server_module)
+    websocket = FakeWebSocket(1, hang=True)
+    await server.register_client(websocket)
+    connection = server.connections[websocket]
+    await asyncio.sleep(0)  # 发送任务取出welcome后卡住
+
+    results = [connection.send({"type": "pong"}) for _ in range(4)]
+
+    assert results == [True, True, False, False]
+    assert connection.get_stats()["dropped"] == 2
+    await shutdown(server)
+
+
+class StreamingClient:
+    """流式返回回复；block中的消息推送第一个片段后卡住，直到被取消或release；
+    tool中的消息先输出一段文字并调用工具，再输出最终回复"""
+
+    def __init__(self, block=(), fail=(), tool=()):
+        self.block = set(block)
+        self.fail = set(fail)
+        self.tool = set(tool)
+        self.release = asyncio.Event()
+
+    async def stream_customer_service_reply(self, customer_message, conversation_history=None,
+                                            conversation_summary=None):
+        if customer_message in self.tool:
+            yield AIStreamDelta(content="我查一下")
+            yield AIStreamDelta(tool_calls=[{"index": 0, "id": "1", "function": {"name": "get_stores"}}])
+            yield AIStreamDelta(finish_reason="tool_calls")
+        yield AIStreamDelta(content="回复：")
+        if customer_message in self.block:
+            await self.release.wait()
+        if customer_message in self.fail:
+            raise Exception("stream broken")
+        yield AIStreamDelta(content=customer_message)
+
+    async def close(self):
+        pass
+
+
+def draft_frames(websocket):
+    return [(m["type"], m.get("version")) for m in websocket.sent if m["type"] in ("ai_reply_delta", "ai_reply_cancel")]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_clears_draft(server_module, monkeypatch):
+    monkeypatch.setattr(server_module.Config, "AI_STREAMING", True)
+    server = await make_server(server_module)
+    server.ai_client = StreamingClient(block={"你好"})
+    websocket = FakeWebSocket(1)
+    await server.register_client(websocket)
+
+    await server.handle_message(websocket, memory_update("c1", "你好"))
+    for _ in range(20):  # 等第一轮生成推送出第一个片段
+        await asyncio.sleep(0.01)
+        if draft_frames(websocket):
+            break
+    await server.handle_message(websocket, memory_update("c1", "在吗"))
+    await settle(server)
+    await shutdown(server)
+
+    assert draft_frames(websocket) == [
+        ("ai_reply_delta", 1), ("ai_reply_cancel", 1), ("ai_reply_delta", 2), ("ai_reply_delta", 2)
+    ]
+    cancel = next(m for m in websocket.sent if m["type"] == "ai_reply_cancel")
+    assert cancel["chatId"] == "c1" and cancel["reason"] == "cancelled"
+    assert replies(websocket) == [("c1", "回复：你好\n在吗")]
+
+
+@pytest.mark.asyncio
+async def test_stream_error_clears_draft(server_module, monkeypatch):
+    monkeypatch.setattr(server_module.Config, "AI_STREAMING", True)
+    server = await make_server(server_module)
+    server.ai_client = StreamingClient(fail={"你好"})
+    websocket = FakeWebSocket(1)
+    await server.register_client(websocket)
+
+    await server.handle_message(websocket, memory_update("c1", "你好"))
+    await settle(server)
+    await shutdown(server)
+
+    assert draft_frames(websocket) == [("ai_reply_delta", 1), ("ai_reply_cancel", 1)]
+    assert replies(websocket) == []
+
+
+@pytest.mark.asyncio
+async def test_text_before_tool_call_is_not_part_of_reply(server_module, monkeypatch):
+    monkeypatch.setattr(server_module.Config, "AI_STREAMING", True)
+    server = await make_server(server_module)
+    server.ai_client = StreamingClient(tool={"有哪些门店"})
+    websocket = FakeWebSocket(1)
+    await server.register_client(websocket)
+
+    await server.handle_message(websocket, memory_update("c1", "有哪些门店"))
+    await settle(server)
+    await shutdown(server)
+
+    seqs = [m["seq"] for m in websocket.sent if m["type"] == "ai_reply_delta"]
+    assert seqs == [0, 0, 1]  # 工具调用后的新一轮从0开始，扩展据此重置草稿
+    assert replies(websocket) == [("c1", "回复：有哪些门店")]
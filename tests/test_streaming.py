@@ -0,0 +1,121 @@
+"""
+测试流式聊天补全
+"""
+
+import json
+import pytest
+from contextlib import asynccontextmanager
+from aiohttp import web
+
+from aiclient.adapters.openai_adapter import OpenAIAdapter
+from aiclient.config import ModelConfig, AIProvider
+from aiclient.models import AIRequest, AIMessage, MessageRole, AIStreamAccumulator
+
+
+TEXT_CHUNKS = [
+    {"model": "mock-model", "choices": [{"delta": {"role": "assistant", "content": "您"}}]},
+    {"model": "mock-model", "choices": [{"delta": {"content": "好"}}]},
+    {"model": "mock-model", "choices": [{"delta": {}, "finish_reason": "stop"}]},
+    {"model": "mock-model", "choices": [], "usage": {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}},
+]
+
+TOOL_CHUNKS = [
+    {"choices": [{"delta": {"tool_calls": [
+        {"index": 0, "id": "call_1", "type": "function", "function": {"name": "get_stores", "arguments": ""}}
+    ]}}]},
+    {"choices": [{"delta": {"tool_calls": [
+        {"index": 0, "function": {"arguments": "{}"}}
+    ]}}]},
+    {"choices": [{"delta": {"tool_calls": [
+        {"index": 1, "id": "call_2", "type": "function",
+         "function": {"name": "search_therapists", "arguments": "{\"store_name\""}}
+    ]}}]},
+    {"choices": [{"delta": {"tool_calls": [
+        {"index": 1, "function": {"arguments": ": \"总店\"}"}}
+    ]}}]},
+    {"choices": [{"delta": {}, "finish_reason": "tool_calls"}]},
+]
+
+
+def _sse_handler(chunks):
+    async def handler(request):
+        body = await request.json()
+        assert body["stream"] is True
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for chunk in chunks:
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+    return handler
+
+
+@asynccontextmanager
+async def mock_server(chunks):
+    """启动返回SSE的本地模拟服务器"""
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", _sse_handler(chunks))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1"
+    await runner.cleanup()
+
+
+def _make_adapter(base_url: str) -> OpenAIAdapter:
+    return OpenAIAdapter(ModelConfig(
+        provider=AIProvider.OPENAI,
+        model_name="mock-model",
+        api_key="test-key",
+        base_url=base_url,
+        max_retries=1
+    ))
+
+
+def _make_request() -> AIRequest:
+    return AIRequest(messages=[AIMessage(role=MessageRole.USER, content="你好")])
+
+
+class TestStreaming:
+    """测试流式响应"""
+
+    @pytest.mark.asyncio
+    async def test_stream_text_deltas(self):
+        """文本增量按顺序产出并可合并"""
+        async with mock_server(TEXT_CHUNKS) as base_url:
+            adapter = _make_adapter(base_url)
+            try:
+                accumulator = AIStreamAccumulator(provider="openai")
+                contents = []
+                async for delta in adapter.chat_completion_stream(_make_request()):
+                    contents.append(delta.content)
+                    accumulator.add(delta)
+            finally:
+                await adapter.close()
+
+        assert "".join(contents) == "您好"
+        response = accumulator.to_response()
+        assert response.content == "您好"
+        assert response.finish_reason == "stop"
+        assert response.usage["total_tokens"] == 7
+        assert response.tool_calls is None
+
+    @pytest.mark.asyncio
+    async def test_stream_tool_call_deltas(self):
+        """工具调用增量按index合并"""
+        async with mock_server(TOOL_CHUNKS) as base_url:
+            adapter = _make_adapter(base_url)
+            try:
+                accumulator = AIStreamAccumulator(provider="openai")
+                async for delta in adapter.chat_completion_stream(_make_request()):
+                    accumulator.add(delta)
+            finally:
+                await adapter.close()
+
+        response = accumulator.to_response()
+        assert response.finish_reason == "tool_calls"
+        assert [c["function"]["name"] for c in response.tool_calls] == ["get_stores", "search_therapists"]
+        assert response.tool_calls[0]["id"] == "call_1"
+        assert json.loads(response.tool_calls[1]["function"]["arguments"]) == {"store_name": "总店"}
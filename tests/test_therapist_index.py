@@ -0,0 +1,146 @@
+"""
+测试技师内存索引
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from aiohttp import web
+
+from aiclient.database_service import DatabaseAPIService
+from aiclient.therapist_index import TherapistIndex, normalize_therapist_name
+
+ROSTER = [
+    {"id": 1, "name": "李明", "phone": "13812345678", "store_name": "宜山路店"},
+    {"id": 2, "name": "王芳", "phone": "13912345678", "store_name": "宜山路店"},
+    {"id": 3, "name": "Lily", "phone": "13712345678", "store_name": "静安店"},
+]
+
+
+@asynccontextmanager
+async def mock_therapist_api(roster):
+    """本地模拟技师接口，返回可修改的技师名单并统计请求次数"""
+    calls = []
+
+    async def therapists(request):
+        calls.append(dict(request.query))
+        return web.json_response({"therapists": roster})
+
+    app = web.Application()
+    app.router.add_get("/api/therapists", therapists)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/api", calls
+    await runner.cleanup()
+
+
+def test_normalize_therapist_name():
+    assert normalize_therapist_name(" 李明 技师") == "李明"
+    assert normalize_therapist_name("LILY老师") == "lily"
+    assert normalize_therapist_name("技师") == "技师"
+
+
+class TestTherapistIndex:
+    """测试索引的查找与刷新"""
+
+    @pytest.mark.asyncio
+    async def test_lookups(self):
+        async def loader():
+            return ROSTER
+
+        index = TherapistIndex(loader)
+        assert (await index.get(1))["name"] == "李明"
+        assert (await index.get("2"))["name"] == "王芳"
+        assert [t["id"] for t in await index.find_by_name("李明技师")] == [1]
+        assert [t["id"] for t in await index.find_by_name("lily")] == [3]
+        assert [t["id"] for t in await index.find_by_name("王")] == [2]
+        assert [t["id"] for t in await index.find_by_store("宜山路店")] == [1, 2]
+        assert await index.find_by_store("徐汇店") == []
+
+    @pytest.mark.asyncio
+    async def test_failed_refresh_keeps_previous_index(self):
+        responses = [ROSTER]
+
+        async def loader():
+            if not responses:
+                raise RuntimeError("API错误 502")
+            return responses.pop()
+
+        index = TherapistIndex(loader, refresh_interval=0)
+        await index.ensure_loaded()
+        await index.ensure_loaded()  # 已过期，后台刷新（失败）
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+
+        assert (await index.get(1))["name"] == "李明"
+        stats = index.get_stats()
+        assert stats["refresh_failures"] >= 1
+        assert stats["therapists"] == 3
+
+    @pytest.mark.asyncio
+    async def test_unknown_id_triggers_rate_limited_reload(self):
+        roster = list(ROSTER)
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            return list(roster)
+
+        index = TherapistIndex(loader, miss_refresh_interval=0)
+        await index.ensure_loaded()
+        roster.append({"id": 4, "name": "赵强", "phone": "13612345678"})
+
+        assert (await index.get(4))["name"] == "赵强"
+        assert len(loads) == 2
+
+    @pytest.mark.asyncio
+    async def test_unknown_ids_do_not_reload_after_failed_refresh(self):
+        """刷新失败也记录尝试时间；并发未命中只触发一次加载，之后的未命中直接返回None"""
+        loads = []
+
+        async def loader():
+            loads.append(1)
+            if len(loads) > 1:
+                await asyncio.sleep(0.01)
+                raise RuntimeError("API错误 502")
+            return ROSTER
+
+        index = TherapistIndex(loader, miss_refresh_interval=0.05)
+        await index.ensure_loaded()
+        await asyncio.sleep(0.05)
+
+        assert await asyncio.gather(index.get(98), index.get(99)) == [None, None]
+        assert len(loads) == 2
+        assert await index.get(98) is None
+        assert await index.get(100) is None
+        assert len(loads) == 2
+        assert index.get_stats()["refresh_failures"] == 1
+
+
+class TestDatabaseServiceTherapistIndex:
+    """测试DatabaseAPIService通过索引查找技师"""
+
+    @pytest.mark.asyncio
+    async def test_lookups_share_one_roster_request(self):
+        async with mock_therapist_api(ROSTER) as (base_url, calls):
+            service = DatabaseAPIService(base_url)
+            for therapist_id in (1, 2, 3, 1):
+                assert (await service.get_therapist(therapist_id))["id"] == therapist_id
+            assert [t["id"] for t in await service.search_therapists(therapist_name="王芳")] == [2]
+            assert [t["id"] for t in await service.search_therapists(store_name="静安店")] == [3]
+
+            assert calls == [{"action": "query_schedule"}]
+            await service.close()
+
+    @pytest.mark.asyncio
+    async def test_combined_filters_still_query_api(self):
+        async with mock_therapist_api(ROSTER) as (base_url, calls):
+            service = DatabaseAPIService(base_url)
+            await service.search_therapists(therapist_name="李明", service_type="推拿")
+
+            assert calls == [{"action": "query_schedule", "therapist_name": "李明", "service_type": "推拿"}]
+            await service.close()
@@ -0,0 +1,201 @@
+"""
+测试AIClient的工具调用执行与多轮工具调用循环
+"""
+
+import json
+import time
+import pytest
+
+from aiclient import AIClient, AIProvider, AIResponse
+from aiclient.models import AIMessage, AIRequest, MessageRole
+
+from conftest import FakeAdapter, tool_call, tool_response, text_response
+
+
+HISTORY = [{"role": "user", "content": "我想预约"}, {"role": "assistant", "content": "好的，请提供姓名和电话"}]
+
+
+class TestToolExecution:
+    """测试工具调用执行"""
+
+    def setup_method(self):
+        self.client = AIClient()
+
+    @pytest.mark.asyncio
+    async def test_independent_tools_run_concurrently(self):
+        """独立工具并发执行，总耗时接近最慢的一个"""
+        adapter = FakeAdapter(tool_delays={
+            "search_therapists": 0.2, "get_stores": 0.2, "query_therapist_availability": 0.2
+        })
+        tool_calls = [
+            tool_call("1", "search_therapists"),
+            tool_call("2", "get_stores"),
+            tool_call("3", "query_therapist_availability"),
+        ]
+
+        started = time.perf_counter()
+        results = await self.client._execute_tool_calls(adapter, tool_calls)
+        elapsed = time.perf_counter() - started
+
+        assert elapsed < 0.5
+        assert [r["tool_call_id"] for r in results] == ["1", "2", "3"]
+        assert all(r["success"] for r in results)
+
+    @pytest.mark.asyncio
+    async def test_timeout_yields_partial_results(self):
+        """超时的工具返回失败结果，其余工具结果保留"""
+        self.client.config.tool_execution.timeouts["search_therapists"] = 0.05
+        adapter = FakeAdapter(tool_delays={"search_therapists": 1.0})
+        tool_calls = [tool_call("1", "search_therapists"), tool_call("2", "get_stores")]
+
+        results = await self.client._execute_tool_calls(adapter, tool_calls)
+
+        assert results[0]["success"] is False
+        assert "超时" in json.loads(results[0]["content"])["message"]
+        assert results[1]["success"] is True
+
+    @pytest.mark.asyncio
+    async def test_side_effect_tools_run_in_order(self):
+        """有副作用的工具在只读工具之后按顺序执行"""
+        adapter = FakeAdapter(tool_delays={"create_appointment": 0.05, "get_stores": 0.05})
+        tool_calls = [
+            tool_call("1", "create_appointment"),
+            tool_call("2", "send_appointment_emails"),
+            tool_call("3", "get_stores"),
+        ]
+
+        results = await self.client._execute_tool_calls(adapter, tool_calls)
+
+        assert [r["tool_call_id"] for r in results] == ["1", "2", "3"]
+        assert adapter.call_log == [
+            ("start", "get_stores"), ("end", "get_stores"),
+            ("start", "create_appointment"), ("end", "create_appointment"),
+            ("start", "send_appointment_emails"), ("end", "send_appointment_emails"),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_invalid_arguments_do_not_abort_round(self):
+        """参数解析失败只影响对应工具"""
+        adapter = FakeAdapter()
+        tool_calls = [tool_call("1", "get_stores", "{bad json"), tool_call("2", "get_stores")]
+
+        results = await self.client._execute_tool_calls(adapter, tool_calls)
+
+        assert results[0]["success"] is False
+        assert results[1]["success"] is True
+
+    @pytest.mark.asyncio
+    async def test_reply_reports_tool_latencies(self):
+        """最终回复中包含每个工具的耗时"""
+        adapter = FakeAdapter(responses=[
+            AIResponse(content="", model="fake-model", provider="openai",
+                       tool_calls=[tool_call("1", "get_stores")]),
+            AIResponse(content="我们有两家门店", model="fake-model", provider="openai"),
+        ])
+        self.client.adapters = {AIProvider.OPENAI: adapter}
+
+        response = await self.client.generate_customer_service_reply("有哪些门店？", conversation_history=[])
+
+        assert response.content == "我们有两家门店"
+        assert len(response.tool_latencies) == 1
+        assert response.tool_latencies[0]["name"] == "get_stores"
+        assert response.tool_latencies[0]["latency_ms"] >= 0
+
+
+class TestToolCallingLoop:
+    """测试多轮工具调用循环"""
+
+    def setup_method(self):
+        self.client = AIClient()
+
+    @pytest.mark.asyncio
+    async def test_booking_chain_completes_in_one_turn(self):
+        """创建预约后继续发送邮件，一次客户消息内完成"""
+        adapter = FakeAdapter(responses=[
+            tool_response(tool_call("1", "create_appointment")),
+            tool_response(tool_call("2", "send_appointment_emails")),
+            text_response("预约成功，已发送通知"),
+        ])
+        self.client.adapters = {AIProvider.OPENAI: adapter}
+
+        response = await self.client.generate_customer_service_reply("确认预约", conversation_history=HISTORY)
+
+        assert response.content == "预约成功，已发送通知"
+        assert [c["function"]["name"] for c in response.tool_calls] == ["create_appointment", "send_appointment_emails"]
+        assert [t["round"] for t in response.tool_latencies] == [1, 2]
+
+        # 后续请求使用原生的assistant/tool消息，并保留工具配置
+        last_request = adapter.requests[-1]
+        roles = [m.role for m in last_request.messages[-4:]]
+        assert roles == [MessageRole.ASSISTANT, MessageRole.TOOL, MessageRole.ASSISTANT, MessageRole.TOOL]
+        assert last_request.tools
+        payload = last_request.to_openai_format()["messages"]
+        assert payload[-2]["tool_calls"][0]["id"] == "2"
+        assert payload[-1]["tool_call_id"] == "2"
+
+    @pytest.mark.asyncio
+    async def test_loop_stops_at_max_rounds(self):
+        """达到最大轮数后不再执行工具，直接生成最终回复"""
+        self.client.config.tool_execution.max_rounds = 1
+        adapter = FakeAdapter(responses=[
+            tool_response(tool_call("1", "get_stores")),
+            tool_response(tool_call("2", "get_stores")),
+            text_response("我们有两家门店"),
+        ])
+        self.client.adapters = {AIProvider.OPENAI: adapter}
+
+        response = await self.client.generate_customer_service_reply("有哪些门店？", conversation_history=HISTORY)
+
+        assert response.content == "我们有两家门店"
+        assert adapter.call_log.count(("start", "get_stores")) == 1
+        assert adapter.requests[-1].tools is None
+
+    @pytest.mark.asyncio
+    async def test_loop_stops_at_deadline(self):
+        """超过总时限后直接生成最终回复"""
+        self.client.config.tool_execution.loop_deadline = 0
+        adapter = FakeAdapter(responses=[
+            tool_response(tool_call("1", "get_stores")),
+            text_response("请稍后再试"),
+        ])
+        self.client.adapters = {AIProvider.OPENAI: adapter}
+
+        response = await self.client.generate_customer_service_reply("有哪些门店？", conversation_history=HISTORY)
+
+        assert response.content == "请稍后再试"
+        assert adapter.call_log == []
+
+    @pytest.mark.asyncio
+    async def test_fallback_continues_with_executed_tool_results(self):
+        """工具执行后首选提供商失败：备用提供商带着工具结果继续，不重复创建预约"""
+        booking = tool_call("1", "create_appointment", '{"phone": "138", "time": "15:00"}')
+        primary = FakeAdapter(responses=[tool_response(booking), Exception("provider down")])
+        backup = FakeAdapter(provider=AIProvider.DEEPSEEK, responses=[
+            tool_response(tool_call("2", "create_appointment", '{"time": "15:00", "phone": "138"}')),
+            tool_response(tool_call("3", "send_appointment_emails")),
+            text_response("预约成功，已发送通知"),
+        ])
+        self.client.adapters = {AIProvider.OPENAI: primary, AIProvider.DEEPSEEK: backup}
+
+        response = await self.client.generate_customer_service_reply("确认预约", conversation_history=HISTORY)
+
+        assert response.content == "预约成功，已发送通知"
+        assert primary.call_log == [("start", "create_appointment"), ("end", "create_appointment")]
+        # 备用提供商的第一个请求包含已执行的工具结果，重复的预约没有再次执行，后续工具照常执行
+        assert backup.requests[0].messages[-1].tool_call_id == "1"
+        assert backup.call_log == [("start", "send_appointment_emails"), ("end", "send_appointment_emails")]
+        assert "未重复执行" in backup.requests[1].messages[-1].content
+        assert [c["id"] for c in response.tool_calls] == ["1", "2", "3"]
+
+
+def test_tool_message_format():
+    """tool消息与assistant工具调用消息的OpenAI格式"""
+    request = AIRequest(messages=[
+        AIMessage(role=MessageRole.ASSISTANT, content="", tool_calls=[tool_call("1", "get_stores")]),
+        AIMessage(role=MessageRole.TOOL, content="{}", tool_call_id="1"),
+    ])
+
+    messages = request.to_openai_format()["messages"]
+
+    assert messages[0] == {"role": "assistant", "content": "", "tool_calls": [tool_call("1", "get_stores")]}
+    assert messages[1] == {"role": "tool", "content": "{}", "tool_call_id": "1"}